@@ -1,8 +1,21 @@
 #UNTESTED!
 #from medgen.db.dataset import SQLData
 
+import logging
+
 from .sqldata import SQLData
 
+log = logging.getLogger('pubtatordb.clinvardb')
+
+# max number of HGVS strings per "in (...)" lookup.
+HGVS_CHUNK_SIZE = 500
+
+
+def _pmid(value):
+    value = ('%s' % value).strip()
+    return int(value) if value.isdigit() else value
+
+
 class ClinVarAminoDB(SQLData):
 
     def __init__(self, *args, **kwargs):
@@ -42,3 +55,71 @@ class ClinVarAminoDB(SQLData):
 
         return self._fetchall_or_raise_exception(sql, comp, *args)
 
+    def hgvs_citations(self, hgvs_texts):
+        """ Batched citation lookup for HGVS strings, against ClinVar's own HGVS strings
+        (clinvar_hgvs joined with var_citations) and the LVG-expanded strings in t2g_hgvs_components.
+        Costs two queries per HGVS_CHUNK_SIZE strings.
+
+        Citations are handled as in medgen's ClinvarPubmeds: PubMed ids are returned as ints,
+        GeneReviews book ids (NBKxxxx) are passed through as strings, and PubMedCentral ids are
+        converted to PMIDs (one NCBI lookup per distinct PMCID; unconvertible ones are discarded).
+
+        Strings match case-insensitively (as in MySQL's default collation).
+
+        :param hgvs_texts: iterable of hgvs_text strings
+        :return: dictionary of hgvs_text -> set of PMIDs and NBK ids (every supplied hgvs_text is a key)
+        """
+        results = dict(('%s' % hgvs_text, set()) for hgvs_text in hgvs_texts)
+        by_lower = {}
+        for hgvs_text in results:
+            by_lower.setdefault(hgvs_text.lower(), []).append(hgvs_text)
+
+        pmcids = {}
+        lowered = list(by_lower.keys())
+        for idx in range(0, len(lowered), HGVS_CHUNK_SIZE):
+            chunk = [by_lower[key][0] for key in lowered[idx:idx + HGVS_CHUNK_SIZE]]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            rows = list(self.fetchall('select distinct H.HGVS, C.citation_source, C.citation_id as PMID '
+                                      'from clinvar.clinvar_hgvs H, clinvar.var_citations C '
+                                      'where H.VariationID = C.VariationID and H.HGVS in (' + placeholders + ')',
+                                      *chunk))
+            rows.extend(self.fetchall('select distinct HGVS, "PubMed" as citation_source, PMID '
+                                      'from clinvar.t2g_hgvs_components '
+                                      'where PMID is not NULL and HGVS in (' + placeholders + ')', *chunk))
+            for row in rows:
+                pmid = self._citation_pmid(row['citation_source'], row['PMID'], pmcids)
+                if pmid is None:
+                    continue
+                for hgvs_text in by_lower.get(('%s' % row['HGVS']).lower(), []):
+                    results[hgvs_text].add(pmid)
+        return results
+
+    @staticmethod
+    def _citation_pmid(citation_source, citation_id, pmcids):
+        """ Returns the PMID (or NBK id) to report for one var_citations row, or None to skip it.
+
+        :param citation_source: var_citations.citation_source (e.g. "PubMed", "PubMedCentral", "NCBIBookShelf")
+        :param citation_id: var_citations.citation_id
+        :param pmcids: dictionary of PMCID -> PMID already converted during this lookup
+        :return: int PMID, NBK id string, or None
+        """
+        from metapub.text_mining import is_pmcid, is_ncbi_bookID
+        from metapub.pubmedcentral import get_pmid_for_otherid
+
+        some_id = ('%s' % citation_id).strip()
+        if is_ncbi_bookID(some_id):
+            return some_id
+        if is_pmcid(some_id):
+            if some_id not in pmcids:
+                try:
+                    pmcids[some_id] = get_pmid_for_otherid(some_id)
+                except Exception as error:
+                    log.debug('error converting PMCID %s: %r', some_id, error)
+                    pmcids[some_id] = None
+                if pmcids[some_id] is None:
+                    log.debug('PMID not found for PMCID %s; discarding.', some_id)
+            pmid = pmcids[some_id]
+            return None if pmid is None else _pmid(pmid)
+        if citation_source == 'PubMed':
+            return _pmid(some_id)
+        return None
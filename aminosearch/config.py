@@ -3,6 +3,15 @@ DATABASE = { 'host': 'localhost', 'user': 'medgen', 'pass': 'medgen', 'name': 'P
 
 SQLDEBUG = True
 
+# MySQL connection pool settings (see sqldata.ConnectionPool); one pool per (host, db, user).
+POOL_SIZE = 20                      # max connections per pool
+POOL_TIMEOUT = 30                   # seconds to wait for a free connection before giving up
+POOL_HEALTH_CHECK_INTERVAL = 30     # connections idle longer than this (seconds) are pinged on checkout
+
+# directory of a PubTator posting index (see postings.py, sbin/08_build_pubtator_index.py); when set,
+# PubtatorDB searches are answered from the memory-mapped index instead of MySQL.
+PUBTATOR_INDEX_DIR = None
+
 import logging
 
 log = logging.getLogger('pubtatordb')
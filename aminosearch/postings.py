@@ -0,0 +1,282 @@
+""" In-memory posting-list index over gene2pubtator and the m2p_* tables, so that PubtatorDB searches
+don't have to join gene2pubtator against m2p_<EditType> in MySQL on every lookup.
+
+The index is built offline (see build_posting_index and sbin/08_build_pubtator_index.py) into a
+directory of numpy arrays, which are memory-mapped read-only when loaded; processes using the same
+index directory (e.g. gunicorn workers) share its pages through the OS page cache.
+
+Index directory layout:
+
+    meta.json               format, tables (name -> columns), seqtype and edittype codes, counts
+    gene_ids.npy            uint32, sorted GeneIDs
+    gene_offsets.npy        int64, gene i owns gene_pmids[gene_offsets[i]:gene_offsets[i+1]]
+    gene_pmids.npy          uint32, sorted PMIDs per gene
+    comp_hashes.npy         uint64, sorted hashes of component keys (Ref, Pos)
+    comp_offsets.npy        int64, component i owns mentions comp_offsets[i]:comp_offsets[i+1]
+    mention_pmids.npy       uint32, PMID of each mention (sorted within a component)
+    mention_seqtypes.npy    uint8, SeqType code of each mention
+    mention_edittypes.npy   uint8, EditType code of each mention
+    mention_alts.npy        uint64, hash of each mention's Alt
+    mention_offsets.npy     int64, mention i is mentions.bin[mention_offsets[i]:mention_offsets[i+1]]
+    mentions.bin            the m2p_general row of each mention, as JSON
+
+Lookups find the mentions of (Ref, Pos) by binary search, filter them on EditType, SeqType and
+Alt, then keep those whose PMID is in the gene's posting list.  Values are compared the way the
+MySQL tables' utf8_unicode_ci collation compares them: case-insensitively, ignoring trailing spaces.
+
+Requires numpy.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import struct
+import hashlib
+import logging
+from array import array
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .exceptions import PubtatorDBError
+
+log = logging.getLogger('pubtatordb.postings')
+
+INDEX_FORMAT = 1
+
+ARRAY_NAMES = ('gene_ids', 'gene_offsets', 'gene_pmids', 'comp_hashes', 'comp_offsets', 'mention_pmids',
+               'mention_seqtypes', 'mention_edittypes', 'mention_alts', 'mention_offsets')
+
+# table searched when a protein has no edittype; holds the rows of every m2p_<EditType> table.
+GENERAL_TABLE = 'm2p_general'
+
+
+def _normalize(value):
+    return ('%s' % ('' if value is None else value)).rstrip().lower()
+
+
+def key_hash(*values):
+    """ Returns 64-bit hash of the (collation-normalized) values, as stored in the index. """
+    digest = hashlib.md5('\x1f'.join(_normalize(value) for value in values).encode('utf-8')).digest()
+    return struct.unpack('>Q', digest[:8])[0]
+
+
+def _split_gene_ids(value):
+    """ gene2pubtator GeneID values may list several genes (e.g. "1234;5678"). """
+    for item in ('%s' % value).replace(',', ';').split(';'):
+        item = item.strip()
+        if item.isdigit():
+            yield int(item)
+
+
+def _require_numpy():
+    if numpy is None:
+        raise PubtatorDBError('The PubTator posting index requires numpy, which is not installed.')
+
+
+def build_posting_index(index_dir, gene_pmid_pairs, mention_rows, tables):
+    """ Builds a posting index in index_dir.
+
+    :param index_dir: (str) directory to write the index to (created if necessary)
+    :param gene_pmid_pairs: iterable of (GeneID, PMID) from gene2pubtator
+    :param mention_rows: iterable of row dictionaries from m2p_general
+    :param tables: dictionary of m2p tablename -> list of its columns (used to shape search results)
+    :return: dictionary of index metadata
+    """
+    _require_numpy()
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    # gene -> sorted PMID postings
+    genes = array(str('I'))
+    pmids = array(str('I'))
+    for gene_id, pmid in gene_pmid_pairs:
+        if pmid is None:
+            continue
+        for gid in _split_gene_ids(gene_id):
+            genes.append(gid)
+            pmids.append(int(pmid))
+    genes = numpy.frombuffer(genes, dtype=numpy.uint32) if len(genes) else numpy.zeros(0, numpy.uint32)
+    pmids = numpy.frombuffer(pmids, dtype=numpy.uint32) if len(pmids) else numpy.zeros(0, numpy.uint32)
+    pairs = numpy.unique(genes.astype(numpy.uint64) << numpy.uint64(32) | pmids.astype(numpy.uint64))
+    pair_genes = (pairs >> numpy.uint64(32)).astype(numpy.uint32)
+    gene_ids, gene_starts = numpy.unique(pair_genes, return_index=True)
+    gene_offsets = numpy.append(gene_starts, len(pairs)).astype(numpy.int64)
+    gene_pmids = (pairs & numpy.uint64(0xffffffff)).astype(numpy.uint32)
+
+    # (Ref, Pos) -> mentions, sorted by PMID
+    seqtypes = {}
+    edittypes = {}
+    mentions = []
+    for row in mention_rows:
+        if row.get('PMID') is None:
+            continue
+        seqtype = seqtypes.setdefault(_normalize(row.get('SeqType')), len(seqtypes))
+        edittype = edittypes.setdefault(_normalize(row.get('EditType')), len(edittypes))
+        mentions.append((key_hash(row.get('Ref'), row.get('Pos')), int(row['PMID']), seqtype, edittype,
+                         key_hash(row.get('Alt')), json.dumps(row).encode('utf-8')))
+    if len(seqtypes) > 255 or len(edittypes) > 255:
+        raise PubtatorDBError('Too many distinct SeqType/EditType values to index.')
+    mentions.sort(key=lambda mention: (mention[0], mention[1]))
+
+    mention_hashes = numpy.array([mention[0] for mention in mentions], dtype=numpy.uint64)
+    comp_hashes, comp_starts = numpy.unique(mention_hashes, return_index=True)
+    comp_offsets = numpy.append(comp_starts, len(mentions)).astype(numpy.int64)
+
+    mention_offsets = numpy.zeros(len(mentions) + 1, dtype=numpy.int64)
+    with open(os.path.join(index_dir, 'mentions.bin'), 'wb') as fh:
+        for idx, mention in enumerate(mentions):
+            fh.write(mention[5])
+            mention_offsets[idx + 1] = mention_offsets[idx] + len(mention[5])
+
+    arrays = {'gene_ids': gene_ids.astype(numpy.uint32),
+              'gene_offsets': gene_offsets,
+              'gene_pmids': gene_pmids,
+              'comp_hashes': comp_hashes,
+              'comp_offsets': comp_offsets,
+              'mention_pmids': numpy.array([mention[1] for mention in mentions], dtype=numpy.uint32),
+              'mention_seqtypes': numpy.array([mention[2] for mention in mentions], dtype=numpy.uint8),
+              'mention_edittypes': numpy.array([mention[3] for mention in mentions], dtype=numpy.uint8),
+              'mention_alts': numpy.array([mention[4] for mention in mentions], dtype=numpy.uint64),
+              'mention_offsets': mention_offsets,
+              }
+    for name in ARRAY_NAMES:
+        numpy.save(os.path.join(index_dir, name + '.npy'), arrays[name])
+
+    meta = {'format': INDEX_FORMAT,
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'tables': tables,
+            'seqtypes': seqtypes,
+            'edittypes': edittypes,
+            'genes': len(gene_ids),
+            'gene_pmids': len(gene_pmids),
+            'components': len(comp_hashes),
+            'mentions': len(mentions),
+            }
+    # written last: an index directory without meta.json is incomplete.
+    with open(meta_path, 'w') as fh:
+        fh.write(json.dumps(meta, indent=2))
+    log.info('Built PubTator posting index in %s: %i genes, %i components, %i mentions', index_dir,
+             meta['genes'], meta['components'], meta['mentions'])
+    return meta
+
+
+class PostingIndex(object):
+    """ Read-only, memory-mapped posting index (see module docstring); arrays are mapped on first use. """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._arrays = None
+        self.meta = None
+
+    def _load(self):
+        _require_numpy()
+        meta_path = os.path.join(self.index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise PubtatorDBError('No complete PubTator posting index in %s' % self.index_dir)
+        with open(meta_path) as fh:
+            meta = json.loads(fh.read())
+        if meta.get('format') != INDEX_FORMAT:
+            raise PubtatorDBError('PubTator posting index in %s has format %s (expected %s); rebuild it.' % (
+                                  self.index_dir, meta.get('format'), INDEX_FORMAT))
+
+        arrays = dict((name, numpy.load(os.path.join(self.index_dir, name + '.npy'), mmap_mode='r'))
+                      for name in ARRAY_NAMES)
+        arrays['mentions'] = numpy.memmap(os.path.join(self.index_dir, 'mentions.bin'), dtype=numpy.uint8,
+                                          mode='r') if meta['mentions'] else numpy.zeros(0, numpy.uint8)
+        self.meta = meta
+        self._arrays = arrays
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._load()
+        return self._arrays
+
+    def has_table(self, tablename):
+        if self._arrays is None:
+            self._load()
+        return tablename in self.meta['tables']
+
+    def gene_pmids(self, gene_id):
+        """ Returns sorted array of PMIDs mentioning gene_id (empty if gene_id is unknown). """
+        arrays = self.arrays
+        gene_ids = arrays['gene_ids']
+        idx = int(numpy.searchsorted(gene_ids, int(gene_id)))
+        if idx >= len(gene_ids) or int(gene_ids[idx]) != int(gene_id):
+            return gene_ids[:0]
+        return arrays['gene_pmids'][arrays['gene_offsets'][idx]:arrays['gene_offsets'][idx + 1]]
+
+    def _mention_range(self, ref, pos):
+        arrays = self.arrays
+        hashes = arrays['comp_hashes']
+        target = numpy.uint64(key_hash(ref, pos))
+        idx = int(numpy.searchsorted(hashes, target))
+        if idx >= len(hashes) or hashes[idx] != target:
+            return 0, 0
+        return int(arrays['comp_offsets'][idx]), int(arrays['comp_offsets'][idx + 1])
+
+    def _mention_row(self, idx):
+        arrays = self.arrays
+        start, end = arrays['mention_offsets'][idx], arrays['mention_offsets'][idx + 1]
+        return json.loads(bytes(arrays['mentions'][start:end]).decode('utf-8'))
+
+    def search(self, tablename, ref, pos, alt=None, seqtype=None, gene_id=None):
+        """ Equivalent of "select distinct M.* from [gene2pubtator G,] <tablename> M where
+        [G.PMID = M.PMID and G.GeneID=<gene_id> and] Ref=<ref> and Pos=<pos> [and Alt=<alt>]
+        [and SeqType=<seqtype>]".
+
+        :param tablename: m2p table to search (e.g. "m2p_SUB", "m2p_general")
+        :param alt, seqtype, gene_id: optional further constraints (None: unconstrained)
+        :return: list of row dictionaries
+        :raises: PubtatorDBError if tablename is not in the index
+        """
+        arrays = self.arrays
+        if tablename not in self.meta['tables']:
+            raise PubtatorDBError('Table %s is not in the PubTator posting index' % tablename)
+
+        start, end = self._mention_range(ref, pos)
+        if start == end:
+            return []
+
+        mask = numpy.ones(end - start, dtype=bool)
+        if tablename != GENERAL_TABLE:
+            code = self.meta['edittypes'].get(_normalize(tablename[len('m2p_'):]), None)
+            if code is None:
+                return []
+            mask &= arrays['mention_edittypes'][start:end] == code
+        if seqtype is not None:
+            code = self.meta['seqtypes'].get(_normalize(seqtype), None)
+            if code is None:
+                return []
+            mask &= arrays['mention_seqtypes'][start:end] == code
+        if alt is not None:
+            mask &= arrays['mention_alts'][start:end] == numpy.uint64(key_hash(alt))
+
+        candidates = numpy.nonzero(mask)[0] + start
+        if gene_id is not None and len(candidates):
+            postings = self.gene_pmids(gene_id)
+            pmids = arrays['mention_pmids'][candidates]
+            found = numpy.searchsorted(postings, pmids)
+            found[found >= len(postings)] = 0
+            candidates = candidates[postings[found] == pmids] if len(postings) else candidates[:0]
+
+        # rows are stored as m2p_general rows; shape them like rows of tablename, and "select distinct".
+        columns = self.meta['tables'][tablename]
+        rows = []
+        seen = set()
+        for idx in candidates:
+            row = self._mention_row(int(idx))
+            row = dict((column, row.get(column, None)) for column in columns)
+            key = tuple(row[column] for column in columns)
+            if key not in seen:
+                seen.add(key)
+                rows.append(row)
+        return rows
@@ -1,12 +1,79 @@
 from __future__ import absolute_import, unicode_literals
 
+from collections import OrderedDict
+
 from MySQLdb import ProgrammingError
 
 #from medgen.db.dataset import SQLData 
 from .sqldata import SQLData
 from .exceptions import PubtatorDBError
+from .postings import PostingIndex
+from .config import PUBTATOR_INDEX_DIR
+
+# max number of component tuples resolved per query.
+SEARCH_CHUNK_SIZE = 200
+
+# gene-keyed copies of the m2p_* tables (see sbin/09_create_g2m_tables.py): g2m_SUB for m2p_SUB, etc.
+G2M_PREFIX = 'g2m_'
+
+
+def _match_key(*values):
+    return tuple(('%s' % value).lower() for value in values)
+
 
 class PubtatorDB(SQLData):
+    """ Searches the PubTator m2p_* tables for VariantComponents.
+
+    If a posting index is available (keyword index_dir, or PUBTATOR_INDEX_DIR in aminosearch.config),
+    searches are answered from it instead of by gene2pubtator joins in MySQL.  Otherwise, searches
+    with a gene_id use the gene-keyed g2m_<EditType> table of an m2p table where one exists.
+    """
+
+    def __init__(self, *args, **kwargs):
+        index_dir = kwargs.pop('index_dir', None) or PUBTATOR_INDEX_DIR
+        self.index = PostingIndex(index_dir) if index_dir else None
+        self._g2m_tables = None     # g2m tablename -> columns (None until looked up)
+        super(PubtatorDB, self).__init__(*args, **kwargs)
+
+    def _g2m_columns(self, m2p_tablename):
+        """ Returns the result columns of the g2m table standing in for m2p_tablename, or None if there
+        is no such table.  (Available g2m tables are looked up once per instance.)
+        """
+        if self._g2m_tables is None:
+            tables = {}
+            for row in self.fetchall('show tables like "g2m\\_%"'):
+                tablename = list(row.values())[0]
+                if not tablename.endswith('_tmp'):
+                    tables[tablename] = None
+            self._g2m_tables = tables
+
+        g2m_tablename = G2M_PREFIX + m2p_tablename[len('m2p_'):]
+        if g2m_tablename not in self._g2m_tables:
+            return None
+        if self._g2m_tables[g2m_tablename] is None:
+            self._g2m_tables[g2m_tablename] = [col['Field'] for col in self.fetchall('show columns from ' + g2m_tablename)
+                                               if col['Field'] not in ('GeneID', 'RowID')]
+        return self._g2m_tables[g2m_tablename]
+
+    def _search_g2m(self, m2p_tablename, comp, gene_id, alt=None, seqtype=None):
+        """ Same results as the gene2pubtator join on m2p_tablename, as one range scan of the g2m table's
+        primary key (GeneID, Pos, Ref, Alt, SeqType).
+        """
+        columns = self._g2m_columns(m2p_tablename)
+        sql = 'select distinct '+', '.join(columns)+' from '+G2M_PREFIX+m2p_tablename[len('m2p_'):]+' where GeneID=%s and Pos=%s and Ref=%s'
+        args = [gene_id, comp.pos, comp.ref]
+        if alt is not None:
+            sql += ' and Alt=%s'
+            args.append(alt)
+        if seqtype is not None:
+            sql += ' and SeqType=%s'
+            args.append(seqtype)
+        return self._fetchall_or_raise_pubtatordberror(sql, comp, *args)
+
+    def _search_index(self, tablename, comp, gene_id, alt=None, seqtype=None):
+        if not self.index.has_table(tablename):
+            raise PubtatorDBError('EditType %s currently not handled. (no %s table in index)' % (comp.edittype, tablename))
+        return self.index.search(tablename, comp.ref, comp.pos, alt=alt, seqtype=seqtype, gene_id=gene_id or None)
 
     def _fetchall_or_raise_pubtatordberror(self, sql, comp, *args):
         try:
@@ -16,6 +83,11 @@ class PubtatorDB(SQLData):
             raise PubtatorDBError('EditType %s currently not handled. (%r)' % (comp.edittype, error))
 
     def search_FS(self, comp, gene_id, strict=False):
+        if self.index:
+            return self._search_index('m2p_FS', comp, gene_id, alt=comp.alt, seqtype=None if gene_id else comp.seqtype)
+        if gene_id and self._g2m_columns('m2p_FS'):
+            return self._search_g2m('m2p_FS', comp, gene_id, alt=comp.alt)
+
         if gene_id:
             sql = 'select distinct M.* from gene2pubtator G, m2p_FS M where G.PMID = M.PMID and G.GeneID=%s and Ref="%s" and Alt="%s" and Pos=%s'
             args = (gene_id, comp.ref, comp.alt, comp.pos)
@@ -27,6 +99,12 @@ class PubtatorDB(SQLData):
 
     def search_m2p(self, comp, gene_id, strict=False):
         # sql = "select distinct M.* from gene2pubtator G, m2p_{comp.edittype} M where G.PMID = M.PMID and G.GeneID = {gene_id} and Pos={comp.pos} and Ref = '{comp.ref}' and Alt = '{comp.alt}' and SeqType='{comp.seqtype}'".format(comp=comp, gene_id=gene_id)
+        if self.index:
+            return self._search_index('m2p_'+comp.edittype, comp, gene_id, alt=comp.alt,
+                                      seqtype=None if gene_id else comp.seqtype)
+        if gene_id and self._g2m_columns('m2p_'+comp.edittype):
+            return self._search_g2m('m2p_'+comp.edittype, comp, gene_id, alt=comp.alt)
+
         if gene_id:
             sql = 'select distinct M.* from gene2pubtator G, m2p_'+comp.edittype+' M where G.PMID = M.PMID and G.GeneID=%s and Ref="%s" and Alt="%s" and Pos=%s'
             args = (gene_id, comp.ref, comp.alt, comp.pos)
@@ -42,6 +120,11 @@ class PubtatorDB(SQLData):
         else:
             tablename = 'm2p_%s' % comp.edittype
 
+        if self.index:
+            return self._search_index(tablename, comp, gene_id, alt=comp.alt if strict else None, seqtype='p')
+        if gene_id and self._g2m_columns(tablename):
+            return self._search_g2m(tablename, comp, gene_id, alt=comp.alt if strict else None, seqtype='p')
+
         if gene_id:
             sql = 'select distinct M.* from gene2pubtator G, '+tablename+' M where G.PMID = M.PMID and G.GeneID=%s and Pos="%s" and SeqType="p" and Ref="%s"'
             args = (gene_id, comp.pos, comp.ref)
@@ -55,3 +138,119 @@ class PubtatorDB(SQLData):
 
         return self._fetchall_or_raise_pubtatordberror(sql, comp, *args)
 
+
+    def search_components(self, components, gene_id, strict=False):
+        """ Batched version of search_m2p and search_proteins: resolves many VariantComponents at once,
+        issuing a single query per m2p_<EditType> table (m2p_general for proteins without an edittype)
+        instead of one query per component.
+
+        Components match exactly as they would in search_m2p (Ref, Pos, Alt) and search_proteins
+        (SeqType "p", Pos and Ref; plus Alt if strict).
+
+        Returns a tuple (results, errors):
+
+            results: { key: [ <dictionaries representing matching rows from pubtator> ] }
+            errors:  { key: PubtatorDBError }     (e.g. for edittypes without an m2p table)
+
+        :param components: dictionary of key (e.g. hgvs_text) -> VariantComponents object
+        :param gene_id: id of gene associated with the variants
+        :param strict: (bool) whether proteins must also match on Alt [default: False]
+        :return: (results, errors)
+        """
+        if self.index:
+            # index lookups take microseconds each; no need to batch them.
+            results = OrderedDict()
+            errors = {}
+            for key, comp in components.items():
+                try:
+                    if comp.seqtype == 'p':
+                        results[key] = self.search_proteins(comp, gene_id, strict)
+                    else:
+                        results[key] = self.search_m2p(comp, gene_id, strict)
+                except PubtatorDBError as error:
+                    errors[key] = error
+            return results, errors
+
+        groups = OrderedDict()      # (tablename, is_protein) -> OrderedDict(match key -> [keys])
+        for key, comp in components.items():
+            is_protein = comp.seqtype == 'p'
+            if is_protein and not comp.edittype:
+                tablename = 'm2p_general'
+            else:
+                tablename = 'm2p_%s' % comp.edittype
+            groups.setdefault((tablename, is_protein), OrderedDict()).setdefault(
+                self._component_match_key(comp, is_protein, strict, gene_id), []).append(key)
+
+        results = OrderedDict((key, []) for key in components)
+        errors = {}
+        for (tablename, is_protein), matches in groups.items():
+            match_keys = list(matches.keys())
+            for idx in range(0, len(match_keys), SEARCH_CHUNK_SIZE):
+                chunk = match_keys[idx:idx + SEARCH_CHUNK_SIZE]
+                sql, args = self._components_query(tablename, is_protein, strict, gene_id,
+                                                   [matches[match_key][0] for match_key in chunk], components)
+                try:
+                    rows = self.fetchall(sql, *args)
+                except ProgrammingError as error:
+                    comp = components[matches[chunk[0]][0]]
+                    for match_key in chunk:
+                        for key in matches[match_key]:
+                            errors[key] = PubtatorDBError('EditType %s currently not handled. (%r)' %
+                                                          (comp.edittype, error))
+                    continue
+
+                for row in rows:
+                    row_key = self._row_match_key(row, is_protein, strict, gene_id)
+                    for key in matches.get(row_key, []):
+                        results[key].append(row)
+
+        for key in errors:
+            results.pop(key, None)
+        return results, errors
+
+    @staticmethod
+    def _component_match_key(comp, is_protein, strict, gene_id):
+        if is_protein:
+            return _match_key(comp.pos, comp.ref, comp.alt if strict else '')
+        return _match_key(comp.ref, comp.alt, comp.pos, '' if gene_id else comp.seqtype)
+
+    @staticmethod
+    def _row_match_key(row, is_protein, strict, gene_id):
+        if is_protein:
+            return _match_key(row['Pos'], row['Ref'], row['Alt'] if strict else '')
+        return _match_key(row['Ref'], row['Alt'], row['Pos'], '' if gene_id else row['SeqType'])
+
+    def _components_query(self, tablename, is_protein, strict, gene_id, keys, components):
+        """ Builds one query matching every component named in keys. """
+        clauses = []
+        args = []
+        for key in keys:
+            comp = components[key]
+            if is_protein:
+                clause = 'M.Pos=%s and M.Ref=%s'
+                args.extend([comp.pos, comp.ref])
+                if strict:
+                    clause += ' and M.Alt=%s'
+                    args.append(comp.alt)
+            else:
+                clause = 'M.Ref=%s and M.Alt=%s and M.Pos=%s'
+                args.extend([comp.ref, comp.alt, comp.pos])
+                if not gene_id:
+                    clause += ' and M.SeqType=%s'
+                    args.append(comp.seqtype)
+            clauses.append('(%s)' % clause)
+
+        where = ' or '.join(clauses)
+        if is_protein:
+            where = 'M.SeqType="p" and (%s)' % where
+
+        if gene_id and self._g2m_columns(tablename):
+            columns = ', '.join('M.' + column for column in self._g2m_columns(tablename))
+            sql = 'select distinct '+columns+' from '+G2M_PREFIX+tablename[len('m2p_'):]+' M where M.GeneID=%s and ('+where+')'
+            args.insert(0, gene_id)
+        elif gene_id:
+            sql = 'select distinct M.* from gene2pubtator G, '+tablename+' M where G.PMID = M.PMID and G.GeneID=%s and ('+where+')'
+            args.insert(0, gene_id)
+        else:
+            sql = 'select distinct M.* from '+tablename+' M where '+where
+        return sql, args
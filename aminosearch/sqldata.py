@@ -1,10 +1,16 @@
+import os
+import re
+import time
 import logging
+import threading
+from contextlib import contextmanager
 
 from pyrfc3339 import parse
 import MySQLdb
 import MySQLdb.cursors as cursors
 
 from .config import DATABASE, SQLDEBUG, get_data_log
+from .config import POOL_SIZE, POOL_TIMEOUT, POOL_HEALTH_CHECK_INTERVAL
 
 log = get_data_log('sqldata.log')
 if SQLDEBUG:
@@ -20,6 +26,18 @@ DEFAULT_NAME = DATABASE['name']
 
 SQLDATE_FMT = '%Y-%m-%d %H:%M:%S'
 
+# MySQL client errors after which a connection is useless: "server has gone away", "lost connection".
+RECONNECT_ERRORS = (2006, 2013)
+
+# statements that can safely be re-run on a fresh connection (see SQLData.cursor).
+READ_ONLY_SQL = re.compile(r'^\s*(select|show|describe|desc|explain)\b', re.IGNORECASE)
+SESSION_SQL = re.compile(r'\b(get_lock|for\s+update|lock\s+in\s+share\s+mode)\b', re.IGNORECASE)
+
+
+def is_read_only(sql):
+    """ Whether sql only reads, and leaves nothing behind on its connection (e.g. no GET_LOCK). """
+    return bool(READ_ONLY_SQL.match(sql)) and not SESSION_SQL.search(sql)
+
 def EscapeString(value):
     "Ensures value doesn't contain SQL-breaking characters."
     value = value.replace('"', '\"')
@@ -33,9 +51,250 @@ def SQLdatetime(pydatetime_or_string):
         dtobj = parse(pydatetime_or_string)
     return dtobj.strftime(SQLDATE_FMT)
 
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """ Process-wide pool of MySQL connections to one (host, db, user).
+
+    Each thread checks out its own connection (kept until release() or discard() is called from that
+    thread), so SQLData instances can be shared between threads safely.  SQLData gives it back after
+    every statement that leaves no session state behind (see release_if_idle), and web requests end
+    with finish_thread().  Connections held by threads that have since died are reclaimed when the
+    pool runs out.
+
+    Connections that have been idle for more than health_check_interval seconds are checked with a
+    protocol-level ping on checkout and replaced if dead.
+
+    After a fork (e.g. gunicorn workers, multiprocessing), the child starts with an empty pool; the
+    parent's connections are left alone so as not to close sockets the parent is still using.
+
+    The pool also keeps track of whether the current thread's connection carries state a fresh one
+    wouldn't have -- uncommitted writes (mark_dirty / mark_clean), open transactions and advisory locks
+    (hold_session / drop_session) -- so that SQLData knows when a statement must not be retried elsewhere.
+    """
+
+    def __init__(self, host, db, user, passwd, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL):
+        self.host = host
+        self.db = db
+        self.user = user
+        self._passwd = passwd
+
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._abandoned = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()     # conn, holds, dirty
+        self._idle = []         # list of (conn, last_used)
+        self._owners = {}       # thread ident -> (thread, conn)
+        self._created = 0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # keep references so the parent's sockets are never closed from this process.
+                    self._abandoned.extend(conn for conn, _ in self._idle)
+                    self._abandoned.extend(conn for _, conn in self._owners.values())
+                    self._reset()
+
+    def _connect(self):
+        return MySQLdb.connect(passwd=self._passwd,
+                               user=self.user,
+                               db=self.db,
+                               host=self.host,
+                               cursorclass=cursors.DictCursor,
+                               charset='utf8',
+                               use_unicode=True,
+                              )
+
+    def _reclaim_dead_threads(self):
+        """ Forgets connections held by threads that no longer exist. (Call with lock held.) """
+        dead = [ident for ident, (thread, _) in self._owners.items() if not thread.is_alive()]
+        for ident in dead:
+            _, conn = self._owners.pop(ident)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._created -= 1
+        return len(dead)
+
+    def _healthy(self, conn):
+        try:
+            conn.ping()
+            return True
+        except MySQLdb.Error as error:
+            log.info('Discarding dead connection to %s/%s: %r', self.host, self.db, error)
+            return False
+
+    def checkout(self):
+        """ Returns the connection held by the current thread, checking one out of the pool if needed.
+
+        :return: MySQLdb connection
+        :raises: PoolExhausted if no connection becomes free within `timeout` seconds
+        """
+        self._check_pid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        thread = threading.current_thread()
+        deadline = time.time() + self.timeout
+        last_used = None
+        with self._lock:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                if self._reclaim_dead_threads():
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolExhausted('No free connection to %s/%s after %i seconds (pool size %i)'
+                                        % (self.host, self.db, self.timeout, self.size))
+                self._lock.wait(remaining)
+
+        try:
+            if conn is not None and time.time() - last_used > self.health_check_interval:
+                if not self._healthy(conn):
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._owners[thread.ident] = (thread, conn)
+        self._local.conn = conn
+        self._clear_state()
+        return conn
+
+    def _clear_state(self):
+        self._local.holds = 0
+        self._local.dirty = False
+
+    def hold_session(self):
+        """ Marks the current thread's connection as holding a transaction or advisory lock. (Nestable.) """
+        self.checkout()
+        self._local.holds = getattr(self._local, 'holds', 0) + 1
+
+    def drop_session(self):
+        self._local.holds = max(0, getattr(self._local, 'holds', 0) - 1)
+
+    def mark_dirty(self):
+        """ Marks the current thread's connection as having uncommitted writes. """
+        self._local.dirty = True
+
+    def mark_clean(self):
+        self._local.dirty = False
+
+    def has_session_state(self):
+        """ Whether the current thread's connection holds anything that would be lost with it. """
+        return getattr(self._local, 'holds', 0) > 0 or getattr(self._local, 'dirty', False)
+
+    def release_if_idle(self):
+        """ Returns the current thread's connection to the pool unless it holds session state. """
+        if not self.has_session_state():
+            self.release()
+
+    def finish(self):
+        """ Ends the current thread's use of the pool (e.g. at the end of a web request): its connection
+        is released, or discarded if it still holds session state (so that a leaked transaction or
+        advisory lock dies with it rather than being handed to the next thread).
+        """
+        if self.has_session_state():
+            log.warning('Discarding connection to %s/%s left with an open transaction or lock',
+                        self.host, self.db)
+            self.discard()
+        else:
+            self.release()
+
+    def release(self):
+        """ Returns the current thread's connection (if any) to the pool. """
+        self._check_pid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        self._clear_state()
+        with self._lock:
+            self._owners.pop(threading.current_thread().ident, None)
+            self._idle.append((conn, time.time()))
+            self._lock.notify()
+
+    def discard(self):
+        """ Closes and forgets the current thread's connection (e.g. after "server has gone away"). """
+        self._check_pid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        self._clear_state()
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._owners.pop(threading.current_thread().ident, None)
+            self._created -= 1
+            self._lock.notify()
+
+    def stats(self):
+        with self._lock:
+            return {'host': self.host, 'db': self.db, 'user': self.user, 'size': self.size,
+                    'open': self._created, 'idle': len(self._idle), 'checked_out': len(self._owners)}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, db, user, passwd):
+    """ Returns the process-wide ConnectionPool for (host, db, user), creating it if needed. """
+    key = (host, db, user)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(host, db, user, passwd)
+        return _pools[key]
+
+
+def finish_thread():
+    """ Calls finish() on every connection pool for the current thread (e.g. as a Flask teardown). """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.finish()
+
+
+def pool_stats():
+    """ Returns list of stats for all connection pools in this process. """
+    with _pools_lock:
+        return [pool.stats() for pool in _pools.values()]
+
+
 class SQLData(object):
     """
     MySQL base class for config, select, insert, update, and delete in MySQL databases.
+
+    Connections come from a process-wide ConnectionPool shared by all SQLData instances with
+    the same (host, db, user); each thread uses its own connection, and returns it to the pool as
+    soon as a statement (fetchall, execute) or transaction is done, unless it still holds a
+    transaction or advisory lock.
     """
     def __init__(self, *args, **kwargs):
         self._db_host = kwargs.get('host', None) or DEFAULT_HOST
@@ -43,38 +302,107 @@ class SQLData(object):
         self._db_pass = kwargs.get('pass', None) or DEFAULT_PASS
         self._db_name = kwargs.get('name', None) or DEFAULT_NAME
 
-        self.conn = None
+    @property
+    def pool(self):
+        return get_pool(self._db_host, self._db_name, self._db_user, self._db_pass)
+
+    @property
+    def conn(self):
+        """ Connection checked out by the current thread. """
+        return self.pool.checkout()
 
     def connect(self):
-        self.conn = MySQLdb.connect(passwd=self._db_pass,
-                                    user=self._db_user,
-                                    db=self._db_name,
-                                    host=self._db_host,
-                                    cursorclass=cursors.DictCursor,
-                                    charset='utf8',
-                                    use_unicode=True,
-                                   )
-        return self.conn
+        return self.pool.checkout()
+
+    def release(self):
+        """ Returns the current thread's connection to the pool (e.g. when a worker thread is done). """
+        self.pool.release()
 
     def cursor(self, execute_sql=None, *args):
         """Returns cursor for MySQL execution, optionally preloaded with execute_sql.
 
         Also remember: having multiple cursors open can result in unwanted things happening...
 
+        If the connection turns out to be dead ("server has gone away", "lost connection"), it is
+        discarded, and execute_sql is retried once on a fresh connection -- but only if it is a read-only
+        statement (see is_read_only) and the dead connection held no uncommitted writes, transaction or
+        advisory lock (see ConnectionPool.has_session_state).  Otherwise the error is raised: the
+        statement may already have run on the server, and what it depended on is gone.
+
         :returns: MySQLdb cursor object (DictCursor)
         """
-        if not self.conn:
-            self.connect()
         cursor = self.conn.cursor(cursors.DictCursor)
 
         if execute_sql is not None:
-            if args:
-                cursor.execute(execute_sql, args)
-            else:
-                cursor.execute(execute_sql)
+            read_only = is_read_only(execute_sql)
+            retryable = read_only and not self.pool.has_session_state()
+            if not READ_ONLY_SQL.match(execute_sql):
+                # (advisory locks taken by a select are tracked with hold_session instead.)
+                self.pool.mark_dirty()
+            try:
+                self._execute_on(cursor, execute_sql, args)
+            except MySQLdb.OperationalError as error:
+                if error.args[0] not in RECONNECT_ERRORS:
+                    raise
+                self.pool.discard()
+                if not retryable:
+                    log.error('Lost connection to %s/%s (%r); not retrying: %s', self._db_host, self._db_name,
+                              error, execute_sql[:200])
+                    raise
+                log.info('Reconnecting to %s/%s after error: %r', self._db_host, self._db_name, error)
+                cursor = self.conn.cursor(cursors.DictCursor)
+                self._execute_on(cursor, execute_sql, args)
 
         return cursor
 
+    def commit(self):
+        self.conn.commit()
+        self.pool.mark_clean()
+
+    def rollback(self):
+        self.conn.rollback()
+        self.pool.mark_clean()
+
+    def _abort(self):
+        """ Rolls back the current thread's uncommitted writes after a failed statement, so that its
+        connection doesn't stay marked dirty; discards the connection if even that fails.
+        """
+        try:
+            self.rollback()
+        except MySQLdb.Error as error:
+            log.info('Rollback on %s/%s failed (%r); discarding connection', self._db_host, self._db_name, error)
+            self.pool.discard()
+
+    @contextmanager
+    def transaction(self):
+        """ Yields a cursor whose statements are committed together when the block ends, or rolled back
+        if it raises.  Statements in the block are never retried on another connection (see cursor).
+        """
+        conn = self.conn
+        self.pool.hold_session()
+        cursor = conn.cursor(cursors.DictCursor)
+        try:
+            yield cursor
+            conn.commit()
+        except Exception as error:
+            if isinstance(error, MySQLdb.OperationalError) and error.args[0] in RECONNECT_ERRORS:
+                self.pool.discard()
+            else:
+                self._abort()
+            raise
+        finally:
+            cursor.close()
+            self.pool.drop_session()
+            self.pool.mark_clean()
+            self.pool.release_if_idle()
+
+    @staticmethod
+    def _execute_on(cursor, execute_sql, args):
+        if args:
+            cursor.execute(execute_sql, args)
+        else:
+            cursor.execute(execute_sql)
+
     def fetchall(self, select_sql, *args):
         """ For submitted select_sql with interpolation strings meant to match
         with supplied *args, build and execute the statement and fetch all results.
@@ -88,9 +416,12 @@ class SQLData(object):
         :returns: results as list of dictionaries
         :rtype: list
         """
-        cursor = self.cursor(select_sql, *args)
-        stuff = cursor.fetchall()
-        cursor.close() 
+        try:
+            cursor = self.cursor(select_sql, *args)
+            stuff = cursor.fetchall()
+            cursor.close()
+        finally:
+            self.pool.release_if_idle()
         return stuff
 
     def fetchrow(self, select_sql, *args):
@@ -155,41 +486,63 @@ class SQLData(object):
             values.append(val)
         return fields, values
 
+    @staticmethod
+    def _insert_sql(tablename, new_data):
+        """ Composes parameterized multi-row insert statement for new_data (list of dicts with identical keys).
+
+        :return: (sql, args)
+        """
+        fields = list(new_data[0].keys())
+        row_params = '(%s)' % ','.join(['%s'] * len(fields))
+        sql = 'insert into %s (%s) values %s' % (tablename, ','.join(fields), ','.join([row_params] * len(new_data)))
+        return sql, [row[field] for row in new_data for field in fields]
+
     def batch_insert(self, tablename, new_data):
         """ Insert new_data (list of dicts with identical schemas) into 
-        indicated tablename.  
+        indicated tablename, in one statement, and commit.
 
         Note: supplied data dictionaries MUST have identical data structure.
 
-        WARNING: this is *really* not SQL-injection-safe, so don't wrap 
+        WARNING: tablename and field names are not escaped, so don't wrap
                 end-user interfaces around this method, OK?
 
         :param tablename: name of table to receive new rows
         :param new_data: list of field:value dictionaries
+        :return: number of rows inserted
+        :raises: MySQLdb.Error (nothing is inserted)
         """
-        # suss out the schema of the dictionaries.
-        fields = new_data[0].keys()
-
-        # store each set of values in a list
-        all_values = []
-
-        for field_value_dict in new_data:
-            _, values = self._get_fields_and_values(field_value_dict, quote_values=True)
-            all_values.append('(%s)' % ','.join(values))
-
-        sql = 'insert into '+tablename+' (%s) values %s' % (','.join(fields), ','.join(all_values))
-        try:
-            cursor = self.cursor(sql)
-        except Exception as error:
-            print(sql)
-            print(error)
-            from IPython import embed; embed()
-            return False
-
-        if cursor.lastrowid:
-            print('Batch Insert Done. Last insert id =', cursor.lastrowid)
-            return True
-
+        sql, args = self._insert_sql(tablename, new_data)
+        with self.transaction() as cursor:
+            cursor.execute(sql, args)
+            inserted = cursor.rowcount
+        log.debug('Batch insert of %i rows into %s done.', inserted, tablename)
+        return inserted
+
+    def replace_rows(self, tablename, key_column, rows_by_key, chunk_size=500):
+        """ Replaces all rows of tablename whose key_column matches a key of rows_by_key with the rows
+        listed for that key, in one transaction.
+
+        :param tablename: name of table
+        :param key_column: name of column holding the keys
+        :param rows_by_key: dictionary of key -> list of field:value dictionaries (all with the same fields)
+        :param chunk_size: (int) number of keys per delete, rows per insert [default: 500]
+        :return: number of rows inserted
+        :raises: MySQLdb.Error (nothing is replaced)
+        """
+        keys = list(rows_by_key.keys())
+        rows = [row for key in keys for row in rows_by_key[key]]
+
+        inserted = 0
+        with self.transaction() as cursor:
+            for idx in range(0, len(keys), chunk_size):
+                chunk = keys[idx:idx + chunk_size]
+                cursor.execute('delete from %s where %s in (%s)' % (tablename, key_column,
+                               ','.join(['%s'] * len(chunk))), chunk)
+            for idx in range(0, len(rows), chunk_size):
+                sql, args = self._insert_sql(tablename, rows[idx:idx + chunk_size])
+                cursor.execute(sql, args)
+                inserted += cursor.rowcount
+        return inserted
 
     def insert(self, tablename, field_value_dict, None_as_null=False):
         """ Insert field_value_dict into indicated tablename.
@@ -226,21 +579,23 @@ class SQLData(object):
         """
         log.debug('SQL.execute ' + sql, *args)
 
-        #try:
-        cursor = self.cursor(sql, *args)
-        log.debug('SQL.execute ' + sql % args)
-        cursor.close()
-        self.conn.commit()
-        return cursor
-        #except Exception as err:
-        #    log.info('Medgen SQL ERROR: %r' % err)
-        #    full_sql = sql % args
-        #    log.info('Tripped on a piece of SQL: ' + full_sql)
-        #log.debug('#######')
+        try:
+            cursor = self.cursor(sql, *args)
+            log.debug('SQL.execute ' + sql % args)
+            cursor.close()
+            self.commit()
+            return cursor
+        except Exception:
+            # don't leave the failed write pending on the connection (or the connection marked dirty).
+            if self.pool.has_session_state():
+                self._abort()
+            raise
+        finally:
+            self.pool.release_if_idle()
 
     def ping(self):
         """
-        Same effect as calling 'mysql> call mem'
+        Same effect as calling 'mysql> call mem'  (for a cheap liveness check, see ConnectionPool)
         :returns::self.schema_info(()
         """
         try:
@@ -6,6 +6,12 @@ from text2gene.googlequery import GoogleCachedQuery
 
 try:
     reset = sys.argv[1].lower()
+    if reset == 'upgrade':
+        # bring tables created by older versions of text2gene up to the current schema.
+        for cached in (VariantLVGCached(), ClinvarCachedQuery(), PubtatorCachedQuery(), GoogleCachedQuery()):
+            cached.upgrade_table()
+        VariantLVGCached().create_equivalence_indexes()
+        sys.exit()
     if reset == 'reset':
         reset = True
     else:
@@ -1,9 +1,10 @@
 from __future__ import absolute_import, print_function
 
-from metavariant import Variant, VariantComponents
 from metavariant.exceptions import RejectedSeqVar, CriticalHgvsError
 from medgen.db.clinvar import ClinVarDB
 
+from text2gene.variant_memo import Variant, Components
+
 from aminosearch.sqldata import SQLData
 from aminosearch.config import get_process_log
 
@@ -32,7 +33,7 @@ def write_db_error(msg, err_obj):
 
 def components_or_None(hgvs_p):
     try:
-        comp = VariantComponents(Variant(hgvs_p))
+        comp = Components(Variant(hgvs_p))
         if comp.ref != '':
             return comp
     except (TypeError, RejectedSeqVar, CriticalHgvsError):
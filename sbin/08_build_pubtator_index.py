@@ -0,0 +1,69 @@
+""" Build the in-memory PubTator posting index (see aminosearch/postings.py) from gene2pubtator and
+the m2p_* tables.  Point PUBTATOR_INDEX_DIR (aminosearch/config.py) at the result to have PubtatorDB
+answer searches from it.
+
+Rebuild the index whenever the m2p_* tables are regenerated (07_create_m2p_components_tables.py).
+
+Usage:
+    08_build_pubtator_index.py <index_dir> [--fetch-rows=<n>]
+
+Options:
+    --fetch-rows=<n>    rows fetched from MySQL at a time [default: 100000]
+"""
+
+from __future__ import absolute_import, print_function
+
+import time
+
+from docopt import docopt
+import MySQLdb.cursors as cursors
+
+from aminosearch.sqldata import SQLData
+from aminosearch.postings import build_posting_index, GENERAL_TABLE
+
+
+def stream(db, sql, fetch_rows, cursorclass=cursors.SSCursor):
+    """ Yields rows of sql without buffering the whole result set client-side. """
+    cursor = db.conn.cursor(cursorclass)
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(fetch_rows)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
+
+
+def m2p_tables(db):
+    """ Returns dictionary of m2p tablename -> list of columns. """
+    tables = {}
+    for row in db.fetchall('show tables like "m2p\\_%"'):
+        tablename = list(row.values())[0]
+        tables[tablename] = [col['Field'] for col in db.fetchall('show columns from ' + tablename)]
+    return tables
+
+
+def main():
+    args = docopt(__doc__)
+    fetch_rows = int(args['--fetch-rows'])
+
+    db = SQLData()
+    start = time.time()
+
+    tables = m2p_tables(db)
+    print('@@@ m2p tables: %s' % ', '.join(sorted(tables)))
+
+    meta = build_posting_index(args['<index_dir>'],
+                               stream(db, 'select GeneID, PMID from gene2pubtator', fetch_rows),
+                               stream(db, 'select * from ' + GENERAL_TABLE, fetch_rows, cursors.SSDictCursor),
+                               tables)
+
+    print('@@@ Indexed %i genes (%i gene-PMID postings), %i components, %i mentions in %.1fs' % (
+          meta['genes'], meta['gene_pmids'], meta['components'], meta['mentions'], time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+""" Materialize gene-keyed component tables g2m_<EditType> (and g2m_general) from gene2pubtator and
+the m2p_* tables made by 07_create_m2p_components_tables.py.
+
+Each g2m table holds the rows of its m2p table with the GeneID of every gene mentioned in the same
+article, clustered on (GeneID, Pos, Ref, Alt, SeqType): the predicates PubtatorDB.search_m2p and
+search_proteins issue when given a gene.  A lookup is then one range scan of the primary key, which
+carries the whole row, instead of a join through gene2pubtator.
+
+PubtatorDB uses a g2m table whenever it exists, so rerun this after regenerating the m2p tables.
+
+Usage:
+    09_create_g2m_tables.py [<edittype>...]
+
+Arguments:
+    <edittype>      only (re)build the g2m tables of these edit types (e.g. SUB DEL general)
+"""
+
+from __future__ import absolute_import, print_function
+
+import time
+
+from docopt import docopt
+
+from aminosearch.sqldata import SQLData
+from aminosearch.pubtatordb import G2M_PREFIX
+
+# columns every searchable m2p table has; tables without them (e.g. m2p_rs) are skipped.
+REQUIRED_COLUMNS = ('PMID', 'SeqType', 'Ref', 'Pos', 'Alt')
+
+# Ref, Pos, Alt stay varchar(255) like the m2p tables (INS/INDEL sequences can be long); SeqType
+# (c, g, n, p, ...) is narrowed so the clustered key stays within InnoDB's 3072-byte limit.
+CREATE_TABLE_TMPL = '''CREATE TABLE {tablename} (
+  RowID int(10) unsigned NOT NULL AUTO_INCREMENT,
+  GeneID int(10) unsigned NOT NULL,
+  PMID int(10) unsigned DEFAULT NULL,
+  Components varchar(200) COLLATE utf8_unicode_ci DEFAULT NULL,
+  Mentions text COLLATE utf8_unicode_ci NOT NULL,
+  SeqType varchar(16) NOT NULL DEFAULT '',
+  EditType varchar(255) default NULL,
+  Ref varchar(255) NOT NULL DEFAULT '',
+  Pos varchar(255) NOT NULL DEFAULT '',
+  Alt varchar(255) NOT NULL DEFAULT '',{extra_columns}
+  PRIMARY KEY (GeneID, Pos, Ref, Alt, SeqType, RowID),
+  KEY (RowID)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci'''
+
+# columns found only in some m2p tables (m2p_FS, m2p_DUP, m2p_general).
+EXTRA_COLUMNS = ('DupX', 'FS_Pos', 'RS')
+
+
+def m2p_tables(db):
+    """ Returns dictionary of m2p tablename -> list of columns, for tables that can be searched. """
+    tables = {}
+    for row in db.fetchall('show tables like "m2p\\_%"'):
+        tablename = list(row.values())[0]
+        columns = [col['Field'] for col in db.fetchall('show columns from ' + tablename)]
+        if all(column in columns for column in REQUIRED_COLUMNS):
+            tables[tablename] = columns
+    return tables
+
+
+def create_g2m_table(db, m2p_tablename, columns):
+    """ Builds g2m table for m2p_tablename under a temporary name, then swaps it in.
+
+    :return: number of rows in new table
+    """
+    g2m_tablename = G2M_PREFIX + m2p_tablename[len('m2p_'):]
+    tmp_tablename = g2m_tablename + '_tmp'
+
+    extra = [column for column in EXTRA_COLUMNS if column in columns]
+    db.drop_table(tmp_tablename)
+    db.execute(CREATE_TABLE_TMPL.format(tablename=tmp_tablename, extra_columns=''.join(
+               '\n  %s varchar(255) default NULL,' % column for column in extra)))
+
+    # CAST matches the numeric comparison of "G.GeneID=<gene_id>" in the gene2pubtator join.
+    copied = ['PMID', 'Components', 'Mentions', 'EditType'] + extra
+    db.execute('insert into {tmp} (GeneID, SeqType, Ref, Pos, Alt, {copied}) '
+               'select distinct CAST(G.GeneID AS UNSIGNED), coalesce(M.SeqType, ""), coalesce(M.Ref, ""), '
+               'coalesce(M.Pos, ""), coalesce(M.Alt, ""), {m_copied} '
+               'from gene2pubtator G, {m2p} M where G.PMID = M.PMID'.format(
+               tmp=tmp_tablename, m2p=m2p_tablename, copied=', '.join(copied),
+               m_copied=', '.join('M.' + column for column in copied)))
+
+    db.drop_table(g2m_tablename)
+    db.execute('rename table {tmp} to {g2m}'.format(tmp=tmp_tablename, g2m=g2m_tablename))
+    return db.fetchrow('select count(*) as count from ' + g2m_tablename)['count']
+
+
+def main():
+    args = docopt(__doc__)
+    only = set('m2p_' + edittype for edittype in args['<edittype>'])
+
+    db = SQLData()
+    db.ping()
+
+    for m2p_tablename, columns in sorted(m2p_tables(db).items()):
+        if only and m2p_tablename not in only:
+            continue
+        start = time.time()
+        print('@@@ Materializing %s...' % m2p_tablename)
+        count = create_g2m_table(db, m2p_tablename, columns)
+        print('@@@ %s%s: %i rows (%.1fs)' % (G2M_PREFIX, m2p_tablename[len('m2p_'):], count, time.time() - start))
+
+    print('@@@ DONE')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+""" Export or import cache table snapshots (see text2gene/snapshot.py).
+
+Usage:
+    cache_snapshot.py export <servicename> <path> [--min-version=<v>] [--max-version=<v>] [--since=<date>] [--until=<date>] [--chunk-rows=<n>] [--restart]
+    cache_snapshot.py import <servicename> <path> [--min-version=<v>] [--max-version=<v>] [--since=<date>] [--until=<date>] [--overwrite] [--restart]
+
+Arguments:
+    <servicename>       hgvslvg, clinvar_hgvs2pmid, pubtator_hgvs2pmid, or google_query
+
+Options:
+    --min-version=<v>   only entries with version >= v
+    --max-version=<v>   only entries with version <= v
+    --since=<date>      only entries created on or after date (YYYY-MM-DD)
+    --until=<date>      only entries created before date (YYYY-MM-DD)
+    --chunk-rows=<n>    rows per snapshot chunk [default: 1000]
+    --overwrite         replace entries already present in the target table
+    --restart           start over instead of resuming an interrupted export/import
+"""
+
+from __future__ import print_function
+
+import sys
+from datetime import datetime
+
+from docopt import docopt
+
+from text2gene.cached import ClinvarCachedQuery, PubtatorCachedQuery
+from text2gene.lvg_cached import VariantLVGCached
+from text2gene.googlequery import GoogleCachedQuery
+from text2gene.snapshot import export_snapshot, import_snapshot
+
+CACHES = {'hgvslvg': VariantLVGCached,
+          'clinvar_hgvs2pmid': ClinvarCachedQuery,
+          'pubtator_hgvs2pmid': PubtatorCachedQuery,
+          'google_query': GoogleCachedQuery,
+          }
+
+
+def parse_filters(args):
+    filters = {}
+    for option, name in (('--min-version', 'min_version'), ('--max-version', 'max_version')):
+        if args[option] is not None:
+            filters[name] = int(args[option])
+    for option, name in (('--since', 'since'), ('--until', 'until')):
+        if args[option] is not None:
+            filters[name] = datetime.strptime(args[option], '%Y-%m-%d')
+    return filters
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+
+    try:
+        cached = CACHES[args['<servicename>']]()
+    except KeyError:
+        print('Unknown servicename %s (choose from %s)' % (args['<servicename>'], ', '.join(sorted(CACHES))))
+        sys.exit(1)
+
+    filters = parse_filters(args)
+    if args['export']:
+        total = export_snapshot(cached, args['<path>'], chunk_rows=int(args['--chunk-rows']),
+                                resume=not args['--restart'], **filters)
+        print('[%s] %i rows exported to %s' % (cached.tablename, total, args['<path>']))
+    else:
+        total = import_snapshot(cached, args['<path>'], overwrite=args['--overwrite'],
+                                resume=not args['--restart'], **filters)
+        print('[%s] %i rows loaded from %s' % (cached.tablename, total, args['<path>']))
@@ -0,0 +1,22 @@
+""" Applies each cache service's TTL and size budget (ttl, max_rows, max_bytes, eviction settings in
+the [cache] config section) to its cache table.  Meant to be run periodically, e.g. from cron:
+
+    python sbin/evict_cache.py                  # all cache tables
+    python sbin/evict_cache.py google_query     # only google_query_cache
+"""
+
+from __future__ import print_function
+
+import sys
+
+from text2gene.cached import ClinvarCachedQuery, PubtatorCachedQuery
+from text2gene.lvg_cached import VariantLVGCached
+from text2gene.googlequery import GoogleCachedQuery
+
+servicenames = sys.argv[1:]
+
+for cached in (VariantLVGCached(), ClinvarCachedQuery(), PubtatorCachedQuery(), GoogleCachedQuery()):
+    if servicenames and cached.servicename not in servicenames:
+        continue
+    print('[%s] %i entries, %i bytes' % (cached.tablename, cached.size(), cached.backend.total_bytes()))
+    print('[%s] %i entries evicted' % (cached.tablename, cached.evict()))
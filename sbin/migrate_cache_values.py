@@ -0,0 +1,14 @@
+""" Re-encodes cache entries still held in the legacy JSON cache_value column with each service's
+configured value codec (see text2gene/cache_codecs.py).  Safe to interrupt and re-run.
+"""
+
+from __future__ import print_function
+
+from text2gene.cached import ClinvarCachedQuery, PubtatorCachedQuery
+from text2gene.lvg_cached import VariantLVGCached
+from text2gene.googlequery import GoogleCachedQuery
+
+for cached in (VariantLVGCached(), ClinvarCachedQuery(), PubtatorCachedQuery(), GoogleCachedQuery()):
+    cached.upgrade_table()
+    print('[%s] migrating to codec %s...' % (cached.tablename, cached.codec.name))
+    print('[%s] %i entries migrated' % (cached.tablename, cached.migrate_values()))
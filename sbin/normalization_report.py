@@ -0,0 +1,69 @@
+""" Reports how much input normalization (text2gene.normalize) improves the hgvslvg cache hit rate for
+a file of HGVS strings (one per line, first tab-separated column), e.g. data/samples_BRCAx.tsv:
+
+    python sbin/normalization_report.py data/samples_BRCAx.tsv
+
+Prints the number of distinct cache keys before and after normalization, the inputs rejected by the
+prefilter, and how many inputs are found in the hgvslvg cache under their raw vs canonical keys.
+(Running services report the same live, as normalized_hits and hit_rate_without_normalization
+in /v1/cache_metrics.)
+"""
+
+from __future__ import print_function
+
+import sys
+
+from text2gene.lvg_cached import VariantLVGCached
+from text2gene.normalize import normalize_hgvs
+from text2gene.exceptions import InvalidHgvsInput
+
+
+def read_hgvs_file(path):
+    with open(path) as fh:
+        for line in fh:
+            hgvs_text = line.split('\t')[0].strip()
+            if hgvs_text and not hgvs_text.startswith('#'):
+                yield hgvs_text
+
+
+def cached_keys(cache, keys):
+    """ Returns set of lowercased keys present in the cache table (exact key match). """
+    keys = list(keys)
+    found = set()
+    for idx in range(0, len(keys), cache.CHUNK_SIZE):
+        for row in cache.backend.fetch_rows(keys[idx:idx + cache.CHUNK_SIZE]):
+            found.add(row['cache_key'].lower())
+    return found
+
+
+def main(path):
+    inputs = list(read_hgvs_file(path))
+    canonical = {}
+    rejected = []
+    for hgvs_text in inputs:
+        try:
+            canonical[hgvs_text] = normalize_hgvs(hgvs_text)
+        except InvalidHgvsInput:
+            rejected.append(hgvs_text)
+
+    cache = VariantLVGCached()
+    raw_found = cached_keys(cache, set(hgvs_text.strip() for hgvs_text in inputs))
+    canonical_found = cached_keys(cache, set(canonical.values()))
+
+    raw_hits = sum(1 for hgvs_text in inputs if hgvs_text.strip().lower() in raw_found)
+    canonical_hits = sum(1 for hgvs_text in inputs if canonical.get(hgvs_text, '').lower() in canonical_found)
+
+    total = float(len(inputs)) or 1.0
+    print('%i inputs in %s' % (len(inputs), path))
+    print('%i distinct raw keys, %i distinct canonical keys' % (len(set(inputs)), len(set(canonical.values()))))
+    print('%i inputs changed by normalization' % sum(1 for raw, key in canonical.items() if raw != key))
+    print('%i inputs rejected by the prefilter (never sent to hgvs/UTA)' % len(rejected))
+    print('hgvslvg cache hit rate: %.1f%% with raw keys, %.1f%% with canonical keys' % (
+          100 * raw_hits / total, 100 * canonical_hits / total))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1])
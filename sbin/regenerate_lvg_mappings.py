@@ -1,7 +1,7 @@
 
-from text2gene.lvg_cached import LVG, HgvsLVGCached
+from text2gene.lvg_cached import LVG, VariantLVGCached
 
-db = HgvsLVGCached()
+db = VariantLVGCached()
 db.execute('delete from lvg_mappings where hgvs_text is not NULL')
 all_rows = db.fetchall('select * from hgvslvg_cache order by rand()')
 
@@ -0,0 +1,133 @@
+""" Warms the text2gene caches for a list of HGVS strings (see text2gene/warmer.py).  Replaces the
+old preload_lvg.py, preload_pubtator_search_results.py and preload_metapub_cache.py scripts.
+
+Usage:
+    warm_cache.py (--sql=<query> | --tsv=<path> | --stdin) [options]
+
+Input (one HGVS string per row):
+    --sql=<query>           SQL query; HGVS strings are read from --column (or the first column)
+    --tsv=<path>            TSV file, e.g. data/samples_BRCAx.tsv (no header) or a ClinVar/Monarch
+                            export (header row; HGVS strings read from its Name / subject_label column)
+    --stdin                 read HGVS strings from standard input
+
+Options:
+    --db=<name>             database for --sql: clinvar or text2gene [default: clinvar]
+    --column=<name>         column holding the HGVS strings (header name for --tsv)
+    --stages=<list>         comma-separated stages: lvg,clinvar,pubtator,google,pubmed,findit
+                            [default: lvg,clinvar,pubtator]
+    --concurrency=<spec>    per-stage concurrency, e.g. lvg=8,clinvar=4,google=1
+    --rate=<spec>           per-stage rate limits in calls per second, e.g. google=1,pubmed=3
+    --batch-size=<n>        inputs per batch (and checkpoint) [default: 100]
+    --checkpoint=<path>     checkpoint file [default for --tsv: <path>.warm-checkpoint]
+    --restart               ignore (and overwrite) an existing checkpoint
+    --refresh               recompute entries even if already cached
+    -h, --help              show this help
+
+Examples:
+    warm_cache.py --sql="select HGVS from samples_vus" --stages=lvg,clinvar,pubtator
+    warm_cache.py --tsv=data/samples_BRCAx.tsv --stages=lvg,google,pubmed,findit --rate=google=1
+    cut -f1 variants.tsv | warm_cache.py --stdin --checkpoint=variants.checkpoint
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import logging
+
+from docopt import docopt
+
+from text2gene.warmer import CacheWarmer, STAGES
+from text2gene.exceptions import Text2GeneError
+
+# header names of the HGVS column in the TSV formats found in data/.
+TSV_HGVS_COLUMNS = ('HGVS', 'hgvs_text', 'Name', 'subject_label')
+
+
+def parse_spec(spec, cast):
+    """ Parses "stage=value,stage=value" into a dictionary. """
+    out = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        stage, _, value = item.partition('=')
+        if stage.strip() not in STAGES:
+            raise Text2GeneError('Unknown stage %s in %s' % (stage, spec))
+        out[stage.strip()] = cast(value)
+    return out
+
+
+def read_sql(query, db_name, column=None):
+    if db_name == 'clinvar':
+        from medgen.api import ClinVarDB
+        db = ClinVarDB()
+    else:
+        from text2gene.lvg_cached import LVG
+        db = LVG.__self__
+    rows = db.fetchall(query)
+    if not rows:
+        return []
+    column = column or list(rows[0].keys())[0]
+    return [row[column] for row in rows if row[column]]
+
+
+def read_tsv(path, column=None):
+    with open(path) as fh:
+        lines = [line.rstrip('\n') for line in fh if line.strip()]
+    if not lines:
+        return []
+    header = [name.strip() for name in lines[0].split('\t')]
+    idx = 0
+    if column is not None:
+        idx = header.index(column)
+        lines = lines[1:]
+    else:
+        for name in TSV_HGVS_COLUMNS:
+            if name in header:
+                idx = header.index(name)
+                lines = lines[1:]
+                break
+    return [line.split('\t')[idx].strip() for line in lines if len(line.split('\t')) > idx]
+
+
+def main():
+    args = docopt(__doc__)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    if args['--sql']:
+        source = 'sql:%s:%s' % (args['--db'], args['--sql'])
+        inputs = read_sql(args['--sql'], args['--db'], args['--column'])
+    elif args['--tsv']:
+        source = 'tsv:%s' % os.path.abspath(args['--tsv'])
+        inputs = read_tsv(args['--tsv'], args['--column'])
+    else:
+        source = 'stdin'
+        inputs = [line.strip() for line in sys.stdin if line.strip()]
+
+    checkpoint = args['--checkpoint']
+    if checkpoint is None and args['--tsv']:
+        checkpoint = args['--tsv'] + '.warm-checkpoint'
+    if checkpoint and args['--restart'] and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    warmer = CacheWarmer(stages=[stage.strip() for stage in args['--stages'].split(',')],
+                         concurrency=parse_spec(args['--concurrency'], int),
+                         rates=parse_spec(args['--rate'], float),
+                         batch_size=int(args['--batch-size']),
+                         checkpoint_path=checkpoint,
+                         skip_cached=not args['--refresh'])
+
+    print('%i inputs from %s; stages: %s' % (len(inputs), source, ', '.join(warmer.stages)))
+    summary = warmer.run(inputs, source=source, progress=print)
+    print()
+    print('Done in %.1fs: %i inputs (%i rejected as non-HGVS)' % (summary['elapsed'], summary['total'],
+                                                                  summary['rejected']))
+    for stage, stats in summary['stages'].items():
+        print('  %-9s %6i done  %6i cached  %6i errors  %8.1fs' % (stage, stats['done'], stats['cached'],
+                                                                    stats['errors'], stats['seconds']))
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -53,5 +53,11 @@ setup(
         'simplejson',  #speeds up json load/dump ops compared to std json
         'Flask-BasicAuth',
         ],
+    extras_require = {
+        # optional cache value codecs (see text2gene/cache_codecs.py)
+        'codecs': ['msgpack', 'zstandard'],
+        # memory-mapped PubTator posting index (see aminosearch/postings.py)
+        'index': ['numpy'],
+        },
     )
 
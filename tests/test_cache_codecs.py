@@ -0,0 +1,21 @@
+import unittest
+
+from text2gene.cache_codecs import ValueCodec, decode_value
+
+
+class TestValueCodec(unittest.TestCase):
+
+    def test_roundtrip(self):
+        value = {'items': [{'title': "it's a title", 'link': 'http://example.com/?a=1'}]}
+        for name in ('json', 'json+zlib'):
+            assert decode_value(ValueCodec(name).encode(value)) == value
+
+    def test_text_roundtrip(self):
+        text = '{"hgvs_text": "NM_001232.3:c.919G>C"}'
+        assert decode_value(ValueCodec('text+zlib').encode(text)) == text
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, ValueCodec, 'yaml+zlib')
+
+    def test_unknown_header(self):
+        self.assertRaises(ValueError, decode_value, b'{"legacy": "json"}')
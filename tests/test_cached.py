@@ -1,7 +1,9 @@
 
 import unittest
 
-from text2gene.lvg_cached import VariantLVGCached
+import simplejson as json
+
+from text2gene.lvg_cached import VariantLVGCached, CachedLVG
 from text2gene import LVG
 
 test_hgvs_c = 'NM_001232.3:c.919G>C'
@@ -25,3 +27,31 @@ class TestVariantLVGCached(unittest.TestCase):
         lex = LVG(test_hgvs_c)
         assert lex.hgvs_text == test_hgvs_c
 
+    def test_LVG_retrieve_many(self):
+        LVG(test_hgvs_c)
+        lvg_cache_db.delete(test_hgvs_n)
+
+        hits, misses, expired = lvg_cache_db.retrieve_many([test_hgvs_c, test_hgvs_n, test_hgvs_c])
+        assert list(hits.keys()) == [test_hgvs_c]
+        assert hits[test_hgvs_c].hgvs_text == test_hgvs_c
+        assert misses == [test_hgvs_n]
+        assert expired == []
+
+    def test_LVG_cache_hit_is_lazy(self):
+        lex = LVG(test_hgvs_c)
+        cached = lvg_cache_db.retrieve(test_hgvs_c)
+        assert isinstance(cached, CachedLVG)
+        assert cached.hgvs_c == lex.hgvs_c
+        assert cached.to_dict()['variants']['p'] == lex.hgvs_p
+        assert cached._variants is None
+
+        assert sorted(cached.variants['c'].keys()) == sorted(lex.hgvs_c)
+        assert len(cached.seqvars) == len(lex.seqvars)
+
+    def test_cached_lvg_looks_up_missing_gene_name(self):
+        lex = LVG(test_hgvs_c)
+        stored = json.loads(lex.to_json())
+        stored['gene_name'] = None
+        cached = CachedLVG.from_json(json.dumps(stored))
+        assert cached.gene_name == lex.gene_name
+        assert cached.gene_name is not None
@@ -0,0 +1,35 @@
+import unittest
+
+from text2gene.gene_metadata import GeneMetadata
+from text2gene.exceptions import GeneNotFound
+
+ROWS = [(7157, 'TP53', 'BCC7|LFS1|P53|TRP53', 'TP53'),
+        (4089, 'SMAD4', 'DPC4|JIP|MADH4|MYHRS', 'SMAD4'),
+        (9999, 'FAKE1', 'P53', ''),
+        ]
+
+
+class TestGeneMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.genes = GeneMetadata(refresh_interval=0)
+        self.genes.load_rows(ROWS)
+
+    def test_gene_id(self):
+        assert self.genes.gene_id('TP53') == 7157
+        assert self.genes.gene_id('smad4') == 4089
+        assert self.genes.gene_id(7157) == 7157
+        assert self.genes.gene_id('NOPE') is None
+        self.assertRaises(TypeError, self.genes.gene_id, None)
+
+    def test_gene_name(self):
+        assert self.genes.gene_name(4089) == 'SMAD4'
+        assert self.genes.gene_name('4089') == 'SMAD4'
+        assert self.genes.gene_name(1) is None
+
+    def test_gene_synonyms(self):
+        assert self.genes.gene_synonyms('SMAD4') == ['DPC4', 'JIP', 'MADH4', 'MYHRS', 'SMAD4']
+        # every gene known by the name contributes its symbol and synonyms.
+        assert self.genes.gene_synonyms('p53') == ['BCC7', 'FAKE1', 'LFS1', 'P53', 'TP53', 'TRP53']
+        assert self.genes.gene_synonyms(None) is None
+        self.assertRaises(GeneNotFound, self.genes.gene_synonyms, 'NOPE')
@@ -0,0 +1,53 @@
+import unittest
+
+from text2gene.lru import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2, max_bytes=1000, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_byte_budget(self):
+        cache = LRUCache(max_entries=100, max_bytes=10, ttl=60)
+        cache.put('a', 'x', size=6)
+        cache.put('b', 'y', size=6)
+        assert cache.get('a') is None
+        assert cache.stats()['bytes'] == 6
+
+        cache.put('huge', 'z', size=11)
+        assert cache.get('huge') is None
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=-1)
+        cache.put('a', 1)
+        assert cache.get('a') is None
+        assert cache.stats()['expirations'] == 1
+
+    def test_entry_ttl(self):
+        cache = LRUCache(ttl=60)
+        cache.put('short', 1, ttl=-1)
+        cache.put('long', 2, ttl=600)
+        assert cache.get('short') is None
+        assert cache.get('long') == 2
+
+    def test_copy_values(self):
+        cache = LRUCache(ttl=60, copy_values=True)
+        pmids = [1, 2]
+        cache.put('a', pmids)
+        pmids.append(3)
+        got = cache.get('a')
+        assert got == [1, 2]
+        got.append(4)
+        assert cache.get('a') == [1, 2]
+
+        shared = LRUCache(ttl=60)
+        shared.put('a', pmids)
+        assert shared.get('a') is pmids
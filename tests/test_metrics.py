@@ -0,0 +1,28 @@
+import unittest
+
+from text2gene.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_counters_and_hit_rate(self):
+        metrics = MetricsRegistry()
+        metrics.incr('svc', 'hits', 3)
+        metrics.incr('svc', 'misses')
+        snapshot = metrics.snapshot()['services']['svc']
+        assert snapshot['counters'] == {'hits': 3, 'misses': 1}
+        assert snapshot['hit_rate'] == 0.75
+
+    def test_latency_histogram(self):
+        metrics = MetricsRegistry()
+        for ms in (1, 3, 3, 40, 2000):
+            metrics.observe('svc', 'compute', ms / 1000.0)
+        latency = metrics.snapshot()['services']['svc']['latency']['compute']
+        assert latency['count'] == 5
+        assert latency['p50_ms'] == 5
+        assert latency['p99_ms'] == 2500
+        assert latency['buckets']['le_50'] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
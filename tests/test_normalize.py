@@ -0,0 +1,33 @@
+import unittest
+
+from text2gene.normalize import normalize_hgvs, hgvs_cache_key
+from text2gene.exceptions import InvalidHgvsInput
+
+
+class TestNormalizeHgvs(unittest.TestCase):
+
+    def test_trivial_variations_collapse(self):
+        canonical = 'NM_000059.3:c.8G>T'
+        for hgvs_text in [' NM_000059.3:c.8G>T ',
+                          'NM_000059.3(BRCA2):c.8G>T',
+                          'NM_000059.3(BRCA2):c.8G>T (p.Trp3Leu)',
+                          'NM_000059.3:c.8G>T (p.=)',
+                          'nm_000059.3:C.8G>T',
+                          'NM_000059.3:c.8 G > T']:
+            assert normalize_hgvs(hgvs_text) == canonical
+
+    def test_dashes(self):
+        assert normalize_hgvs('NM_000059.3:c.%s10G>C' % u'\u2013') == 'NM_000059.3:c.-10G>C'
+
+    def test_protein_variants_kept(self):
+        assert normalize_hgvs('NP_009225.1:p.Ser955Ter') == 'NP_009225.1:p.Ser955Ter'
+        assert normalize_hgvs('NP_009225.1:p.(Ser955Ter)') == 'NP_009225.1:p.(Ser955Ter)'
+
+    def test_prefilter_rejects(self):
+        for hgvs_text in ['', 'BRCA1', 'rs12345', 'NM_000059.3:x.8G>T', 'NM_000059.3:c.abc',
+                          'NM_000059.3:c.8G>T<script>']:
+            self.assertRaises(InvalidHgvsInput, normalize_hgvs, hgvs_text)
+
+    def test_cache_key_falls_back_to_input(self):
+        assert hgvs_cache_key('NM_000059.3(BRCA2):c.8G>T') == 'NM_000059.3:c.8G>T'
+        assert hgvs_cache_key(' BRCA1 ') == 'BRCA1'
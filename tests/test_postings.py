@@ -0,0 +1,117 @@
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from aminosearch.postings import build_posting_index, PostingIndex, GENERAL_TABLE
+
+M2P_COLUMNS = ['PMID', 'Components', 'Mentions', 'SeqType', 'EditType', 'Ref', 'Pos', 'Alt']
+TABLES = {GENERAL_TABLE: M2P_COLUMNS + ['DupX', 'FS_Pos', 'RS'],
+          'm2p_SUB': M2P_COLUMNS,
+          'm2p_DEL': M2P_COLUMNS}
+
+GENE2PUBTATOR = [(672, 100), (672, 101), ('672;675', 102), (675, 103), (7157, 104), (7157, None)]
+
+
+def m2p_row(pmid, seqtype, edittype, ref, pos, alt, mentions=''):
+    return {'PMID': pmid, 'Components': '%s|%s|%s|%s' % (edittype, ref, pos, alt), 'Mentions': mentions,
+            'SeqType': seqtype, 'EditType': edittype, 'Ref': ref, 'Pos': pos, 'Alt': alt,
+            'DupX': None, 'FS_Pos': None, 'RS': None}
+
+
+M2P_GENERAL = [m2p_row(100, 'c', 'SUB', 'C', '215', 'G', 'c.215C>G'),
+               m2p_row(100, 'c', 'SUB', 'C', '215', 'G', 'c.215C>G'),   # duplicate mention of the same row
+               m2p_row(101, 'c', 'SUB', 'c', '215', 'g', 'c.215c>g'),   # matches case-insensitively
+               m2p_row(102, 'c', 'SUB', 'C', '215', 'T', 'c.215C>T'),
+               m2p_row(103, 'p', 'SUB', 'R', '72', 'P', 'p.R72P'),
+               m2p_row(104, 'c', 'SUB', 'C', '215', 'G', 'c.215C>G'),
+               m2p_row(103, 'c', 'DEL', 'C', '215', None, 'c.215delC'),
+               m2p_row(None, 'c', 'SUB', 'C', '215', 'G'),              # rows without PMID are never indexed
+               ]
+
+
+def _collate(value):
+    return None if value is None else ('%s' % value).rstrip().lower()
+
+
+def sql_search(tablename, ref, pos, alt=None, seqtype=None, gene_id=None):
+    """ What "select distinct M.* from [gene2pubtator G,] <tablename> M where [G.PMID = M.PMID and
+    G.GeneID=<gene_id> and] Ref=<ref> and Pos=<pos> [and Alt=<alt>] [and SeqType=<seqtype>]" returns. """
+    gene_pmids = set(pmid for gene_ids, pmid in GENE2PUBTATOR
+                     if gene_id is not None and str(gene_id) in str(gene_ids).split(';'))
+    rows = []
+    for row in M2P_GENERAL:
+        if row['PMID'] is None:
+            continue
+        if tablename != GENERAL_TABLE and _collate(row['EditType']) != _collate(tablename[len('m2p_'):]):
+            continue
+        if _collate(row['Ref']) != _collate(ref) or _collate(row['Pos']) != _collate(pos):
+            continue
+        if alt is not None and _collate(row['Alt']) != _collate(alt):
+            continue
+        if seqtype is not None and _collate(row['SeqType']) != _collate(seqtype):
+            continue
+        if gene_id is not None and row['PMID'] not in gene_pmids:
+            continue
+        row = dict((column, row[column]) for column in TABLES[tablename])
+        if row not in rows:
+            rows.append(row)
+    return rows
+
+
+def _sorted(rows):
+    return sorted(rows, key=lambda row: sorted((key, '%s' % value) for key, value in row.items()))
+
+
+@unittest.skipIf(numpy is None, 'the posting index requires numpy')
+class TestPostingIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.meta = build_posting_index(self.index_dir, GENE2PUBTATOR, M2P_GENERAL, TABLES)
+        self.index = PostingIndex(self.index_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def assertSameRows(self, tablename, ref, pos, **kwargs):
+        expected = sql_search(tablename, ref, pos, **kwargs)
+        found = self.index.search(tablename, ref, pos, **kwargs)
+        assert len(found) == len(expected)
+        assert _sorted(found) == _sorted(expected)
+        return found
+
+    def test_build(self):
+        assert self.meta['genes'] == 3
+        assert self.meta['gene_pmids'] == 6
+        assert self.meta['mentions'] == 7
+        assert list(self.index.gene_pmids(672)) == [100, 101, 102]
+        assert list(self.index.gene_pmids(1)) == []
+        assert self.index.has_table('m2p_SUB')
+        assert not self.index.has_table('m2p_INS')
+
+    def test_search_matches_sql(self):
+        assert len(self.assertSameRows('m2p_SUB', 'C', '215', alt='G', seqtype='c')) == 3
+        assert len(self.assertSameRows('m2p_SUB', 'C', '215', alt='G', gene_id=672)) == 2
+        assert len(self.assertSameRows('m2p_SUB', 'C', '215', gene_id=675)) == 1
+        assert len(self.assertSameRows('m2p_DEL', 'C', '215', gene_id=675)) == 1
+        assert len(self.assertSameRows(GENERAL_TABLE, 'R', '72', seqtype='p')) == 1
+        assert len(self.assertSameRows(GENERAL_TABLE, 'c ', '215')) == 5
+        self.assertSameRows('m2p_SUB', 'C', '215', alt='A')
+        self.assertSameRows('m2p_SUB', 'C', '216')
+        self.assertSameRows('m2p_SUB', 'C', '215', seqtype='g')
+        self.assertSameRows('m2p_SUB', 'C', '215', gene_id=1)
+
+    def test_rows_shaped_like_table(self):
+        row = self.index.search('m2p_DEL', 'C', '215')[0]
+        assert sorted(row.keys()) == sorted(M2P_COLUMNS)
+        row = self.index.search(GENERAL_TABLE, 'C', '215', alt='T')[0]
+        assert sorted(row.keys()) == sorted(TABLES[GENERAL_TABLE])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import time
+import threading
+import unittest
+
+from text2gene.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def worker():
+            results.append(flight.do('key', compute, timeout=5))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+        assert all(value == 'value' for value, _ in results)
+        assert flight.in_flight() == 0
+
+    def test_exception_is_shared(self):
+        flight = SingleFlight()
+
+        def compute():
+            raise ValueError('boom')
+
+        self.assertRaises(ValueError, flight.do, 'key', compute)
+        # nothing is remembered once the call completes.
+        assert flight.do('key', lambda: 1) == (1, False)
+
+
+if __name__ == '__main__':
+    unittest.main()
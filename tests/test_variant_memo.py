@@ -0,0 +1,54 @@
+import unittest
+from collections import OrderedDict, namedtuple
+
+from text2gene.variant_memo import VariantMemo, dedup_components, dedup_ratio
+
+Comp = namedtuple('Comp', ['seqtype', 'edittype', 'ref', 'pos', 'alt'])
+
+HGVS_TEXT = 'NM_000546.5:c.215C>G'
+
+
+class TestVariantMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.memo = VariantMemo(max_entries=10, ttl=3600)
+
+    def test_variant_is_memoized(self):
+        seqvar = self.memo.variant(HGVS_TEXT)
+        assert '%s' % seqvar == HGVS_TEXT
+        assert self.memo.variant(' ' + HGVS_TEXT + ' ') is seqvar
+        assert self.memo.variant(seqvar) is seqvar
+        assert self.memo.variant('not hgvs at all') is None
+
+    def test_variant_parses_canonical_form(self):
+        # raw forms the hgvs parser may reject must not spoil the memo for their canonical form.
+        seqvar = self.memo.variant('NM_000059.3(BRCA2):c.8G>T (p.Trp3Leu)')
+        assert '%s' % seqvar == 'NM_000059.3:c.8G>T'
+        assert self.memo.variant('NM_000059.3:c.8G>T') is seqvar
+
+    def test_components_shared_between_text_and_seqvar(self):
+        comp = self.memo.components(HGVS_TEXT)
+        assert comp.ref == 'C'
+        assert comp.alt == 'G'
+        assert self.memo.components(self.memo.variant(HGVS_TEXT)) is comp
+
+    def test_posedits(self):
+        posedit, slang = self.memo.posedits(HGVS_TEXT)
+        assert posedit == '215C>G'
+        assert self.memo.posedits(HGVS_TEXT) == (posedit, slang)
+
+
+class TestDedupComponents(unittest.TestCase):
+
+    def test_dedup_components(self):
+        components = OrderedDict([('NM_000546.4:c.215C>G', Comp('c', 'SUB', 'C', '215', 'G')),
+                                  ('NM_000546.5:c.215C>G', Comp('c', 'SUB', 'C', '215', 'G')),
+                                  ('NM_000546.5:c.215C>T', Comp('c', 'SUB', 'C', '215', 'T')),
+                                  ('NC_000017.11:g.215C>G', Comp('g', 'SUB', 'C', '215', 'G')),
+                                  ])
+        unique, shared = dedup_components(components)
+        assert list(unique.keys()) == ['NM_000546.4:c.215C>G', 'NM_000546.5:c.215C>T', 'NC_000017.11:g.215C>G']
+        assert shared['NM_000546.4:c.215C>G'] == ['NM_000546.4:c.215C>G', 'NM_000546.5:c.215C>G']
+        assert shared['NM_000546.5:c.215C>T'] == ['NM_000546.5:c.215C>T']
+        assert dedup_ratio(len(components), len(unique)) == 0.25
+        assert dedup_ratio(0, 0) == 0.0
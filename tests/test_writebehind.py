@@ -0,0 +1,45 @@
+import unittest
+
+from text2gene.metrics import METRICS
+from text2gene.writebehind import WriteBehindQueue, METRICS_SERVICE
+
+
+class FailingDB(object):
+
+    def batch_insert(self, tablename, entries):
+        raise RuntimeError('insert into %s failed' % tablename)
+
+
+class RecordingDB(object):
+
+    def __init__(self):
+        self.replaced = []
+
+    def replace_rows(self, tablename, key_column, rows_by_key):
+        self.replaced.append((tablename, key_column, dict(rows_by_key)))
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = WriteBehindQueue(batch_size=100, flush_interval=60)
+
+    def test_failed_insert_is_counted(self):
+        failed = METRICS.counter(METRICS_SERVICE, 'failed')
+        self.queue.put_insert(FailingDB(), 'lvg_mappings', [{'hgvs_text': 'a'}, {'hgvs_text': 'b'}])
+        self.queue.flush()
+        assert METRICS.counter(METRICS_SERVICE, 'failed') == failed + 2
+        assert len(self.queue) == 0
+
+    def test_latest_replacement_wins(self):
+        db = RecordingDB()
+        self.queue.put_replace(db, 'lvg_mappings', 'hgvs_text', 'a', [{'hgvs_text': 'a', 'hgvs_c': 'old'}])
+        self.queue.put_replace(db, 'lvg_mappings', 'hgvs_text', 'b', [{'hgvs_text': 'b', 'hgvs_c': 'b'}])
+        self.queue.put_replace(db, 'lvg_mappings', 'hgvs_text', 'a', [{'hgvs_text': 'a', 'hgvs_c': 'new'}])
+        self.queue.flush()
+        assert db.replaced == [('lvg_mappings', 'hgvs_text', {'a': [{'hgvs_text': 'a', 'hgvs_c': 'new'}],
+                                                              'b': [{'hgvs_text': 'b', 'hgvs_c': 'b'}]})]
+
+
+if __name__ == '__main__':
+    unittest.main()
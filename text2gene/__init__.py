@@ -3,7 +3,7 @@ from __future__ import absolute_import, print_function, unicode_literals
 from pkgutil import extend_path
 __path__ = extend_path(__path__, __name__)
 
-from .lvg_cached import LVG
-from .cached import ClinvarHgvs2Pmid, PubtatorHgvs2Pmid
+from .lvg_cached import LVG, LVG_many
+from .cached import ClinvarHgvs2Pmid, ClinvarHgvs2Pmid_many, PubtatorHgvs2Pmid
 from .googlequery import GoogleQuery
 from .report_utils import CitationTable
@@ -3,8 +3,8 @@ from __future__ import absolute_import, print_function, unicode_literals
 from docopt import docopt
 
 from metapub import FindIt
-from medgen.api import GeneID
-from metavariant import VariantComponents, Variant
+from .gene_metadata import GeneID
+from .variant_memo import Variant, Components
 from metavariant.exceptions import RejectedSeqVar
 from hgvs.exceptions import HGVSParseError
 
@@ -12,6 +12,8 @@ from aminosearch import PubtatorDB
 
 from .cached import PubtatorHgvs2Pmid, ClinvarHgvs2Pmid
 from .api import LVG, GoogleQuery
+from .normalize import normalize_hgvs
+from .exceptions import InvalidHgvsInput
 
 
 pubtator_db = PubtatorDB()
@@ -75,12 +77,13 @@ def print_article_for_pmid(pmid):
 
 
 def hgvs_to_pmid_results_dict(hgvs_text):
+    hgvs_text = normalize_hgvs(hgvs_text)
     print()
     print('[%s]' % hgvs_text)
 
     lex = LVG(hgvs_text)
 
-    edittype = VariantComponents(lex.seqvar).edittype
+    edittype = Components(lex.seqvar).edittype
     if edittype not in ['SUB', 'DEL', 'INS', 'FS', 'INDEL']:
         print('[%s] Cannot process edit type %s; skipping' % (hgvs_text, edittype))
         return None
@@ -100,12 +103,13 @@ def hgvs_to_pmid_results_dict(hgvs_text):
 
 
 def process_hgvs_through_pubtator(hgvs_text):
+    hgvs_text = normalize_hgvs(hgvs_text)
     print()
     print('[%s]' % hgvs_text)
 
     lex = LVG(hgvs_text)
 
-    edittype = VariantComponents(lex.seqvar).edittype
+    edittype = Components(lex.seqvar).edittype
     if edittype not in ['SUB', 'DEL', 'INS', 'FS', 'INDEL']:
         print('[%s] Cannot process edit type %s; skipping' % (hgvs_text, edittype))
         return None
@@ -122,7 +126,7 @@ def process_hgvs_through_pubtator(hgvs_text):
     for seqtype in lex.variants:
         for seqvar in lex.variants[seqtype]:
             try:
-                components = VariantComponents(seqvar)
+                components = Components(seqvar)
             except RejectedSeqVar:
                 print('[%s] Rejected sequence variant: %r' % (hgvs_text, seqvar))
                 continue
@@ -157,7 +161,7 @@ def cli_pubtator_search_string():
         else:
             print('[%s] No PMIDs found.' % hgvs_text)
 
-    except HGVSParseError:
+    except (HGVSParseError, InvalidHgvsInput):
         print('[%s] Cannot parse as HGVS; skipping' % hgvs_text) 
 
 
@@ -182,7 +186,7 @@ def cli_pubtator_search_file():
                         print_article_for_pmid(pmid)
                 else:
                     print('[%s] No PMIDs found.' % hgvs_text)
-            except HGVSParseError:
+            except (HGVSParseError, InvalidHgvsInput):
                 print('[%s] Cannot parse as HGVS; skipping' % hgvs_text) 
 
 
@@ -192,7 +196,7 @@ def hgvs2pmid(hgvs_text):
         for key, pmids in results.items():
             print('[%s] %i PMIDs Found in %s: %r' % (hgvs_text, len(pmids), key, pmids))
 
-    except HGVSParseError:
+    except (HGVSParseError, InvalidHgvsInput):
         print('[%s] Cannot parse as HGVS; skipping' % hgvs_text)
 
 
@@ -214,13 +218,16 @@ def cli_hgvsfile2pmid():
                 for key, pmids in results.items():
                     print('[%s] %i PMIDs Found in %s: %r' % (hgvs_text, len(pmids), key, pmids))
 
-            except HGVSParseError:
+            except (HGVSParseError, InvalidHgvsInput):
                 print('[%s] Cannot parse as HGVS; skipping' % hgvs_text)
 
 
 def hgvs2pmid_cli():
     args = docopt(__doc__, version=__version__)
-    var = Variant(args['<hgvs>'])
+    try:
+        var = Variant(normalize_hgvs(args['<hgvs>']))
+    except InvalidHgvsInput:
+        var = None
     if var:
         hgvs2pmid(str(var))
     else:
@@ -243,7 +250,7 @@ Options:
 """
 
 def googlequery(hgvs_text):
-    lex = LVG(hgvs_text)
+    lex = LVG(normalize_hgvs(hgvs_text))
     gq = GoogleQuery(lex)
     return gq
 
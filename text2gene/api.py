@@ -2,8 +2,8 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 from metavariant import VariantLVG
 
-from .lvg_cached import LVG
-from .cached import ClinvarHgvs2Pmid, PubtatorHgvs2Pmid
+from .lvg_cached import LVG, LVG_many
+from .cached import ClinvarHgvs2Pmid, ClinvarHgvs2Pmid_many, PubtatorHgvs2Pmid
 from .googlequery import GoogleQuery
 from .report_utils import CitationTable, ClinVarInfo, GeneInfo
 
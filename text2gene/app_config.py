@@ -6,6 +6,8 @@ from configparser import NoSectionError
 from flask import Flask, render_template
 from flask_basicauth import BasicAuth
 
+from aminosearch.sqldata import finish_thread
+
 from .base_routes import base
 from .routes_v1.routes import routes_v1
 from .config import CONFIG
@@ -31,6 +33,13 @@ except NoSectionError:
 app.register_blueprint(base)
 app.register_blueprint(routes_v1)
 
+
+@app.teardown_request
+def release_db_connections(exc):
+    """ Gives the request thread's MySQL connections back to their pools (see aminosearch.sqldata). """
+    finish_thread()
+
+
 # Define existing routes and pass it to the template, to create a list.
 # 
 # app.url_map looks like this:
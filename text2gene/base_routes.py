@@ -4,12 +4,14 @@ from flask import Blueprint, render_template, redirect, request, abort
 
 from metapub import PubMedFetcher
 
-from metavariant import VariantLVG, VariantComponents
+from metavariant import VariantLVG
 from metavariant.exceptions import CriticalHgvsError, NCBIRemoteError
-from metavariant.utils import strip_gene_name_from_hgvs_text
 
 from .utils import HTTP200, get_hostname, restrict_by_ip
 from .config import ENV, CONFIG, PKGNAME
+from .normalize import normalize_hgvs
+from .variant_memo import Components
+from .exceptions import InvalidHgvsInput
 
 #from .report_utils import get_clinvar_tables_containing_variant
 from .lsdb.lovd import get_lovd_url
@@ -64,14 +66,15 @@ def amino_change_query(pos='', ref='', alt=''):
 def query(hgvs_text=''):
     """ Runs all of the relevant search queries after producing a lex object from input hgvs_text """
 
-    # Normalize all requests to a GET with hgvs_text having no gene name.
+    # Normalize all requests to a GET with hgvs_text in canonical form (see text2gene.normalize).
     if request.method == 'POST':
-        hgvs_text = strip_gene_name_from_hgvs_text(request.form.get('hgvs_text', '').strip())
-        return redirect('/query/%s' % hgvs_text, code=302)
-    else:
-        if strip_gene_name_from_hgvs_text(hgvs_text) != hgvs_text:
-            return redirect('/query/%s' % strip_gene_name_from_hgvs_text(hgvs_text), code=302)
-        hgvs_text = hgvs_text.strip()
+        hgvs_text = request.form.get('hgvs_text', '')
+    try:
+        canonical = normalize_hgvs(hgvs_text)
+    except InvalidHgvsInput as error:
+        return render_template('demo.html', error_msg='%s' % error)
+    if request.method == 'POST' or canonical != hgvs_text:
+        return redirect('/query/%s' % canonical, code=302)
 
     try:
         lex = LVG(hgvs_text)
@@ -91,7 +94,7 @@ def query(hgvs_text=''):
     citation_table = CitationTable(lex)
 
     # LOVD URL: link to search in a relevant LOVD instance, if we know of one.
-    comp = VariantComponents(lex.seqvar)
+    comp = Components(lex.seqvar)
     lovd_url = get_lovd_url(lex.gene_name, comp)
 
     return render_template('query.html', lex=lex, lovd_url=lovd_url, citation_table=citation_table,
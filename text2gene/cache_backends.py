@@ -0,0 +1,572 @@
+""" Storage backends beneath SQLCache.
+
+SQLCache takes care of cache keys, value encoding, versions and the L1 cache; a backend only has
+to store rows of (cache_key, cache_blob, date_created, version, negative) in a table and fetch them
+back by key.  (negative: 0 for ordinary values, 1 for empty results, 2 for cached failures.)
+
+Each row also carries access statistics (last_accessed, hit_count), used to pick entries to evict.
+
+(Rows written before value codecs existed hold their value as JSON in the cache_value column
+instead of cache_blob; see SQLCache.migrate_values.)
+
+Available backends (chosen per servicename via the "backend" setting in the [cache] config section):
+
+    mysql   -- cache tables in the text2gene MySQL database (default)
+    sqlite  -- cache tables in a local SQLite file in WAL mode (see "sqlite_path" setting), for laptop
+               runs and single-box batch jobs.  Pre-warmed files can be copied to workers as-is.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+import MySQLdb as mdb
+
+from aminosearch.sqldata import SQLdatetime, SQLDATE_FMT, RECONNECT_ERRORS
+
+from .config import get_cache_setting
+
+log = logging.getLogger('text2gene.cache_backends')
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.expanduser('~'), '.text2gene', 'cache.sqlite')
+
+
+class CacheBackend(object):
+    """ Interface for key-value storage of SQLCache rows.
+
+    Rows are dictionaries with keys cache_key, cache_blob, cache_value, date_created (datetime), version,
+    negative, last_accessed (datetime) and hit_count.
+    """
+
+    def __init__(self, tablename):
+        self.tablename = tablename
+
+    def fetch_row(self, key):
+        """ :return: row (dict) stored at key, or None """
+        raise NotImplementedError
+
+    def fetch_rows(self, keys):
+        """ :return: list of rows (dicts) found for supplied keys (one statement; caller chunks keys) """
+        raise NotImplementedError
+
+    def store_rows(self, rows, update_if_duplicate=True, chunk_size=100):
+        """ Writes rows in a single transaction.
+
+        :param rows: list of (cache_key, cache_blob, version, negative) tuples
+        :param update_if_duplicate: (bool) whether to overwrite existing entries (setting date_created to now)
+        :param chunk_size: (int) number of rows per multi-row insert statement
+        :return: number of affected rows reported by the database
+        """
+        raise NotImplementedError
+
+    def fetch_legacy_rows(self, limit):
+        """ :return: up to `limit` rows that still hold their value in the JSON cache_value column """
+        raise NotImplementedError
+
+    def replace_blobs(self, pairs):
+        """ Sets cache_blob (and clears cache_value) for existing rows, leaving version and date_created
+        untouched, in a single transaction.
+
+        :param pairs: list of (cache_key, cache_blob) tuples
+        """
+        raise NotImplementedError
+
+    def delete_keys(self, keys):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def total_bytes(self):
+        """ :return: total size of stored values in bytes """
+        raise NotImplementedError
+
+    def touch_keys(self, counts, chunk_size=500):
+        """ Adds hits to hit_count and sets last_accessed to now for the supplied keys.
+
+        :param counts: dictionary of cache_key -> number of hits
+        """
+        raise NotImplementedError
+
+    def keys_created_before(self, before, limit):
+        """ :return: up to `limit` keys of rows with date_created older than `before` (datetime or rfc3339 string) """
+        raise NotImplementedError
+
+    def eviction_candidates(self, policy, limit):
+        """ Returns the next `limit` rows to evict under the supplied policy:
+
+            lru -- least recently accessed first
+            lfu -- fewest hits first (least recently accessed first among equals)
+
+        :return: list of (cache_key, size in bytes) tuples
+        """
+        raise NotImplementedError
+
+    def export_rows(self, after_key, limit, min_version=None, max_version=None, since=None, until=None):
+        """ Returns up to `limit` rows ordered by cache_key, starting after `after_key` (None: from the
+        start), optionally restricted to a range of versions and of date_created (datetime or rfc3339 string).
+
+        :return: list of rows (dicts)
+        """
+        raise NotImplementedError
+
+    def load_rows(self, rows, overwrite=False, chunk_size=500):
+        """ Bulk-loads complete rows (e.g. from a snapshot) in a single transaction, keeping their
+        date_created and version.
+
+        :param rows: list of dicts with keys cache_key, cache_value, cache_blob, date_created, version, negative
+        :param overwrite: (bool) whether to replace existing entries (if not, existing entries are kept)
+        :return: number of affected rows reported by the database
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _export_where(placeholder, after_key, min_version, max_version, since, until):
+        clauses = []
+        args = []
+        for clause, arg in (('cache_key > {}', after_key),
+                            ('version >= {}', min_version),
+                            ('version <= {}', max_version),
+                            ('date_created >= {}', None if since is None else SQLdatetime(since)),
+                            ('date_created < {}', None if until is None else SQLdatetime(until))):
+            if arg is not None:
+                clauses.append(clause.format(placeholder))
+                args.append(arg)
+        return (' where ' + ' and '.join(clauses)) if clauses else '', args
+
+    LOAD_COLUMNS = ('cache_key', 'cache_value', 'cache_blob', 'date_created', 'version', 'negative')
+
+    def create_table(self, reset=False):
+        raise NotImplementedError
+
+    def drop_table(self):
+        raise NotImplementedError
+
+    def upgrade_table(self):
+        pass
+
+    def acquire_lock(self, key, timeout):
+        """ Takes a lock on key that is visible to every process sharing this storage, waiting up to
+        `timeout` seconds for it.  (Default: no cross-process locking; always succeeds.)
+
+        :return: True if lock was acquired, False if timed out
+        """
+        return True
+
+    def release_lock(self, key):
+        pass
+
+
+class MySQLCacheBackend(CacheBackend):
+    """ Stores cache rows in a MySQL table, via the connection of the supplied SQLData instance. """
+
+    def __init__(self, db, tablename):
+        self.db = db
+        super(MySQLCacheBackend, self).__init__(tablename)
+
+    def fetch_row(self, key):
+        sql = 'SELECT * from ' + self.tablename + ' where cache_key = %s limit 1'
+        return self.db.fetchrow(sql, key)
+
+    def fetch_rows(self, keys):
+        sql = 'SELECT * from ' + self.tablename + ' where cache_key in (%s)' % ','.join(['%s'] * len(keys))
+        return self.db.fetchall(sql, *keys)
+
+    def _store_sql(self, num_rows, update_if_duplicate=True):
+        """ Composes parameterized (multi-row) insert statement.
+
+        date_created is filled in by the column default on insert, and set explicitly on update.
+        """
+        values = ','.join(['(%s, %s, %s, %s)'] * num_rows)
+        if update_if_duplicate:
+            return ('insert into {db.tablename} (cache_key, cache_blob, version, negative) values {values} '
+                    'on duplicate key update cache_blob=values(cache_blob), cache_value=NULL, '
+                    'version=values(version), negative=values(negative), date_created=now()').format(db=self,
+                                                                                                  values=values)
+        return 'insert ignore into {db.tablename} (cache_key, cache_blob, version, negative) values {values}'.format(
+                    db=self, values=values)
+
+    def store_rows(self, rows, update_if_duplicate=True, chunk_size=100):
+        affected = 0
+        with self.db.transaction() as cursor:
+            for idx in range(0, len(rows), chunk_size):
+                chunk = rows[idx:idx + chunk_size]
+                args = [field for row in chunk for field in row]
+                cursor.execute(self._store_sql(len(chunk), update_if_duplicate), args)
+                affected += cursor.rowcount
+        return affected
+
+    def fetch_legacy_rows(self, limit):
+        sql = 'SELECT * from {db.tablename} where cache_blob is NULL and cache_value is not NULL limit %s'.format(db=self)
+        return self.db.fetchall(sql, limit)
+
+    def replace_blobs(self, pairs):
+        sql = 'update {db.tablename} set cache_blob=%s, cache_value=NULL where cache_key=%s'.format(db=self)
+        with self.db.transaction() as cursor:
+            cursor.executemany(sql, [(blob, key) for key, blob in pairs])
+
+    def delete_keys(self, keys):
+        sql = 'delete from {db.tablename} where cache_key in ({params})'.format(db=self,
+                                                                             params=','.join(['%s'] * len(keys)))
+        self.db.execute(sql, *keys)
+
+    def count(self):
+        return self.db.fetchrow('SELECT count(*) as cnt from {db.tablename}'.format(db=self))['cnt']
+
+    SIZE_SQL = 'coalesce(length(cache_blob), 0) + coalesce(length(cache_value), 0)'
+
+    EVICTION_ORDER = {'lru': 'last_accessed', 'lfu': 'hit_count, last_accessed'}
+
+    def total_bytes(self):
+        sql = 'SELECT sum({size}) as total from {db.tablename}'.format(db=self, size=self.SIZE_SQL)
+        return int(self.db.fetchrow(sql)['total'] or 0)
+
+    def touch_keys(self, counts, chunk_size=500):
+        # one statement per distinct hit count (mostly 1), chunked by key.
+        by_count = {}
+        for key, count in counts.items():
+            by_count.setdefault(count, []).append(key)
+
+        for count, keys in by_count.items():
+            for idx in range(0, len(keys), chunk_size):
+                chunk = keys[idx:idx + chunk_size]
+                sql = ('update {db.tablename} set hit_count = hit_count + %s, last_accessed = now() '
+                       'where cache_key in ({params})').format(db=self, params=','.join(['%s'] * len(chunk)))
+                self.db.execute(sql, count, *chunk)
+
+    def keys_created_before(self, before, limit):
+        sql = 'SELECT cache_key from {db.tablename} where date_created < %s limit %s'.format(db=self)
+        return [row['cache_key'] for row in self.db.fetchall(sql, SQLdatetime(before), limit)]
+
+    def eviction_candidates(self, policy, limit):
+        sql = 'SELECT cache_key, {size} as size from {db.tablename} order by {order} limit %s'.format(
+                    db=self, size=self.SIZE_SQL, order=self.EVICTION_ORDER[policy])
+        return [(row['cache_key'], int(row['size'])) for row in self.db.fetchall(sql, limit)]
+
+    def export_rows(self, after_key, limit, min_version=None, max_version=None, since=None, until=None):
+        where, args = self._export_where('%s', after_key, min_version, max_version, since, until)
+        sql = 'SELECT * from {db.tablename}{where} order by cache_key limit %s'.format(db=self, where=where)
+        return self.db.fetchall(sql, *(args + [limit]))
+
+    def load_rows(self, rows, overwrite=False, chunk_size=500):
+        columns = ','.join(self.LOAD_COLUMNS)
+        if overwrite:
+            tmpl = ('insert into {db.tablename} ({columns}) values {values} on duplicate key update '
+                    + ', '.join('%s=values(%s)' % (col, col) for col in self.LOAD_COLUMNS[1:]))
+        else:
+            tmpl = 'insert ignore into {db.tablename} ({columns}) values {values}'
+
+        affected = 0
+        with self.db.transaction() as cursor:
+            # rows are keyed by the primary key only, so skipping unique checks is safe and much faster.
+            cursor.execute('SET unique_checks=0')
+            try:
+                for idx in range(0, len(rows), chunk_size):
+                    chunk = rows[idx:idx + chunk_size]
+                    values = ','.join(['(%s)' % ','.join(['%s'] * len(self.LOAD_COLUMNS))] * len(chunk))
+                    args = [row[col] for row in chunk for col in self.LOAD_COLUMNS]
+                    cursor.execute(tmpl.format(db=self, columns=columns, values=values), args)
+                    affected += cursor.rowcount
+            finally:
+                cursor.execute('SET unique_checks=1')
+        return affected
+
+    def create_table(self, reset=False):
+        if reset:
+            self.db.execute("DROP TABLE IF EXISTS {}".format(self.tablename))
+
+        sql = """CREATE TABLE {} (
+                cache_key VARCHAR(255) primary key not null,
+                cache_value JSON default NULL,
+                cache_blob LONGBLOB default NULL,
+                date_created DATETIME default CURRENT_TIMESTAMP,
+                version int(11) default 0,
+                negative TINYINT default 0,
+                last_accessed DATETIME default CURRENT_TIMESTAMP,
+                hit_count int(11) default 0,
+                KEY date_created (date_created),
+                KEY last_accessed (last_accessed),
+                KEY hit_count (hit_count, last_accessed)
+              ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci""".format(self.tablename)
+
+        try:
+            self.db.execute(sql)
+            return True
+        except mdb.OperationalError as error:
+            if error.args[0] == 1050:
+                # if table already exists, we're fine.
+                return True
+
+            raise mdb.OperationalError(error.args)
+
+    def drop_table(self):
+        self.db.drop_table(self.tablename)
+
+    def _drop_triggers(self):
+        """ Removes the date_created triggers that older versions of create_table() put on this table.
+        (date_created is now handled by the column default and by the upsert itself.)
+        """
+        self.db.execute('drop trigger if exists `{db.tablename}_new_entry_date`'.format(db=self))
+        self.db.execute('drop trigger if exists `{db.tablename}_update`'.format(db=self))
+
+    def _add_column(self, definition):
+        try:
+            self.db.execute('alter table {db.tablename} add column {definition}'.format(db=self, definition=definition))
+        except mdb.OperationalError as error:
+            if error.args[0] != 1060:
+                # 1060: duplicate column name (already upgraded).
+                raise
+
+    def _lock_name(self, key):
+        # lock names are server-wide and limited to 64 characters; cache_key matching is case-insensitive.
+        return 't2g.' + hashlib.md5(('%s:%s' % (self.tablename, key.lower())).encode('utf-8')).hexdigest()
+
+    def acquire_lock(self, key, timeout):
+        """ Takes a MySQL advisory lock (GET_LOCK) on key for the current thread's connection. """
+        # held from before GET_LOCK, so that the connection is neither returned to the pool nor retried
+        # elsewhere while the lock is (or may be) held.
+        self.db.pool.hold_session()
+        locked = False
+        try:
+            row = self.db.fetchrow('SELECT GET_LOCK(%s, %s) as locked', self._lock_name(key), timeout)
+            locked = bool(row and row['locked'])
+        finally:
+            if not locked:
+                self.db.pool.drop_session()
+                self.db.pool.release_if_idle()
+        return locked
+
+    def release_lock(self, key):
+        try:
+            self.db.fetchrow('SELECT RELEASE_LOCK(%s) as released', self._lock_name(key))
+        except mdb.OperationalError as error:
+            if error.args[0] not in RECONNECT_ERRORS:
+                raise
+            # the server released the lock along with the connection.
+            log.warning('Connection lost while holding lock on %s in %s: %r', key, self.tablename, error)
+        finally:
+            self.db.pool.drop_session()
+            self.db.pool.release_if_idle()
+
+    def _add_index(self, name, columns):
+        try:
+            self.db.execute('alter table {db.tablename} add index {name} ({columns})'.format(db=self, name=name,
+                                                                                          columns=columns))
+        except mdb.OperationalError as error:
+            if error.args[0] != 1061:
+                # 1061: duplicate key name (already upgraded).
+                raise
+
+    def upgrade_table(self):
+        self._drop_triggers()
+        self.db.execute('alter table {db.tablename} modify date_created DATETIME default CURRENT_TIMESTAMP'.format(db=self))
+        self._add_column('cache_blob LONGBLOB default NULL after cache_value')
+        self._add_column('negative TINYINT default 0')
+        self._add_column('last_accessed DATETIME default CURRENT_TIMESTAMP')
+        self._add_column('hit_count int(11) default 0')
+        self._add_index('date_created', 'date_created')
+        self._add_index('last_accessed', 'last_accessed')
+        self._add_index('hit_count', 'hit_count, last_accessed')
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """ Stores cache rows in a table of a local SQLite database file, opened in WAL mode so that
+    many reader processes can share the file with a writer.
+
+    Each thread gets its own sqlite3 connection.  cache_key matching is case-insensitive, as with
+    the MySQL cache tables.
+    """
+
+    def __init__(self, path, tablename):
+        self.path = path
+        self._local = threading.local()
+        super(SQLiteCacheBackend, self).__init__(tablename)
+
+    @property
+    def conn(self):
+        # connections are per-thread, and never reused across a fork (e.g. gunicorn workers).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            # local files are created (and upgraded) on demand, so that a fresh worker can run without setup steps.
+            self.create_table()
+            self.upgrade_table()
+        return conn
+
+    @staticmethod
+    def _row_to_dict(row):
+        row = dict(row)
+        for field in ('date_created', 'last_accessed'):
+            if row.get(field, None):
+                row[field] = datetime.strptime(row[field], SQLDATE_FMT)
+        return row
+
+    def fetch_row(self, key):
+        sql = 'SELECT * from {db.tablename} where cache_key = ? limit 1'.format(db=self)
+        row = self.conn.execute(sql, (key,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def fetch_rows(self, keys):
+        sql = 'SELECT * from {db.tablename} where cache_key in ({params})'.format(db=self,
+                                                                               params=','.join(['?'] * len(keys)))
+        return [self._row_to_dict(row) for row in self.conn.execute(sql, keys).fetchall()]
+
+    def _store_sql(self, num_rows, update_if_duplicate=True):
+        # (sqlite can't add a column with a non-constant default to an existing table, so last_accessed
+        # is set explicitly.)
+        values = ','.join(["(?, ?, ?, ?, datetime('now', 'localtime'))"] * num_rows)
+        columns = '(cache_key, cache_blob, version, negative, last_accessed)'
+        if update_if_duplicate:
+            return ('insert into {db.tablename} {columns} values {values} '
+                    'on conflict(cache_key) do update set cache_blob=excluded.cache_blob, cache_value=NULL, '
+                    'version=excluded.version, negative=excluded.negative, '
+                    'date_created=datetime(\'now\', \'localtime\'), last_accessed=excluded.last_accessed'
+                    ).format(db=self, columns=columns, values=values)
+        return 'insert or ignore into {db.tablename} {columns} values {values}'.format(db=self, columns=columns,
+                                                                                    values=values)
+
+    def store_rows(self, rows, update_if_duplicate=True, chunk_size=100):
+        affected = 0
+        with self.conn:
+            for idx in range(0, len(rows), chunk_size):
+                chunk = rows[idx:idx + chunk_size]
+                args = [field for row in chunk for field in row]
+                affected += self.conn.execute(self._store_sql(len(chunk), update_if_duplicate), args).rowcount
+        return affected
+
+    def fetch_legacy_rows(self, limit):
+        sql = 'SELECT * from {db.tablename} where cache_blob is NULL and cache_value is not NULL limit ?'.format(db=self)
+        return [self._row_to_dict(row) for row in self.conn.execute(sql, (limit,)).fetchall()]
+
+    def replace_blobs(self, pairs):
+        sql = 'update {db.tablename} set cache_blob=?, cache_value=NULL where cache_key=?'.format(db=self)
+        with self.conn:
+            self.conn.executemany(sql, [(blob, key) for key, blob in pairs])
+
+    def delete_keys(self, keys):
+        sql = 'delete from {db.tablename} where cache_key in ({params})'.format(db=self,
+                                                                             params=','.join(['?'] * len(keys)))
+        with self.conn:
+            self.conn.execute(sql, keys)
+
+    def count(self):
+        return self.conn.execute('SELECT count(*) from {db.tablename}'.format(db=self)).fetchone()[0]
+
+    SIZE_SQL = 'coalesce(length(cache_blob), 0) + coalesce(length(cache_value), 0)'
+
+    EVICTION_ORDER = MySQLCacheBackend.EVICTION_ORDER
+
+    def total_bytes(self):
+        sql = 'SELECT sum({size}) from {db.tablename}'.format(db=self, size=self.SIZE_SQL)
+        return int(self.conn.execute(sql).fetchone()[0] or 0)
+
+    def touch_keys(self, counts, chunk_size=500):
+        sql = ("update {db.tablename} set hit_count = hit_count + ?, last_accessed = datetime('now', 'localtime') "
+               "where cache_key = ?").format(db=self)
+        items = [(count, key) for key, count in counts.items()]
+        for idx in range(0, len(items), chunk_size):
+            with self.conn:
+                self.conn.executemany(sql, items[idx:idx + chunk_size])
+
+    def keys_created_before(self, before, limit):
+        sql = 'SELECT cache_key from {db.tablename} where date_created < ? limit ?'.format(db=self)
+        return [row[0] for row in self.conn.execute(sql, (SQLdatetime(before), limit)).fetchall()]
+
+    def eviction_candidates(self, policy, limit):
+        sql = 'SELECT cache_key, {size} from {db.tablename} order by {order} limit ?'.format(
+                    db=self, size=self.SIZE_SQL, order=self.EVICTION_ORDER[policy])
+        return [(row[0], row[1]) for row in self.conn.execute(sql, (limit,)).fetchall()]
+
+    def export_rows(self, after_key, limit, min_version=None, max_version=None, since=None, until=None):
+        where, args = self._export_where('?', after_key, min_version, max_version, since, until)
+        sql = 'SELECT * from {db.tablename}{where} order by cache_key limit ?'.format(db=self, where=where)
+        return [self._row_to_dict(row) for row in self.conn.execute(sql, args + [limit]).fetchall()]
+
+    def load_rows(self, rows, overwrite=False, chunk_size=500):
+        # (last_accessed has no column default here; loaded entries count as accessed when created.)
+        columns = self.LOAD_COLUMNS + ('last_accessed',)
+        sql = '{verb} into {db.tablename} ({columns}) values ({params})'.format(
+                    verb='insert or replace' if overwrite else 'insert or ignore', db=self,
+                    columns=','.join(columns), params=','.join(['?'] * len(columns)))
+        args = []
+        for row in rows:
+            row = dict(row)
+            if row.get('date_created', None) is not None:
+                row['date_created'] = SQLdatetime(row['date_created'])
+            row['last_accessed'] = row['date_created']
+            args.append([row[col] for col in columns])
+
+        with self.conn:
+            cursor = self.conn.executemany(sql, args)
+        return cursor.rowcount
+
+    def create_table(self, reset=False):
+        with self.conn:
+            if reset:
+                self.conn.execute('DROP TABLE IF EXISTS {db.tablename}'.format(db=self))
+
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS {db.tablename} (
+                    cache_key TEXT primary key not null COLLATE NOCASE,
+                    cache_value TEXT default NULL,
+                    cache_blob BLOB default NULL,
+                    date_created TEXT default (datetime('now', 'localtime')),
+                    version INTEGER default 0,
+                    negative INTEGER default 0,
+                    last_accessed TEXT default NULL,
+                    hit_count INTEGER default 0
+                  )""".format(db=self))
+        return True
+
+    def drop_table(self):
+        with self.conn:
+            self.conn.execute('DROP TABLE IF EXISTS {db.tablename}'.format(db=self))
+
+    def _add_column(self, definition):
+        try:
+            with self.conn:
+                self.conn.execute('alter table {db.tablename} add column {definition}'.format(db=self,
+                                                                                           definition=definition))
+        except sqlite3.OperationalError as error:
+            if 'duplicate column' not in str(error):
+                raise
+
+    def upgrade_table(self):
+        self._add_column('negative INTEGER default 0')
+        self._add_column('last_accessed TEXT default NULL')
+        self._add_column('hit_count INTEGER default 0')
+        with self.conn:
+            for name, columns in (('date_created', 'date_created'), ('last_accessed', 'last_accessed'),
+                                  ('hit_count', 'hit_count, last_accessed')):
+                self.conn.execute('CREATE INDEX IF NOT EXISTS {db.tablename}_{name} on {db.tablename} ({columns})'.format(
+                                  db=self, name=name, columns=columns))
+            self.conn.execute('update {db.tablename} set last_accessed = date_created where last_accessed is NULL'.format(
+                              db=self))
+
+
+def get_backend(cache):
+    """ Returns the storage backend configured for the supplied SQLCache instance.
+
+    :param cache: SQLCache instance
+    :return: CacheBackend instance
+    :raises: ValueError if configured backend name is unknown
+    """
+    name = get_cache_setting(cache.servicename, 'backend', 'mysql').lower()
+    if name == 'mysql':
+        return MySQLCacheBackend(cache, cache.tablename)
+    elif name == 'sqlite':
+        path = os.path.expanduser(get_cache_setting(cache.servicename, 'sqlite_path', DEFAULT_SQLITE_PATH))
+        return SQLiteCacheBackend(path, cache.tablename)
+    raise ValueError('Unknown cache backend "%s" configured for %s' % (name, cache.servicename))
@@ -0,0 +1,125 @@
+""" Value codecs for the cache tables.
+
+A codec is named "<serializer>+<compression>" (or just "<serializer>" for no compression), e.g.:
+
+    json+zlib       simplejson, zlib-compressed (default for most services)
+    msgpack+zlib    msgpack (requires the msgpack package), zlib-compressed
+    text+zstd       values that are already text (e.g. VariantLVG.to_json()), zstd-compressed
+                    (requires the zstandard package)
+
+Encoded values are self-describing: a 3-byte header (codec format version, serializer id,
+compression id) precedes the payload, so any stored value can be decoded regardless of which
+codec is currently configured for the service.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import zlib
+
+import simplejson as json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# version of the header layout (first byte of every encoded value).
+CODEC_FORMAT = 1
+
+SERIALIZERS = {'json': 1, 'msgpack': 2, 'text': 3}
+COMPRESSIONS = {'none': 0, 'zlib': 1, 'zstd': 2}
+
+_SERIALIZER_NAMES = dict((ident, name) for name, ident in SERIALIZERS.items())
+_COMPRESSION_NAMES = dict((ident, name) for name, ident in COMPRESSIONS.items())
+
+
+def _serialize(serializer, value):
+    if serializer == 'json':
+        return json.dumps(value).encode('utf-8')
+    elif serializer == 'msgpack':
+        return msgpack.packb(value, use_bin_type=True)
+    return value.encode('utf-8')
+
+
+def _deserialize(serializer, data):
+    if serializer == 'json':
+        return json.loads(data.decode('utf-8'))
+    elif serializer == 'msgpack':
+        if msgpack is None:
+            raise ValueError('Cache value was encoded with msgpack, which is not installed.')
+        return msgpack.unpackb(data, raw=False)
+    return data.decode('utf-8')
+
+
+def _compress(compression, data):
+    if compression == 'zlib':
+        return zlib.compress(data)
+    elif compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def _decompress(compression, data):
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('Cache value was compressed with zstd, but zstandard is not installed.')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+class ValueCodec(object):
+    """ Encodes values for storage in a cache table's cache_blob column.  See module docstring. """
+
+    def __init__(self, name):
+        """
+        :param name: (str) codec name, e.g. "json+zlib"
+        :raises: ValueError if codec name is unknown or its library is not installed
+        """
+        self.name = name
+        parts = name.lower().split('+')
+        self.serializer = parts[0]
+        self.compression = parts[1] if len(parts) > 1 else 'none'
+
+        if self.serializer not in SERIALIZERS or self.compression not in COMPRESSIONS or len(parts) > 2:
+            raise ValueError('Unknown cache value codec "%s"' % name)
+        if self.serializer == 'msgpack' and msgpack is None:
+            raise ValueError('Cache value codec "%s" requires the msgpack package.' % name)
+        if self.compression == 'zstd' and zstandard is None:
+            raise ValueError('Cache value codec "%s" requires the zstandard package.' % name)
+
+        self._header = bytes(bytearray([CODEC_FORMAT, SERIALIZERS[self.serializer],
+                                        COMPRESSIONS[self.compression]]))
+
+    def encode(self, value):
+        """ :return: (bytes) header + serialized, compressed value """
+        return self._header + _compress(self.compression, _serialize(self.serializer, value))
+
+    def __repr__(self):
+        return '<ValueCodec %s>' % self.name
+
+
+def decode_value(blob):
+    """ Decodes a value encoded by any ValueCodec, using the header to tell how.
+
+    :param blob: (bytes)
+    :return: decoded value
+    :raises: ValueError if header is not recognized
+    """
+    header = bytearray(blob[:3])
+    if len(header) < 3 or header[0] != CODEC_FORMAT:
+        raise ValueError('Unrecognized cache value header %r' % bytes(header))
+
+    try:
+        serializer = _SERIALIZER_NAMES[header[1]]
+        compression = _COMPRESSION_NAMES[header[2]]
+    except KeyError:
+        raise ValueError('Unrecognized cache value header %r' % bytes(header))
+
+    return _deserialize(serializer, _decompress(compression, bytes(blob[3:])))
@@ -0,0 +1,118 @@
+""" Background upkeep of the cache tables: writing buffered access statistics (last_accessed, hit_count)
+and, where configured, evicting entries (see SQLCache.evict).
+
+Cache hits don't write to the database themselves; they are counted in an AccessTracker, and one
+daemon thread per process (the CacheJanitor) periodically flushes the counts of every SQLCache
+instance in batches.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import time
+import atexit
+import logging
+import weakref
+import threading
+
+log = logging.getLogger('text2gene.cache_janitor')
+
+
+class AccessTracker(object):
+    """ Thread-safe buffer of per-key hit counts awaiting a flush to the cache table. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, key, count=1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def drain(self):
+        """ Returns dictionary of key -> hit count recorded since last drain, and starts over. """
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class CacheJanitor(object):
+    """ Daemon thread that, for each registered SQLCache, flushes access statistics every
+    access_flush_interval seconds and runs evict() every evict_interval seconds (if > 0).
+
+    The thread is (re)started on demand via ensure_running(), including in forked children.
+
+    Caches are held by weak reference, so that short-lived SQLCache instances (e.g. made per request)
+    are forgotten, schedule and all, once garbage-collected.
+    """
+
+    def __init__(self):
+        self._caches = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._next_run = weakref.WeakKeyDictionary()    # cache -> {task: time}
+
+    def register(self, cache):
+        with self._lock:
+            self._caches.add(cache)
+
+    def ensure_running(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='text2gene-cache-janitor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _due(self, cache, task, interval, now):
+        with self._lock:
+            schedule = self._next_run.setdefault(cache, {})
+        if now >= schedule.setdefault(task, now + interval):
+            schedule[task] = now + interval
+            return True
+        return False
+
+    def run_once(self):
+        """ Runs whatever flushes and evictions are due. """
+        now = time.time()
+        with self._lock:
+            caches = list(self._caches)
+        for cache in caches:
+            try:
+                if self._due(cache, 'flush', cache.access_flush_interval, now):
+                    cache.flush_access()
+                if cache.evict_interval > 0 and self._due(cache, 'evict', cache.evict_interval, now):
+                    cache.evict()
+            except Exception as error:
+                log.warning('Cache upkeep failed for %s: %r', cache.tablename, error)
+            finally:
+                # don't hold on to a pooled connection between runs.
+                cache.release()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                intervals = [cache.access_flush_interval for cache in self._caches]
+            time.sleep(min(intervals or [60]))
+            self.run_once()
+
+    def flush_all(self):
+        """ Flushes access statistics of all registered caches now (e.g. at exit). """
+        with self._lock:
+            caches = list(self._caches)
+        for cache in caches:
+            try:
+                cache.flush_access()
+            except Exception as error:
+                log.warning('Could not flush access statistics for %s: %r', cache.tablename, error)
+
+
+JANITOR = CacheJanitor()
+atexit.register(JANITOR.flush_all)
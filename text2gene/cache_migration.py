@@ -0,0 +1,124 @@
+""" Background re-computation of cache entries stored under an obsolete VERSION.
+
+When a cache service allows serving stale entries ("serve_stale" setting), SQLCache.lookup() returns
+an obsolete entry as-is (with status STALE) and queues it here instead of making the caller wait for
+a recomputation.  One daemon thread per process works through the queue hottest entries first,
+storing fresh values via SQLCache.compute_and_store (so that processes sharing the cache table
+don't recompute the same entry twice).
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+from .config import get_cache_setting
+from .metrics import METRICS
+
+log = logging.getLogger('text2gene.cache_migration')
+
+
+class _Entry(object):
+
+    def __init__(self, cache, querydict, compute, priority):
+        self.cache = cache
+        self.querydict = querydict
+        self.compute = compute
+        self.priority = priority
+
+
+class MigrationQueue(object):
+    """ Priority queue of stale cache entries awaiting recomputation, with its worker thread.
+
+    Priority is the entry's hit_count in the cache table, plus one for every time it is served
+    stale while waiting in the queue.
+    """
+
+    def __init__(self, max_size=10000, pause=0.0):
+        self.max_size = max_size
+        self.pause = pause
+
+        self._lock = threading.Condition()
+        self._heap = []
+        self._entries = {}      # (tablename, key) -> _Entry
+        self._seq = itertools.count()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, cache, querydict, compute, priority=0):
+        """ Queues querydict of cache for recomputation via compute(), or raises its priority if queued.
+
+        :return: True if queued (or already queued), False if the queue is full
+        """
+        self.ensure_running()
+        key = (cache.tablename, cache.get_cache_key(querydict).lower())
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                entry.priority += 1
+            else:
+                if len(self._entries) >= self.max_size:
+                    METRICS.incr(cache.servicename, 'migrations_dropped')
+                    return False
+                entry = self._entries[key] = _Entry(cache, querydict, compute, priority)
+                METRICS.incr(cache.servicename, 'migrations_queued')
+            heapq.heappush(self._heap, (-entry.priority, next(self._seq), key))
+            self._lock.notify()
+        return True
+
+    def _pop(self):
+        """ Waits for and removes the highest-priority entry. """
+        with self._lock:
+            while True:
+                while not self._heap:
+                    self._lock.wait()
+                neg_priority, _, key = heapq.heappop(self._heap)
+                entry = self._entries.get(key, None)
+                # skip heap items left behind by priority bumps.
+                if entry is not None and entry.priority == -neg_priority:
+                    del self._entries[key]
+                    return entry
+
+    def ensure_running(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # entries queued by a parent process are the parent's business.
+                self._heap = []
+                self._entries = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='text2gene-cache-migration')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def migrate(self, entry):
+        """ Recomputes and stores a single entry. """
+        cache = entry.cache
+        try:
+            cache.compute_and_store(entry.querydict, entry.compute, version=cache.VERSION)
+            METRICS.incr(cache.servicename, 'migrations_done')
+        except Exception as error:
+            METRICS.incr(cache.servicename, 'migrations_failed')
+            log.warning('Could not recompute stale entry %s in %s: %r',
+                        cache.get_cache_key(entry.querydict), cache.tablename, error)
+
+    def _run(self):
+        while True:
+            self.migrate(self._pop())
+            if self.pause:
+                time.sleep(self.pause)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# configured by migration_queue_size and migration_pause in the [cache] config section.
+MIGRATIONS = MigrationQueue(max_size=get_cache_setting('migration', 'queue_size', 10000),
+                            pause=get_cache_setting('migration', 'pause', 0.0))
@@ -3,8 +3,10 @@ from __future__ import absolute_import, unicode_literals
 import logging
 
 from .sqlcache import SQLCache
-from .pmid_lookups import clinvar_lex_to_pmid, pubtator_lex_to_pmid
+from .metrics import timed
+from .pmid_lookups import clinvar_lex_to_pmid, clinvar_lexes_to_pmids, pubtator_lex_to_pmid
 from .config import GRANULAR_CACHE
+from .normalize import hgvs_cache_key
 
 log = logging.getLogger('text2gene.cached')
 
@@ -14,7 +16,7 @@ log = logging.getLogger('text2gene.cached')
 
 class ClinvarCachedQuery(SQLCache):
 
-    VERSION = 0
+    VERSION = 1
 
     def __init__(self, granular=False, granular_table='clinvar_match'):
         self.granular = granular
@@ -24,37 +26,77 @@ class ClinvarCachedQuery(SQLCache):
     def get_cache_key(self, lex):
         """ Returns a cache_key in the following shape:
 
-        "<hgvs_text>@<lvg_mode>"
+        "<hgvs_text>@<lvg_mode>"   (hgvs_text in canonical form; see text2gene.normalize)
 
         :param lex: any variant LVG object (VariantLVG, NCBIEnrichedLVG, etc)
         :return: key generated from relevant details in lex
         """
         tmpl = '{hgvs_text}@{lvg_mode}'
-        return tmpl.format(hgvs_text=lex.hgvs_text, lvg_mode=lex.LVG_MODE)
+        return tmpl.format(hgvs_text=hgvs_cache_key(lex.hgvs_text), lvg_mode=lex.LVG_MODE)
 
     def store_granular(self, lex, result):
         entry_pairs = [{'hgvs_text': lex.hgvs_text, 'PMID': pmid, 'version': self.VERSION} for pmid in result]
-        self.batch_insert(self.granular_table, entry_pairs)
+        self.insert_granular(self.granular_table, entry_pairs)
 
+    @timed('query')
     def query(self, lex, skip_cache=False, force_granular=False):
         """
         :param lex: any lexical variant object (VariantLVG, NCBIEnrichedLVG, NCBIHgvsLVG)
         :param skip_cache: whether to force reloading the data by skipping the cache
         :return: list of PMIDs if found (result of Clinvar query)
         """
+        compute = lambda: clinvar_lex_to_pmid(lex)
+
         if not skip_cache:
-            result = self.retrieve(lex, version=self.VERSION)
-            if result:
-                if force_granular:
+            result = self.retrieve(lex, version=self.VERSION, recompute=compute)
+            if result is not None:
+                if force_granular and result:
                     self.store_granular(lex, result)
                 return result
 
-        result = clinvar_lex_to_pmid(lex)
-        self.store(lex, result)
-        if (force_granular or self.granular) and result:
+        result, computed = self.compute_and_store(lex, compute, version=self.VERSION, recheck=not skip_cache)
+        if (force_granular or (self.granular and computed)) and result:
             self.store_granular(lex, result)
         return result
 
+    @timed('query_many')
+    def query_many(self, lexes, skip_cache=False, force_granular=False):
+        """ Bulk version of query(): looks up all lexes in the cache at once, and resolves the misses
+        with a single batched Clinvar lookup (see clinvar_lexes_to_pmids).
+
+        :param lexes: list of lexical variant objects (VariantLVG, NCBIEnrichedLVG, NCBIHgvsLVG)
+        :param skip_cache: whether to force reloading the data by skipping the cache
+        :param force_granular: (bool) store granular results even for cache hits [default: False]
+        :return: list of lists of PMIDs, in the order of lexes
+        """
+        lexes = list(lexes)
+        results = {}        # cache_key -> list of PMIDs
+
+        if skip_cache:
+            todo = lexes
+        else:
+            hits, misses, expired = self.retrieve_many(lexes, version=self.VERSION)
+            results.update((key, self.raise_if_failure(value)) for key, value in hits.items())
+            todo = misses + expired
+            if force_granular:
+                for lex in lexes:
+                    if results.get(self.get_cache_key(lex), None):
+                        self.store_granular(lex, results[self.get_cache_key(lex)])
+
+        # one lookup per distinct cache key.
+        seen = set()
+        todo = [lex for lex in todo if not (self.get_cache_key(lex) in seen or seen.add(self.get_cache_key(lex)))]
+
+        if todo:
+            computed = list(zip(todo, clinvar_lexes_to_pmids(todo)))
+            self.store_many(computed)
+            for lex, result in computed:
+                results[self.get_cache_key(lex)] = result
+                if (force_granular or self.granular) and result:
+                    self.store_granular(lex, result)
+
+        return [results[self.get_cache_key(lex)] for lex in lexes]
+
     def create_granular_table(self):
         tname = self.granular_table
         log.info('creating table {} for ClinvarCachedQuery'.format(tname))
@@ -83,18 +125,19 @@ class PubtatorCachedQuery(SQLCache):
     def get_cache_key(self, lex):
         """ Returns a cache_key in the following shape:
 
-        "<hgvs_text>@<lvg_mode>"
+        "<hgvs_text>@<lvg_mode>"   (hgvs_text in canonical form; see text2gene.normalize)
 
         :param lex: any variant LVG object (VariantLVG, NCBIEnrichedLVG, etc)
         :return: key generated from relevant details in lex
         """
         tmpl = '{hgvs_text}@{lvg_mode}'
-        return tmpl.format(hgvs_text=lex.hgvs_text, lvg_mode=lex.LVG_MODE)
+        return tmpl.format(hgvs_text=hgvs_cache_key(lex.hgvs_text), lvg_mode=lex.LVG_MODE)
 
     def store_granular(self, lex, result):
         entry_pairs = [{'hgvs_text': lex.hgvs_text, 'PMID': pmid, 'version': self.VERSION} for pmid in result]
-        self.batch_insert(self.granular_table, entry_pairs)
+        self.insert_granular(self.granular_table, entry_pairs)
 
+    @timed('query')
     def query(self, lex, skip_cache=False, force_granular=False, **kwargs):
         """
         PubTator queries allow the supplying of a gene_name via keyword args.
@@ -109,16 +152,17 @@ class PubtatorCachedQuery(SQLCache):
         :param skip_cache: whether to force reloading the data by skipping the cache
         :return: list of PMIDs if found (result of Clinvar query)
         """
+        compute = lambda: pubtator_lex_to_pmid(lex, kwargs.get('gene_name', None))
+
         if not skip_cache:
-            result = self.retrieve(lex, version=self.VERSION)
-            if result:
-                if force_granular:
+            result = self.retrieve(lex, version=self.VERSION, recompute=compute)
+            if result is not None:
+                if force_granular and result:
                     self.store_granular(lex, result)
                 return result
 
-        result = pubtator_lex_to_pmid(lex, kwargs.get('gene_name', None))
-        self.store(lex, result)
-        if (force_granular or self.granular) and result:
+        result, computed = self.compute_and_store(lex, compute, version=self.VERSION, recheck=not skip_cache)
+        if (force_granular or (self.granular and computed)) and result:
             self.store_granular(lex, result)
         return result
 
@@ -142,4 +186,5 @@ class PubtatorCachedQuery(SQLCache):
 ### API Definitions
 
 ClinvarHgvs2Pmid = ClinvarCachedQuery(granular=GRANULAR_CACHE).query
+ClinvarHgvs2Pmid_many = ClinvarHgvs2Pmid.__self__.query_many
 PubtatorHgvs2Pmid = PubtatorCachedQuery(granular=GRANULAR_CACHE).query
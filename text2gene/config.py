@@ -37,3 +37,23 @@ if os.path.exists(private_conf):
 
 # if training is "active", enable GRANULAR_CACHE for all cacheing engines.
 GRANULAR_CACHE = False
+
+
+def get_cache_setting(servicename, option, default):
+    """ Returns a setting from the [cache] section of the config.
+
+    A service-specific setting named "<servicename>_<option>" (e.g. "hgvslvg_l1_ttl") takes precedence
+    over the general "<option>" (e.g. "l1_ttl"); if neither is configured, `default` is returned.
+
+    The type of `default` (bool, int, float or str) determines how the setting is read.
+    """
+    for key in ('%s_%s' % (servicename, option), option):
+        if CONFIG.has_option('cache', key):
+            if isinstance(default, bool):
+                return CONFIG.getboolean('cache', key)
+            elif isinstance(default, int):
+                return CONFIG.getint('cache', key)
+            elif isinstance(default, float):
+                return CONFIG.getfloat('cache', key)
+            return CONFIG.get('cache', key)
+    return default
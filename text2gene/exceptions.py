@@ -13,3 +13,15 @@ class GoogleQueryRemoteError(Text2GeneError):
     """ Raised when Google CSE query fails. Message should contain status code and text of query. """
     pass
 
+class SnapshotError(Text2GeneError):
+    """ Raised when a cache snapshot file is corrupt, truncated, or doesn't match the cache it is used with. """
+    pass
+
+
+class InvalidHgvsInput(Text2GeneError):
+    """ Raised when input text can't possibly be an HGVS string (rejected before any hgvs parsing). """
+    pass
+
+class GeneNotFound(Text2GeneError):
+    """ Raised when a gene name is not known to the gene metadata (see text2gene.gene_metadata). """
+    pass
@@ -0,0 +1,227 @@
+""" In-memory gene metadata: gene symbol <-> NCBI GeneID <-> gene synonyms, from medgen's gene_info table.
+
+GeneID(), GeneName() and GeneSynonyms() here answer the same questions as their medgen counterparts
+(medgen.api.GeneID, medgen.api.GeneName, medgen.annotate.gene.GeneSynonyms) without a database query
+per call.  The table is loaded once per process on first use, and reloaded in a background thread
+once it is older than refresh_interval seconds (lookups keep being served from the old copy meanwhile).
+
+With a snapshot_path configured, the loaded table is also written to disk (gzipped JSON), so that
+fresh processes (e.g. gunicorn workers) start from the snapshot instead of the database as long as it
+is younger than refresh_interval -- and fall back on it, whatever its age, if the database is down.
+
+Settings ([cache] section): gene_metadata_refresh_interval, gene_metadata_snapshot_path,
+gene_metadata_tax_id (0 loads every species).
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import gzip
+import time
+import logging
+import threading
+
+import simplejson as json
+from medgen.db.gene import GeneDB
+
+from .config import get_cache_setting
+from .exceptions import GeneNotFound
+from .metrics import METRICS
+
+log = logging.getLogger('text2gene.gene_metadata')
+
+SERVICENAME = 'gene_metadata'
+
+# seconds to wait before retrying a failed refresh (at most refresh_interval).
+REFRESH_RETRY = 300
+
+
+class GeneTables(object):
+    """ Immutable lookup tables built from gene_info rows (GeneID, Symbol, Synonyms, Nomen_symbol).
+
+    Where several rows match, the first one in table order wins, as with the "limit 1" queries in medgen.
+    """
+
+    def __init__(self, rows):
+        self.rows = [(int(row[0]), row[1] or '', row[2] or '', row[3] or '') for row in rows]
+        self.id_by_symbol = {}      # upper-case Symbol -> GeneID
+        self.symbol_by_id = {}      # GeneID -> Symbol
+        self.rows_by_name = {}      # lower-case Symbol, synonym or Nomen_symbol -> row indexes
+
+        for idx, (gene_id, symbol, synonyms, nomen_symbol) in enumerate(self.rows):
+            self.id_by_symbol.setdefault(symbol.upper(), gene_id)
+            self.symbol_by_id.setdefault(gene_id, symbol)
+
+            names = set([symbol, nomen_symbol])
+            names.update(synonyms.split('|'))
+            for name in names:
+                if name.strip():
+                    self.rows_by_name.setdefault(name.lower(), []).append(idx)
+
+    def synonyms(self, gene_name):
+        """ Returns sorted list of the symbols and synonyms of every gene known as gene_name (or []). """
+        synonyms = set()
+        for idx in self.rows_by_name.get(gene_name.lower(), []):
+            _, symbol, aliases, _ = self.rows[idx]
+            synonyms.add(symbol)
+            synonyms.update(alias for alias in aliases.split('|') if alias.strip())
+        return sorted(synonyms)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class GeneMetadata(object):
+
+    def __init__(self, refresh_interval=86400, snapshot_path='', tax_id=9606):
+        self.refresh_interval = refresh_interval
+        self.snapshot_path = os.path.expanduser(snapshot_path) if snapshot_path else ''
+        self.tax_id = tax_id
+
+        self._tables = None
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _fetch_rows(self):
+        sql = 'select GeneID, Symbol, Synonyms, Nomen_symbol from gene_info'
+        if self.tax_id:
+            rows = GeneDB().fetchall(sql + ' where tax_id = %s', self.tax_id)
+        else:
+            rows = GeneDB().fetchall(sql)
+        return [(row['GeneID'], row['Symbol'], row['Synonyms'], row['Nomen_symbol']) for row in rows
+                if row['GeneID'] is not None]
+
+    def _read_snapshot(self):
+        """ :return: (rows, created) from snapshot_path, or (None, 0) if there is none. """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None, 0
+        try:
+            with gzip.open(self.snapshot_path, 'rb') as fh:
+                snapshot = json.loads(fh.read().decode('utf-8'))
+            if snapshot.get('tax_id') != self.tax_id:
+                return None, 0
+            return snapshot['rows'], snapshot['created']
+        except (IOError, ValueError, KeyError) as error:
+            log.warning('Could not read gene metadata snapshot %s: %r', self.snapshot_path, error)
+            return None, 0
+
+    def _write_snapshot(self, rows, created):
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            with gzip.open(tmp_path, 'wb') as fh:
+                fh.write(json.dumps({'tax_id': self.tax_id, 'created': created, 'rows': rows}).encode('utf-8'))
+            os.rename(tmp_path, self.snapshot_path)
+        except (IOError, OSError) as error:
+            log.warning('Could not write gene metadata snapshot %s: %r', self.snapshot_path, error)
+
+    def load_rows(self, rows, loaded_at=None):
+        """ Replaces the lookup tables with ones built from rows of (GeneID, Symbol, Synonyms, Nomen_symbol). """
+        tables = GeneTables(rows)
+        self._tables = tables
+        self._next_refresh = (loaded_at or time.time()) + self.refresh_interval
+        return tables
+
+    def refresh(self):
+        """ Reloads gene metadata from the database (and writes the snapshot, if configured).
+
+        :return: number of genes loaded
+        """
+        with METRICS.timer(SERVICENAME, 'refresh'):
+            rows = self._fetch_rows()
+        created = time.time()
+        self.load_rows(rows, created)
+        if self.snapshot_path:
+            self._write_snapshot(rows, created)
+        METRICS.incr(SERVICENAME, 'refreshes')
+        log.info('Loaded metadata of %i genes', len(rows))
+        return len(rows)
+
+    def _initial_load(self):
+        rows, created = self._read_snapshot()
+        if rows is not None and time.time() - created < self.refresh_interval:
+            log.info('Loaded metadata of %i genes from snapshot %s', len(rows), self.snapshot_path)
+            return self.load_rows(rows, created)
+        try:
+            self.refresh()
+        except Exception as error:
+            if rows is None:
+                raise
+            # a stale snapshot beats no gene metadata at all.
+            METRICS.incr(SERVICENAME, 'refresh_failures')
+            log.warning('Could not load gene metadata (%r); using snapshot from %s', error,
+                        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created)))
+            self.load_rows(rows, created)
+            self._next_refresh = time.time() + min(REFRESH_RETRY, self.refresh_interval)
+        return self._tables
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as error:
+            METRICS.incr(SERVICENAME, 'refresh_failures')
+            log.warning('Gene metadata refresh failed: %r', error)
+            self._next_refresh = time.time() + min(REFRESH_RETRY, self.refresh_interval)
+        finally:
+            self._refreshing = False
+
+    @property
+    def tables(self):
+        if self._tables is None:
+            with self._lock:
+                if self._tables is None:
+                    self._initial_load()
+        elif self.refresh_interval > 0 and time.time() > self._next_refresh:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    thread = threading.Thread(target=self._background_refresh, name='text2gene-gene-metadata')
+                    thread.daemon = True
+                    thread.start()
+        return self._tables
+
+    def gene_id(self, gene):
+        """ NCBI GeneID of gene (as medgen.api.GeneID): integers (or strings of them) are returned as-is.
+
+        :param gene: gene symbol or GeneID
+        :return: GeneID (int) or None if symbol is unknown
+        :raises: TypeError if gene is None
+        """
+        try:
+            int(gene)
+        except ValueError:
+            return self.tables.id_by_symbol.get(gene.upper(), None)
+        except AttributeError:
+            return gene.GeneID
+        return gene
+
+    def gene_name(self, gene_id):
+        """ Gene symbol for gene_id (as medgen.api.GeneName).
+
+        :return: symbol (str) or None if gene_id is unknown
+        """
+        gene_id = self.gene_id(gene_id)
+        return self.tables.symbol_by_id.get(int(gene_id), None) if gene_id is not None else None
+
+    def gene_synonyms(self, gene_name):
+        """ Symbols and synonyms of every gene known as gene_name (as medgen.annotate.gene.GeneSynonyms).
+
+        :return: sorted list of names, or None if gene_name is None
+        :raises: GeneNotFound if gene_name is not known
+        """
+        if gene_name is None:
+            log.warning('Could not get HGNC GeneName synonyms')
+            return None
+        synonyms = self.tables.synonyms(gene_name)
+        if not synonyms:
+            raise GeneNotFound('could not retrieve gene SYNONYMS for %s' % gene_name)
+        return synonyms
+
+
+GENE_METADATA = GeneMetadata(refresh_interval=get_cache_setting(SERVICENAME, 'refresh_interval', 86400),
+                             snapshot_path=get_cache_setting(SERVICENAME, 'snapshot_path', ''),
+                             tax_id=get_cache_setting(SERVICENAME, 'tax_id', 9606))
+
+GeneID = GENE_METADATA.gene_id
+GeneName = GENE_METADATA.gene_name
+GeneSynonyms = GENE_METADATA.gene_synonyms
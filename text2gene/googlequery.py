@@ -11,12 +11,13 @@ import requests
 from metapub import UrlReverse
 from metapub.convert import doi2pmid
 
-from medgen.annotate.gene import GeneSynonyms
-from metavariant import VariantComponents, Variant
+from .gene_metadata import GeneSynonyms
+from .variant_memo import Variant, PoseditSlang, dedup_ratio
 from metavariant.exceptions import RejectedSeqVar
 
 from .exceptions import GoogleQueryMissingGeneName, GoogleQueryRemoteError
 from .sqlcache import SQLCache
+from .metrics import METRICS, timed
 from .config import GRANULAR_CACHE, CONFIG
 
 log = logging.getLogger('text2gene.googlequery')
@@ -66,7 +67,9 @@ def query_cse_return_response(qstring, cse='whitelist', start_index=None):
     else:
         query = CSE_QUERY_TEMPLATES[cse].format(qstring)
 
-    response = requests.get(query)
+    METRICS.incr('google_query', 'api_requests')
+    with METRICS.timer('google_query', 'api_request'):
+        response = requests.get(query)
 
     if not response.ok:
         raise GoogleQueryRemoteError('Google CSE query returned not-ok state: %i (query string: %s)' % (response.status_code, query))
@@ -202,34 +205,34 @@ def googlecse2pmid(cse_results):
     return list(pmids)
 
 
-def quoted_posedit(comp):
-    posedit = '"%s"' % comp.posedit
+def quoted_posedit(posedit):
+    posedit = '"%s"' % posedit
     return posedit.replace('(', '').replace(')', '')
 
 
 def get_posedits_for_seqvar(seqvar):
-    posedits = []
-
     try:
-        comp = VariantComponents(seqvar)
+        posedit, slang = PoseditSlang(seqvar)
     except RejectedSeqVar as error:
         log.debug(error)
         return []
+    return _posedit_terms(posedit, slang)
+
+
+def _posedit_terms(posedit, slang):
+    """ Returns quoted search terms for posedit and its slang (see text2gene.variant_memo.PoseditSlang). """
+    posedits = []
 
     # 1) Official
-    official_term = quoted_posedit(comp)
+    official_term = quoted_posedit(posedit)
     if official_term:
         posedits.append(official_term)
 
-    # 2) Slang
-    try:
-        for slang_term in comp.posedit_slang:
-            slang_term = '"%s"' % slang_term
-            if slang_term != official_term:
-                posedits.append(slang_term)
-    except NotImplementedError as error:
-        # silently omit (but log) any seqvar with an edittype we don't currently support
-        log.debug(error)
+    # 2) Slang (None for any seqvar with an edittype we don't currently support)
+    for slang_term in slang or []:
+        slang_term = '"%s"' % slang_term
+        if slang_term != official_term:
+            posedits.append(slang_term)
 
     return posedits
 
@@ -256,21 +259,30 @@ def get_posedits_for_lex(lex, seqtypes=None):
     posedits = []
 
     # start with the originating seqvar that created the LVG.
-    if lex.seqvar.type in seqtypes:
-        posedits = get_posedits_for_seqvar(lex.seqvar)
-        for syn in posedits:
-            used.add(syn)
-
+    seqvars = [lex.seqvar] if lex.seqvar.type in seqtypes else []
     for seqtype in seqtypes:
-        for seqvar in lex.variants[seqtype].values():
-            try:
-                for syn in get_posedits_for_seqvar(seqvar):
-                    if syn not in used:
-                        posedits.append(syn)
-                        used.add(syn)
-            except RejectedSeqVar as error:
-                log.debug(error)
+        seqvars.extend(lex.variants[seqtype].values())
 
+    # variants with the same posedit and slang (e.g. on other versions of a transcript) expand identically.
+    expanded = set()
+    for seqvar in seqvars:
+        try:
+            posedit, slang = PoseditSlang(seqvar)
+        except RejectedSeqVar as error:
+            log.debug(error)
+            continue
+        key = (posedit, tuple(slang or ()))
+        if key in expanded:
+            continue
+        expanded.add(key)
+
+        for syn in _posedit_terms(posedit, slang):
+            if syn not in used:
+                posedits.append(syn)
+                used.add(syn)
+
+    log.debug('[%s] %i variants, %i distinct posedits (%.0f%% fewer expansions)', lex.seqvar,
+              len(seqvars), len(expanded), 100 * dedup_ratio(len(seqvars), len(expanded)))
     return posedits
 
 
@@ -439,18 +451,6 @@ class GoogleCachedQuery(SQLCache):
         self.granular_table = granular_table
         super(self.__class__, self).__init__('google_query')
 
-    def _truncate_result(self, result):
-        """ Removes unnecessary bulk from Google CSE result list. """
-        out = []
-        for item in result:
-            if type(item) == dict:
-                if item.get('pagemap', None):
-                    for key in ('person', 'article', 'cse_thumbnail'):
-                        if item['pagemap'].get(key, None):
-                            item['pagemap'].pop(key)
-        out.append(item)
-        return out
-
     def get_cache_key(self, qstring):
         """ Returns a cache_key for the supplied Google query string.
 
@@ -463,8 +463,9 @@ class GoogleCachedQuery(SQLCache):
         pmids = googlecse2pmid(cse_results)
         if pmids:
             entry_pairs = [{'hgvs_text': hgvs_text, 'PMID': pmid, 'version': self.VERSION} for pmid in pmids]
-            self.batch_insert(self.granular_table, entry_pairs)
+            self.insert_granular(self.granular_table, entry_pairs)
 
+    @timed('query')
     def query(self, lex, seqtypes=None, term_limit=31, use_gene_synonyms=True, skip_cache=False, force_granular=False):
         """ Supply a "lex" object to run a GoogleQuery and return all parseable results as GoogleCSEResult
         objects.  Supply seqtypes as a list of sequence types to constrain query as desired.
@@ -494,27 +495,27 @@ class GoogleCachedQuery(SQLCache):
         # In other words, we can reuse our cached API results for each query while leaving ourselves open to the
         # possibility of taking advantage of improved interpretation over time.
 
+        def compute():
+            log.debug('GoogleQuery: Hitting Google API with qstring %s' % qstring)
+            return gcse.send_query(qstring)
+
         if not skip_cache:
-            result = self.retrieve(qstring, version=self.VERSION)
+            result = self.retrieve(qstring, version=self.VERSION, recompute=compute)
             if result is not None:
                 log.debug('GoogleQuery: loaded results from cache for qstring %s' % qstring)
+                METRICS.incr(self.servicename, 'api_calls_avoided')
                 cse_results = parse_cse_items(result)
                 if force_granular:
                     self.store_granular(lex.hgvs_text, cse_results)
                 return cse_results
 
-        log.debug('GoogleQuery: Hitting Google API with qstring %s' % qstring)
-        result = gcse.send_query(qstring)
-
-        # if result is too long to be stored, doctor it up (remove unnecessary parts):
-        if len('%r' % result) > 64000:
-            result = self._truncate_result(result)
-
-        self.store(qstring, result)
+        # concurrent misses for the same qstring share a single (billed) Google API call.
+        result, computed = self.compute_and_store(qstring, compute, version=self.VERSION, recheck=not skip_cache)
+        METRICS.incr(self.servicename, 'api_calls' if computed else 'api_calls_avoided')
 
         cse_results = parse_cse_items(result)
 
-        if (force_granular or self.granular) and result:
+        if (force_granular or (self.granular and computed)) and result:
             self.store_granular(lex.hgvs_text, cse_results)
 
         return cse_results
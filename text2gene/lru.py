@@ -0,0 +1,117 @@
+from __future__ import absolute_import, unicode_literals
+
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """ Thread-safe in-process key-value cache with least-recently-used eviction, bounded both by
+    number of entries and by (approximate, caller-reported) size in bytes.  Entries older than
+    `ttl` seconds are treated as absent.
+
+    By default values are kept as-is (no copying or serialization), so callers get back the very
+    same object they put in.  With copy_values=True, put() stores a deep copy and get() returns a
+    fresh deep copy, so that callers mutating what they got (e.g. a cached PMID list) can't alter
+    the cached value seen by everyone else.
+
+    Hit/miss/eviction counters are available via stats().
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=3600, copy_values=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.copy_values = copy_values
+
+        self._data = OrderedDict()     # key -> (expires, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """ Returns value stored at key (marking it as most recently used), or `default` if key is
+        absent or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            if entry[0] < time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            value = entry[2]
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def put(self, key, value, size=1, ttl=None):
+        """ Stores value at key, evicting least recently used entries as needed to stay within bounds.
+
+        Values larger than max_bytes on their own are not stored.
+
+        :param key: hashable
+        :param value: any object
+        :param size: (int) approximate size of value in bytes [default: 1]
+        :param ttl: (int) seconds to keep this entry, if shorter than the cache's ttl [default: None]
+        """
+        if self.copy_values and size <= self.max_bytes:
+            value = copy.deepcopy(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+            self._data[key] = (time.time() + ttl, size, value)
+            self._bytes += size
+
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self._bytes -= entry[1]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """ Returns dictionary of counters and current occupancy of this cache. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'entries': len(self._data),
+                    'bytes': self._bytes,
+                    'max_entries': self.max_entries,
+                    'max_bytes': self.max_bytes,
+                    'ttl': self.ttl,
+                    }
@@ -1,85 +1,484 @@
 from __future__ import absolute_import, unicode_literals
 
+import copy
 import logging
+import multiprocessing
+from collections import namedtuple
+
+import simplejson as json
 
 from metavariant import VariantLVG 
+from metavariant.lvg import variant_to_gene_name
+from metavariant.exceptions import CriticalHgvsError
 
-from .exceptions import Text2GeneError
-from .sqlcache import SQLCache
-from .config import GRANULAR_CACHE, SEQVAR_MAX_LEN
+from .exceptions import Text2GeneError, InvalidHgvsInput
+from .sqlcache import SQLCache, NegativeResult
+from .metrics import METRICS, timed
+from .config import GRANULAR_CACHE, SEQVAR_MAX_LEN, get_cache_setting
+from .normalize import normalize_hgvs, hgvs_cache_key
 
 log = logging.getLogger('text2gene.lvg')
 
+SEQTYPES = ('c', 'g', 'n', 'p')
+
+
+def hgvs_seqtype(hgvs_text):
+    """ Returns the sequence type ('c', 'g', 'n' or 'p') of an hgvs string, without parsing it,
+    or None if it doesn't look like one of those.
+    """
+    try:
+        posedit = hgvs_text.split(':', 1)[1]
+    except IndexError:
+        return None
+    if posedit[1:2] == '.' and posedit[:1] in SEQTYPES:
+        return posedit[:1]
+    return None
+
+
+class CachedLVG(object):
+    """ Lightweight stand-in for a VariantLVG, as loaded from the hgvslvg cache.
+
+    Holds the hgvs strings of the stored VariantLVG (see VariantLVG.to_json) without parsing them;
+    hgvs parsing only happens once a caller touches .seqvar, .variants or .seqvars.  to_json() and
+    to_dict() are served from the stored data, so JSON-only consumers never parse at all (in to_dict(),
+    variants and seqvar are hgvs strings rather than SequenceVariant objects).
+
+    As in VariantLVG, a gene_name stored as None is looked up (in UTA) when first asked for.
+    """
+
+    LVG_MODE = VariantLVG.LVG_MODE
+
+    def __init__(self, hgvs_text, gene_name=None, hgvs_c=None, hgvs_g=None, hgvs_n=None, hgvs_p=None,
+                 transcripts=None, json_str=None):
+        self.hgvs_text = hgvs_text
+        self._gene_name = gene_name
+        self.hgvs_c = list(hgvs_c or [])
+        self.hgvs_g = list(hgvs_g or [])
+        self.hgvs_n = list(hgvs_n or [])
+        self.hgvs_p = list(hgvs_p or [])
+        self.transcripts = set(transcripts or [])
+
+        # hgvs_text of the LVG this one was re-rooted from (see reroot), if any.
+        self.equivalent_of = None
+
+        self._json = json_str
+        self._dict = None
+        self._seqvar = None
+        self._variants = None
+
+    @classmethod
+    def from_json(cls, json_str):
+        """ Instantiates from the output of VariantLVG.to_json() (or CachedLVG.to_json()). """
+        inpd = json.loads(json_str)
+        return cls(inpd.pop('hgvs_text'), json_str=json_str, **inpd)
+
+    @classmethod
+    def from_lvg(cls, lex):
+        """ Returns a CachedLVG for lex (a VariantLVG or CachedLVG). """
+        if isinstance(lex, cls):
+            return lex
+        return cls.from_json(lex.to_json())
+
+    def reroot(self, hgvs_text):
+        """ Returns a copy of this LVG with hgvs_text (an equivalent variant) as its input. """
+        lex = self.__class__(hgvs_text, self._gene_name, self.hgvs_c, self.hgvs_g, self.hgvs_n, self.hgvs_p,
+                             self.transcripts)
+        lex.equivalent_of = self.hgvs_text
+        return lex
+
+    @property
+    def gene_name(self):
+        """ Gene name as stored, or else that of the first c/n/p variant UTA knows one for (as in VariantLVG). """
+        if self._gene_name is None:
+            for seqtype in ('c', 'n', 'p'):
+                for seqvar in self.variants[seqtype].values():
+                    name = variant_to_gene_name(seqvar) if seqvar is not None else None
+                    if name:
+                        self._gene_name = name
+                        return name
+        return self._gene_name
+
+    @property
+    def seqvar(self):
+        """ SequenceVariant of hgvs_text (parsed on first access). """
+        if self._seqvar is None:
+            self._seqvar = VariantLVG.parse(self.hgvs_text)
+        return self._seqvar
+
+    @property
+    def variants(self):
+        """ Dictionary of seqtype -> {hgvs string: SequenceVariant}, as in VariantLVG (parsed on first access). """
+        if self._variants is None:
+            variants = {}
+            for seqtype in SEQTYPES:
+                variants[seqtype] = dict((hgvs_str, VariantLVG.parse(hgvs_str))
+                                         for hgvs_str in getattr(self, 'hgvs_' + seqtype))
+            self._variants = variants
+        return self._variants
+
+    @property
+    def seqvars(self):
+        """ Flat list of all SequenceVariant objects in self.variants. """
+        out = []
+        for seqvar_dict in self.variants.values():
+            out.extend(seqvar_dict.values())
+        return out
+
+    def _simple_dict(self):
+        return {'gene_name': self.gene_name,
+                'hgvs_c': self.hgvs_c,
+                'hgvs_g': self.hgvs_g,
+                'hgvs_n': self.hgvs_n,
+                'hgvs_p': self.hgvs_p,
+                'hgvs_text': self.hgvs_text,
+                'transcripts': list(self.transcripts),
+                }
+
+    def to_dict(self, with_gene_name=True):
+        """ Returns contents as a 2-level dictionary in the layout of VariantLVG.to_dict(), with hgvs
+        strings in place of SequenceVariant objects.  (A fresh copy each call; callers may modify it.)
+        """
+        if self._dict is None:
+            self._dict = {'variants': dict((seqtype, getattr(self, 'hgvs_' + seqtype)) for seqtype in SEQTYPES),
+                          'transcripts': list(self.transcripts),
+                          'seqvar': self.hgvs_text,
+                          'hgvs_text': self.hgvs_text,
+                          }
+        outd = copy.deepcopy(self._dict)
+        if with_gene_name:
+            outd['gene_name'] = self.gene_name
+        return outd
+
+    def to_json(self):
+        if self._json is None:
+            self._json = json.dumps(self._simple_dict())
+        return self._json
+
+    def __str__(self):
+        return 'HGVS input: %s\n%r' % (self.hgvs_text, self.seqvar)
+
+    def __repr__(self):
+        return '<CachedLVG %s>' % self.hgvs_text
+
+
+# result of VariantLVGCached.query_many for one input: lex is a VariantLVG or CachedLVG (None if error is set).
+LVGResult = namedtuple('LVGResult', ['hgvs_text', 'lex', 'error'])
+
+
+def compute_lvg(hgvs_text):
+    """ Builds the VariantLVG object for hgvs_text (no caching).
+
+    :raises: CriticalHgvsError, Text2GeneError
+    """
+    lexobj = VariantLVG(hgvs_text, seqvar_max_len=SEQVAR_MAX_LEN)
+    if not lexobj:
+        raise Text2GeneError('VariantLVG object could not be created from input hgvs_text %s' % hgvs_text)
+    return lexobj
+
+
+def _init_lvg_worker():
+    """ Process pool initializer: gives each worker its own UTA connection and mapper, rather than
+    sharing the connection inherited from the parent process.
+    """
+    import hgvs.assemblymapper
+    from metavariant import lvg
+    from metavariant.config import get_uta_connection
+
+    lvg.uta = get_uta_connection()
+    lvg.mapper = hgvs.assemblymapper.AssemblyMapper(lvg.uta)
+
+
+def _compute_lvg_worker(hgvs_text):
+    """ Process pool task: returns (hgvs_text, VariantLVG json or None, error class name, error message). """
+    try:
+        return hgvs_text, compute_lvg(hgvs_text).to_json(), None, None
+    except Exception as error:
+        return hgvs_text, None, error.__class__.__name__, '%s' % error
+
 
 class VariantLVGCached(SQLCache):
 
     VERSION = 1
 
+    # values are stored as the (already serialized) output of VariantLVG.to_json()
+    DEFAULT_CODEC = 'text+zlib'
+    JSON_TEXT_VALUE = True
+
+    # HGVS strings that can't be parsed or mapped will fail the same way next time.
+    CACHEABLE_ERRORS = (CriticalHgvsError, Text2GeneError)
+
     def __init__(self, granular=False, granular_table='lvg_mappings'):
         self.granular = granular
         self.granular_table = granular_table
         super(self.__class__, self).__init__('hgvslvg')
 
+        # use the granular table as an index of hgvs string -> equivalent LVG (see find_equivalents).
+        self.equivalence_index = get_cache_setting(self.servicename, 'equivalence_index', False)
+
     def get_cache_key(self, hgvs_text):
-        return str(hgvs_text)
+        return hgvs_cache_key(hgvs_text)
+
+    def normalize(self, hgvs_text):
+        """ Returns the canonical form of hgvs_text (see text2gene.normalize), counting the inputs
+        it changed (normalized_inputs) or rejected (rejected_inputs) in the service metrics.
+
+        :raises: InvalidHgvsInput
+        """
+        try:
+            canonical = normalize_hgvs(hgvs_text)
+        except InvalidHgvsInput:
+            METRICS.incr(self.servicename, 'rejected_inputs')
+            raise
+        if canonical != hgvs_text:
+            METRICS.incr(self.servicename, 'normalized_inputs')
+        return canonical
 
     def get_cache_value(self, obj):
         """ Returns json object representation of supplied object. """
         return obj.to_json()
 
-    def retrieve(self, hgvs_text, version=0):
-        """ If cache contains a value for hgvs_text, retrieve it. Otherwise, return None.
+    def load_cache_value(self, cache_value):
+        """ Returns CachedLVG object wrapping the stored json representation (no hgvs parsing or mapping
+        until its variants are needed).
+
+        (Used by both retrieve and retrieve_many.)
+        """
+        return CachedLVG.from_json(cache_value)
 
-        (Overrides default retrieve)
+    def _granular_rows(self, lex):
+        """ Returns a granular table row (with all columns) for each of the c/g/n/p mappings of lex. """
+        rows = []
+        for seqtype in SEQTYPES:
+            column = 'hgvs_' + seqtype
+            for item in getattr(lex, column):
+                row = {'hgvs_text': lex.hgvs_text, 'hgvs_c': None, 'hgvs_g': None, 'hgvs_n': None, 'hgvs_p': None,
+                       'version': self.VERSION}
+                row[column] = item
+                rows.append(row)
+        return rows
 
-        If requested version number is GREATER THAN OR EQUAL TO version number of existing data, older version will be
-        destroyed so that newer version can be created in its place.
+    def store_granular(self, lex):
+        """ Records the c/g/n/p mappings of lex in the granular table, replacing those recorded before
+        for lex.hgvs_text (delete and inserts go together, also in write-behind mode).
 
-        Thus, supplying version=0 allows returns from cache from *any* version of data that has ever been stored.
+        (The same LVG gets stored again with force_granular, and when recomputed after its cache entry
+        expired or was evicted; inserting alone would pile up duplicate rows.  The delete goes by the
+        hgvs_text indexes lvg_mappings has always had.)
+        """
+        self.replace_granular(self.granular_table, 'hgvs_text', lex.hgvs_text, self._granular_rows(lex))
 
-        :param hgvs_text: (str)
-        :param version: (int) only return results from cache with greater than or equal version number [default: 0]
-        :return: LVG object or None
+    def _should_index(self, lex):
+        """ Whether freshly stored lex goes into the granular table.  (Re-rooted LVGs don't: their
+        mappings are already there under the LVG they came from.)
         """
-        row = self.get_row(hgvs_text)
-        if row:
-            if row['version'] >= version:
-                return VariantLVG.from_json(row['cache_value'])     #.decode('string_escape'))
-            else:
-                log.debug('Expiring obsolete entry at cache_key location %s.', self.get_cache_key(hgvs_text))
-                self.delete(hgvs_text)
-        return None
+        return (self.granular or self.equivalence_index) and getattr(lex, 'equivalent_of', None) is None
 
-    def _store_granular_hgvs_type(self, lex, hgvs_seqtype_name):
-        hgvs_vars = getattr(lex, hgvs_seqtype_name)
-        if hgvs_vars:
-            entry_pairs = [{'hgvs_text': lex.hgvs_text,
-                            hgvs_seqtype_name: item,
-                            'version': self.VERSION} for item in hgvs_vars]
+    def find_equivalents(self, hgvs_texts):
+        """ Looks up hgvs_texts in the granular table, which lists the c/g/n/p variants of every stored LVG.
 
-            self.batch_insert(self.granular_table, entry_pairs)
+        Protein variants are also matched in their predicted form, e.g. NP_009225.1:p.Ser955Ter matches
+        a recorded NP_009225.1:p.(Ser955Ter).
 
-    def store_granular(self, lex):
-        for hgvs_type in ['c', 'g', 'n', 'p']:
-            self._store_granular_hgvs_type(lex, 'hgvs_'+hgvs_type)
+        :param hgvs_texts: list of hgvs strings
+        :return: dictionary of hgvs_text -> hgvs_text of a stored LVG that lists it as a variant
+        """
+        candidates = {}     # seqtype -> {hgvs string: hgvs_text}
+        for hgvs_text in hgvs_texts:
+            seqtype = hgvs_seqtype(hgvs_text)
+            if seqtype is None:
+                continue
+            names = [hgvs_text]
+            if seqtype == 'p' and '.(' not in hgvs_text:
+                names.append(hgvs_text.replace(':p.', ':p.(', 1) + ')')
+            for name in names:
+                candidates.setdefault(seqtype, {}).setdefault(name, hgvs_text)
 
+        found = {}
+        for seqtype, names in candidates.items():
+            column = 'hgvs_' + seqtype
+            keys = list(names)
+            # (matching is case-insensitive, as with the utf8_unicode_ci columns.)
+            names = dict((name.lower(), hgvs_text) for name, hgvs_text in names.items())
+            for idx in range(0, len(keys), self.CHUNK_SIZE):
+                chunk = keys[idx:idx + self.CHUNK_SIZE]
+                sql = 'select hgvs_text, {col} from {table} where {col} in ({params}) and version >= %s'.format(
+                      col=column, table=self.granular_table, params=', '.join(['%s'] * len(chunk)))
+                for row in self.fetchall(sql, *(chunk + [self.VERSION])):
+                    hgvs_text = names.get(row[column].lower(), None)
+                    if hgvs_text is not None and row['hgvs_text'] != hgvs_text:
+                        found.setdefault(hgvs_text, row['hgvs_text'])
+        return found
+
+    def reroot_equivalents(self, hgvs_texts):
+        """ Builds the LVGs of hgvs_texts from cached LVGs of equivalent variants, where the
+        granular table knows of one (see find_equivalents).
+
+        :param hgvs_texts: list of hgvs strings
+        :return: dictionary of hgvs_text -> CachedLVG (for those that could be re-rooted)
+        """
+        roots = self.find_equivalents(hgvs_texts)
+        if not roots:
+            return {}
+
+        hits = self.retrieve_many(sorted(set(roots.values())), version=self.VERSION)[0]
+        rerooted = {}
+        for hgvs_text, root in roots.items():
+            lex = hits.get(self.get_cache_key(root), None)
+            if lex and not isinstance(lex, NegativeResult):
+                rerooted[hgvs_text] = CachedLVG.from_lvg(lex).reroot(hgvs_text)
+        METRICS.incr(self.servicename, 'equivalent_hits', len(rerooted))
+        return rerooted
+
+    @timed('query')
     def query(self, hgvs_text, skip_cache=False, force_granular=False):
+        """ Returns the LVG for hgvs_text, from the cache if possible.
+
+        :param hgvs_text: (str) hgvs string, in any form accepted by text2gene.normalize.normalize_hgvs
+        :param skip_cache: (bool) recompute, ignoring any cached value [default: False]
+        :param force_granular: (bool) store granular mappings even for cache hits [default: False]
+        :return: VariantLVG or CachedLVG
+        :raises: InvalidHgvsInput, CriticalHgvsError, Text2GeneError
+        """
+        raw_text = hgvs_text
+        hgvs_text = self.normalize(hgvs_text)
+
+        def compute():
+            if self.equivalence_index and not skip_cache:
+                lexobj = self.reroot_equivalents([hgvs_text]).get(hgvs_text, None)
+                if lexobj is not None:
+                    return lexobj
+            return compute_lvg(hgvs_text)
+
         if not skip_cache:
-            result = self.retrieve(hgvs_text, version=self.VERSION)
+            result = self.retrieve(hgvs_text, version=self.VERSION, recompute=compute)
+            if result is not None and hgvs_text != raw_text:
+                # a hit that the raw input would (most likely) have missed.
+                METRICS.incr(self.servicename, 'normalized_hits')
+            result = self.raise_if_failure(result)
             if result:
                 if force_granular:
                     self.store_granular(result)
                 return result
 
-        lexobj = VariantLVG(hgvs_text, seqvar_max_len=SEQVAR_MAX_LEN)
-        if lexobj:
-            self.store(hgvs_text, lexobj)
-            if force_granular or self.granular:
-                self.store_granular(lexobj)
+        lexobj, computed = self.compute_and_store(hgvs_text, compute, version=self.VERSION, recheck=not skip_cache)
+        if force_granular or (computed and self._should_index(lexobj)):
+            self.store_granular(lexobj)
+        return lexobj
+
+    @timed('query_many')
+    def query_many(self, hgvs_texts, workers=None, skip_cache=False, force_granular=False, batch_size=500):
+        """ Bulk version of query(): looks up all hgvs_texts in the cache at once, computes the misses
+        (in a pool of `workers` processes, each with its own UTA connection), and stores the new
+        values batch_size at a time as they come in.
 
-            return lexobj
+        Inputs are normalized first (see query); errors are reported per item: inputs rejected by
+        normalization, or whose VariantLVG can't be built, get an LVGResult with error set (failures
+        among CACHEABLE_ERRORS are also stored, as in query()).
+
+        :param hgvs_texts: list of hgvs strings
+        :param workers: (int) number of worker processes; 1 computes in this process [default: cpu count]
+        :param skip_cache: (bool) recompute everything, ignoring cached values [default: False]
+        :param force_granular: (bool) store granular mappings even for cache hits [default: False]
+        :param batch_size: (int) number of computed values per store_many() [default: 500]
+        :return: list of LVGResult in input order, each with hgvs_text as supplied (not normalized)
+        """
+        hgvs_texts = list(hgvs_texts)
+        results = {}        # cache_key -> LVGResult
+
+        canonical = []
+        for hgvs_text in hgvs_texts:
+            try:
+                canonical.append(self.normalize(hgvs_text))
+            except InvalidHgvsInput as error:
+                results[self.get_cache_key(hgvs_text)] = LVGResult(hgvs_text, None, error)
+
+        if skip_cache:
+            todo = canonical
         else:
-            raise Text2GeneError('VariantLVG object could not be created from input hgvs_text %s' % hgvs_text)
+            hits, misses, expired = self.retrieve_many(canonical, version=self.VERSION)
+            for key, value in hits.items():
+                if isinstance(value, NegativeResult):
+                    results[key] = LVGResult(key, None, value.to_exception(self.CACHEABLE_ERRORS))
+                else:
+                    results[key] = LVGResult(key, value, None)
+                    if force_granular:
+                        self.store_granular(value)
+            todo = misses + expired
+
+        # one computation per distinct cache key.
+        seen = set()
+        todo = [hgvs_text for hgvs_text in todo if not (hgvs_text in seen or seen.add(hgvs_text))]
+
+        if todo and self.equivalence_index and not skip_cache:
+            rerooted = [LVGResult(hgvs_text, lex, None) for hgvs_text, lex in self.reroot_equivalents(todo).items()]
+            if rerooted:
+                self._store_computed(rerooted, force_granular)
+                for item in rerooted:
+                    results[self.get_cache_key(item.hgvs_text)] = item
+                todo = [hgvs_text for hgvs_text in todo if self.get_cache_key(hgvs_text) not in results]
+
+        if todo:
+            log.info('Computing %i of %i VariantLVG objects (%s workers)', len(todo), len(hgvs_texts),
+                     workers or 'cpu count')
+            for computed in self._compute_many(todo, workers, batch_size):
+                self._store_computed(computed, force_granular)
+                for item in computed:
+                    results[self.get_cache_key(item.hgvs_text)] = item
+
+        # results are shared per cache key; hand each back under the caller's own string.
+        return [results[self.get_cache_key(hgvs_text)]._replace(hgvs_text=hgvs_text) for hgvs_text in hgvs_texts]
+
+    def _compute_many(self, hgvs_texts, workers, batch_size):
+        """ Yields lists of (up to batch_size) LVGResult as the computations of hgvs_texts finish. """
+        workers = min(workers or multiprocessing.cpu_count(), len(hgvs_texts))
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_lvg_worker)
+            outputs = pool.imap_unordered(_compute_lvg_worker, hgvs_texts,
+                                          chunksize=max(1, min(50, len(hgvs_texts) // (workers * 4))))
+        else:
+            outputs = (_compute_lvg_worker(hgvs_text) for hgvs_text in hgvs_texts)
+
+        try:
+            batch = []
+            for hgvs_text, lex_json, error_name, message in outputs:
+                if error_name is None:
+                    batch.append(LVGResult(hgvs_text, CachedLVG.from_json(lex_json), None))
+                else:
+                    batch.append(LVGResult(hgvs_text, None, self._rebuild_error(error_name, message)))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def _rebuild_error(self, error_name, message):
+        """ Recreates an exception reported by a worker process; errors not among CACHEABLE_ERRORS come
+        back as RuntimeError (so that they aren't stored as failures).
+        """
+        for error_class in self.CACHEABLE_ERRORS:
+            if error_class.__name__ == error_name:
+                return error_class(message)
+        return RuntimeError('%s: %s' % (error_name, message))
+
+    def _store_computed(self, computed, force_granular=False):
+        """ Stores a batch of freshly computed LVGResults (values and cacheable failures). """
+        try:
+            self.store_many([(item.hgvs_text, item.lex) for item in computed if item.error is None])
+            for item in computed:
+                if item.error is not None and isinstance(item.error, self.CACHEABLE_ERRORS):
+                    self.store_failure(item.hgvs_text, item.error)
+        except Exception as error:
+            log.error('Could not store %i VariantLVG results in %s: %r', len(computed), self.tablename, error)
+
+        for item in computed:
+            if item.error is None and (force_granular or self._should_index(item.lex)):
+                self.store_granular(item.lex)
 
     def create_granular_table(self):
         tname = self.granular_table
@@ -101,8 +500,23 @@ class VariantLVGCached(SQLCache):
         self.execute('call create_index("{}", "hgvs_text,hgvs_c")'.format(tname))
         self.execute('call create_index("{}", "hgvs_text,hgvs_n")'.format(tname))
         self.execute('call create_index("{}", "hgvs_text,hgvs_p")'.format(tname))
+        self.create_equivalence_indexes()
+
+    def create_equivalence_indexes(self):
+        """ Indexes each of the hgvs_c/g/n/p columns of the granular table (for find_equivalents),
+        where not already indexed.
+        """
+        tname = self.granular_table
+        indexed = set(row['Column_name'] for row in self.fetchall('show index from {}'.format(tname))
+                      if row['Seq_in_index'] == 1)
+        for seqtype in SEQTYPES:
+            column = 'hgvs_' + seqtype
+            if column not in indexed:
+                log.info('indexing %s.%s', tname, column)
+                self.execute('call create_index("{}", "{}")'.format(tname, column))
 
 
 # API Definitions
 
 LVG = VariantLVGCached(GRANULAR_CACHE).query
+LVG_many = LVG.__self__.query_many
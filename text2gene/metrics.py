@@ -0,0 +1,132 @@
+""" In-process counters and latency histograms for the cache services.
+
+Metrics are kept per servicename (e.g. "hgvslvg", "google_query") and per process; see
+METRICS.snapshot() and the /v1/cache_metrics endpoint.  Recording a metric never touches the
+database.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import time
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+
+# histogram bucket upper bounds, in milliseconds.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram(object):
+    """ Fixed-bucket latency histogram (not thread-safe on its own; see MetricsRegistry). """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction):
+        """ Returns upper bound (ms) of the bucket holding the requested percentile (e.g. 0.95). """
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return self.buckets[idx] if idx < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total_ms': round(self.total_ms, 3),
+                'mean_ms': round(self.total_ms / self.count, 3) if self.count else None,
+                'max_ms': round(self.max_ms, 3),
+                'p50_ms': self.percentile(0.5),
+                'p95_ms': self.percentile(0.95),
+                'p99_ms': self.percentile(0.99),
+                'buckets': dict(('le_%s' % bound, count) for bound, count in zip(self.buckets, self.counts)),
+                }
+
+
+class MetricsRegistry(object):
+    """ Thread-safe store of named counters and latency histograms, grouped by service. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._started = time.time()
+
+    def incr(self, service, name, amount=1):
+        with self._lock:
+            counters = self._counters.setdefault(service, {})
+            counters[name] = counters.get(name, 0) + amount
+
+    def observe(self, service, name, seconds):
+        with self._lock:
+            histograms = self._histograms.setdefault(service, {})
+            if name not in histograms:
+                histograms[name] = Histogram()
+            histograms[name].observe(seconds * 1000.0)
+
+    @contextmanager
+    def timer(self, service, name):
+        """ Context manager recording the duration of its block in histogram `name` of `service`. """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(service, name, time.time() - start)
+
+    def counter(self, service, name):
+        with self._lock:
+            return self._counters.get(service, {}).get(name, 0)
+
+    def snapshot(self):
+        """ Returns dictionary of service -> {'counters': {...}, 'latency': {...}}, plus hit rates. """
+        with self._lock:
+            services = {}
+            for service in set(self._counters) | set(self._histograms):
+                counters = dict(self._counters.get(service, {}))
+                lookups = counters.get('hits', 0) + counters.get('misses', 0)
+                services[service] = {
+                    'counters': counters,
+                    'hit_rate': float(counters.get('hits', 0)) / lookups if lookups else None,
+                    # hit rate had the hits owed to input normalization (normalized_hits) missed.
+                    'hit_rate_without_normalization': (float(counters.get('hits', 0) -
+                                                             counters.get('normalized_hits', 0)) / lookups
+                                                       if lookups else None),
+                    'latency': dict((name, hist.to_dict())
+                                    for name, hist in self._histograms.get(service, {}).items()),
+                }
+            return {'pid': os.getpid(), 'uptime': round(time.time() - self._started, 1), 'services': services}
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._started = time.time()
+
+
+METRICS = MetricsRegistry()
+
+
+def timed(name):
+    """ Method decorator recording call latency in histogram `name` of the instance's servicename. """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with METRICS.timer(self.servicename, name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
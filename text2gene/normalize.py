@@ -0,0 +1,86 @@
+""" Canonical form of user-supplied HGVS strings, shared by the web routes, the CLI and the cache keys.
+
+normalize_hgvs() turns the trivial variations seen in the wild into one canonical string:
+
+    " NM_000059.3(BRCA2):c.8G>T (p.Trp3Leu) "  ->  "NM_000059.3:c.8G>T"
+    "NM_007294.3:c.68_69delAG (p.=)"            ->  "NM_007294.3:c.68_69delAG"
+    "nm_000059.3:C.<en dash>10G>C"              ->  "NM_000059.3:c.-10G>C"
+
+and, as a purely syntactic prefilter, rejects input that can't be HGVS at all (raising
+InvalidHgvsInput) before it reaches the hgvs parser or UTA.  Whether the result is a *valid* HGVS
+variant is still up to hgvs.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import re
+
+from .exceptions import InvalidHgvsInput
+
+# hyphen, non-breaking hyphen, figure dash, en dash, em dash, horizontal bar, minus sign.
+DASHES = '\u2010\u2011\u2012\u2013\u2014\u2015\u2212'
+re_dashes = re.compile('[%s]' % DASHES)
+
+re_whitespace = re.compile(r'\s+', re.UNICODE)
+
+# predicted protein consequence appended to a c./g./n. variant, e.g. " (p.Trp3Leu)", "(p.=)", " (p.(Arg97Gly))"
+re_protein_suffix = re.compile(r'^(?P<hgvs>.+?:\s*[cgmnr]\..+?)\s*\(p\..*\)\s*$')
+
+# gene name embedded after the accession, e.g. "NM_003331.4(TYK2):c.3318_3319insC"
+re_gene_name = re.compile(r'^(?P<ac>[^:(\s]+)\s*\([^():]*\)\s*:')
+
+re_accession = re.compile(r'^([A-Z]{1,2}_?\d+(\.\d+)?|LRG_\d+([tp]\d+)?|ENS[A-Z]*\d+(\.\d+)?)$')
+re_edit = re.compile(r'^[A-Za-z0-9_+\-*>=?()\[\]{};,.:/^|]+$')
+
+
+def normalize_hgvs(hgvs_text):
+    """ Returns the canonical form of hgvs_text (see module docstring).
+
+    :param hgvs_text: (str)
+    :return: (str) canonical hgvs string
+    :raises: InvalidHgvsInput if hgvs_text can't be an hgvs string
+    """
+    if hgvs_text is None or not ('%s' % hgvs_text).strip():
+        raise InvalidHgvsInput('Empty HGVS input: %r' % (hgvs_text,))
+
+    # (also accepts SequenceVariant objects, via their string form.)
+    text = re_dashes.sub('-', '%s' % hgvs_text).strip()
+
+    match = re_protein_suffix.match(text)
+    if match:
+        text = match.group('hgvs')
+
+    match = re_gene_name.match(text)
+    if match:
+        text = match.group('ac') + text[match.end() - 1:]
+
+    text = re_whitespace.sub('', text)
+
+    accession, sep, rest = text.partition(':')
+    seqtype, dot, edit = rest.partition('.')
+    seqtype = seqtype.lower()
+
+    # accession prefixes (NM_, NP_, NC_...) are upper case; LRG transcript/protein suffixes are not.
+    if not accession.startswith(('LRG_', 'lrg_')):
+        accession = accession.upper()
+    else:
+        accession = 'LRG_' + accession[4:]
+
+    if not (sep and dot and seqtype in 'cgmnpr' and len(seqtype) == 1):
+        raise InvalidHgvsInput('Not an HGVS string (expected <accession>:<type>.<edit>): %s' % hgvs_text)
+    if not re_accession.match(accession):
+        raise InvalidHgvsInput('Unrecognized reference sequence accession "%s" in %s' % (accession, hgvs_text))
+    if not edit or not re_edit.match(edit) or not re.search(r'[\d=?]', edit):
+        raise InvalidHgvsInput('Not a sequence variant edit: "%s" in %s' % (edit, hgvs_text))
+
+    return '%s:%s.%s' % (accession, seqtype, edit)
+
+
+def hgvs_cache_key(hgvs_text):
+    """ Returns the canonical form of hgvs_text for use in cache keys, or hgvs_text itself (stripped)
+    if it can't be normalized.
+    """
+    try:
+        return normalize_hgvs(hgvs_text)
+    except InvalidHgvsInput:
+        return ('%s' % hgvs_text).strip()
@@ -1,15 +1,17 @@
 from __future__ import absolute_import, unicode_literals
 
-from medgen.api import GeneID, ClinvarPubmeds
-from metavariant import VariantComponents, Variant
+from collections import OrderedDict
+
+from .gene_metadata import GeneID
+from .variant_memo import Variant, Components, dedup_components, dedup_ratio
 from metavariant.exceptions import RejectedSeqVar
 
-from aminosearch import PubtatorDB
-from aminosearch.exceptions import PubtatorDBError
+from aminosearch import PubtatorDB, ClinVarAminoDB
 
 from .config import log
 
 pubtator_db = PubtatorDB()
+clinvar_db = ClinVarAminoDB()
 
 
 def clinvar_lex_to_pmid(lex):
@@ -20,20 +22,74 @@ def clinvar_lex_to_pmid(lex):
     :param lex: lexical variant object (metavariant.VariantLVG)
     :return: list of pmids found in Clinvar
     """
-    pmids = set()
+    return clinvar_lexes_to_pmids([lex])[0]
+
+
+def clinvar_lexes_to_pmids(lexes):
+    """ Batched version of clinvar_lex_to_pmid: looks up the variants of all supplied lexes in
+    Clinvar at once (see ClinVarAminoDB.hgvs_citations).
+
+    :param lexes: list of lexical variant objects (metavariant.VariantLVG)
+    :return: list of lists of pmids found in Clinvar, in the order of lexes
+    """
+    # throw away sequence variants without enough information
+    hgvs_texts = [list(_lex_components(lex).keys()) for lex in lexes]
+    citations = clinvar_db.hgvs_citations(set(hgvs_text for texts in hgvs_texts for hgvs_text in texts))
+
+    results = []
+    for texts in hgvs_texts:
+        pmids = set()
+        for hgvs_text in texts:
+            pmids.update(citations[hgvs_text])
+        results.append(list(pmids))
+    return results
+
+
+def _lex_components(lex):
+    """ Returns an OrderedDict of hgvs_text -> VariantComponents for every usable variant in lex.variants
+    (sequence variants without enough information are left out).
+
+    :param lex: lexical variant object (metavariant.VariantLVG)
+    :return: OrderedDict
+    """
+    components = OrderedDict()
     for seqtype in lex.variants:
         for seqvar in lex.variants[seqtype].values():
-            # throw away sequence variants without enough information
             try:
-                VariantComponents(seqvar)
+                components['%s' % seqvar] = Components(seqvar)
             except RejectedSeqVar:
-                log.debug('[%s] Rejected sequence variant: %r' % (lex.seqvar, seqvar))
-                continue
+                log.debug('[%s] [[%s]] VariantComponents raised RejectedSeqVar', lex.seqvar, seqvar)
+    return components
+
+
+def _unique_lex_components(lex):
+    """ Returns the usable variants of lex collapsed onto one variant per distinct component (see
+    text2gene.variant_memo.dedup_components), so that each component is searched for only once.
+
+    :param lex: lexical variant object (metavariant.VariantLVG)
+    :return: (unique, shared) -- OrderedDict of hgvs_text -> VariantComponents, and dictionary of
+             hgvs_text -> list of hgvs_texts sharing its components
+    """
+    components = _lex_components(lex)
+    unique, shared = dedup_components(components)
+    log.debug('[%s] %i variants, %i distinct components (%.0f%% fewer searches)', lex.seqvar,
+              len(components), len(unique), 100 * dedup_ratio(len(components), len(unique)))
+    return unique, shared
+
+
+def _fan_out(results, shared):
+    """ Returns results of the searched variants extended to every variant sharing their components.
+
+    :param results: dictionary of hgvs_text -> result, for the variants searched
+    :param shared: dictionary of hgvs_text -> list of hgvs_texts sharing its components
+    :return: OrderedDict of hgvs_text -> result
+    """
+    fanned = OrderedDict()
+    for hgvs_text, result in results.items():
+        for other in shared[hgvs_text]:
+            fanned[other] = result
+    return fanned
 
-            for pmid in ClinvarPubmeds('%s' % seqvar):
-                pmids.add(pmid)
-    return list(pmids)
-    
 
 def pubtator_lex_to_pmid(lex, gene_name=None):
     """ Takes an LVG object ("lex") (metavariant.VariantLVG) and uses each
@@ -61,25 +117,19 @@ def pubtator_lex_to_pmid(lex, gene_name=None):
 
     log.info('[%s] %s (Gene ID: %s)', lex.seqvar, gene_name, gene_id)
 
-    pmids = set()
-    for seqtype in lex.variants:
-        for seqvar in lex.variants[seqtype].values():
-            try:
-                components = VariantComponents(seqvar)
-            except RejectedSeqVar:
-                log.debug('[%s] Rejected sequence variant: %r' % (lex.seqvar, seqvar))
-                continue
+    components, _ = _unique_lex_components(lex)
+    for hgvs_text, comp in components.items():
+        log.info('[%s] [[%s]] %s', lex.seqvar, hgvs_text, comp)
 
-            log.info('[%s] [[%s]] %s', lex.seqvar, seqvar, components)
-            try:
-                if seqtype == 'p':
-                    results = pubtator_db.search_proteins(components, gene_id)
-                else:
-                    results = pubtator_db.search_m2p(components, gene_id)
-                for res in results:
-                    pmids.add(res['PMID'])
-            except PubtatorDBError as error:
-                log.info('[%s] (%s) %r', lex.seqvar, seqvar, error)
+    # one query per m2p_<EditType> table for the whole lex, covering each distinct component once.
+    results, errors = pubtator_db.search_components(components, gene_id)
+    for hgvs_text, error in errors.items():
+        log.info('[%s] (%s) %r', lex.seqvar, hgvs_text, error)
+
+    pmids = set()
+    for rows in results.values():
+        for res in rows:
+            pmids.add(res['PMID'])
 
     return list(pmids)
 
@@ -93,14 +143,14 @@ def pubtator_results_for_seqvar(seqvar_or_hgvs_text, gene_id):
     :param seqvar_or_hgvs_text: hgvs_text or SequenceVariant object
     :param gene_id: id of gene associated with variant (required)
     :return: dictionary of results
-    :raises: RejectedSeqVar, PubtatorDBError
+    :raises: RejectedSeqVar, aminosearch.exceptions.PubtatorDBError (for edittypes PubTator can't search)
     """
     seqvar = Variant(seqvar_or_hgvs_text)
     hgvs_text = '%s' % seqvar
 
     result = {hgvs_text: []}
 
-    components = VariantComponents(seqvar)
+    components = Components(seqvar)
 
     if seqvar.type == 'p':
         result[hgvs_text] = pubtator_db.search_proteins(components, gene_id)
@@ -137,25 +187,16 @@ def pubtator_results_for_lex(lex, gene_name=None):
 
     log.info('[%s] %s (Gene ID: %s)', lex.seqvar, gene_name, gene_id)
 
-    results = {}
-    for seqtype in lex.variants:
-        for seqvar in lex.variants[seqtype].values():
+    components, shared = _unique_lex_components(lex)
+    results, errors = pubtator_db.search_components(components, gene_id)
+    for hgvs_text, error in errors.items():
+        log.info('[%s] [[%s]] %r', lex.seqvar, hgvs_text, error)
 
-            try:
-                result = pubtator_results_for_seqvar(seqvar, gene_id)
-                results.update(result)
-                try:
-                    for row in results['%s' % seqvar]:
-                        log.info('[%s] [[%s]] Mentions: %s  PMID: %s  Components: %s', lex.seqvar, seqvar,
-                                  row['Mentions'], row['PMID'], row['Components'])
-                except Exception as error:
-                    print(error)
-                    #from IPython import embed; embed()
+    results = _fan_out(results, shared)
 
-            except RejectedSeqVar:
-                log.debug('[%s] [[%s]] VariantComponents raised RejectedSeqVar', lex.seqvar, seqvar)
+    for hgvs_text, rows in results.items():
+        for row in rows:
+            log.info('[%s] [[%s]] Mentions: %s  PMID: %s  Components: %s', lex.seqvar, hgvs_text,
+                      row['Mentions'], row['PMID'], row['Components'])
 
-            except PubtatorDBError as error:
-                log.info('[%s] [[%s]] %r', lex.seqvar, seqvar, error)
-
-    return results
+    return dict(results)
@@ -5,8 +5,7 @@ from __future__ import absolute_import, unicode_literals
 import logging
 
 from medgen.api import ClinvarVariationID, ClinVarDB
-from medgen.api import GeneID, GeneName
-from medgen.annotate.gene import GeneSynonyms
+from .gene_metadata import GeneID, GeneName, GeneSynonyms
 
 from metapub import PubMedFetcher, FindIt
 from metapub.utils import rootdomain_of
@@ -6,8 +6,9 @@ import logging
 
 from flask import Blueprint, request, redirect
 
+from aminosearch.sqldata import pool_stats
+
 from metavariant.exceptions import CriticalHgvsError
-from metavariant.utils import strip_gene_name_from_hgvs_text
 from metavariant.lovd import LOVDVariantsForGene
 
 from ..googlequery import GoogleCSEngine, googlecse2pmid, ALL_SEQTYPES, get_posedits_for_seqvar
@@ -15,6 +16,10 @@ from ..report_utils import CitationTable
 from ..api import LVG, GoogleQuery
 from ..sqlcache import SQLCache
 from ..cached import PubtatorHgvs2Pmid, ClinvarHgvs2Pmid
+from ..metrics import METRICS
+from ..variant_memo import VARIANT_MEMO, SERVICENAME as VARIANT_MEMO_SERVICENAME
+from ..normalize import normalize_hgvs
+from ..exceptions import InvalidHgvsInput
 from ..config import PKGNAME
 from ..utils import HTTP200, HTTP400, restrict_by_ip
 
@@ -37,10 +42,10 @@ def hgvs2pmid(hgvs_text):
     outd = {'action': 'hgvs2pmid', 'hgvs_text': hgvs_text, 'response': 'Change <hgvs_text> in url to HGVS string.'}
 
     if 'hgvs_text' not in hgvs_text:
-        hgvs_text = strip_gene_name_from_hgvs_text(hgvs_text)
         try:
+            hgvs_text = normalize_hgvs(hgvs_text)
             lex = LVG(hgvs_text)
-        except CriticalHgvsError as error:
+        except (InvalidHgvsInput, CriticalHgvsError) as error:
             return HTTP400(error, 'Cannot parse input string %s as hgvs text' % hgvs_text)
 
         outd['lvg'] = lex.to_dict()
@@ -67,8 +72,8 @@ def lvg(hgvs_text):
     outd = {'action': 'lvg', 'hgvs_text': hgvs_text, 'response': 'Change <hgvs_text> in url to HGVS string.'}
 
     if 'hgvs_text' not in hgvs_text:
-        hgvs_text = strip_gene_name_from_hgvs_text(hgvs_text)
         try:
+            hgvs_text = normalize_hgvs(hgvs_text)
             lex = LVG(hgvs_text)
         except Exception as error:
             return HTTP400(error, 'Error using LVG to find lexical variants for %s' % hgvs_text)
@@ -115,8 +120,8 @@ def google_query(hgvs_text='<hgvs_text>', **kwargs):
             'response': 'Change <hgvs_text> in url to HGVS string.'}
 
     if 'hgvs_text' not in hgvs_text:
-        hgvs_text = strip_gene_name_from_hgvs_text(hgvs_text)
         try:
+            hgvs_text = normalize_hgvs(hgvs_text)
             lex = LVG(hgvs_text)
         except Exception as error:
             return HTTP400(error, 'Error before building query: could not build LVG object for %s.' % hgvs_text)
@@ -142,6 +147,7 @@ def citation_table(hgvs_text):
 
     if 'hgvs_text' not in hgvs_text:
         try:
+            hgvs_text = normalize_hgvs(hgvs_text)
             lex = LVG(hgvs_text)
             ctable = CitationTable(lex)
             outd['response'] = ctable.to_dict()
@@ -168,6 +174,22 @@ def cache_stats():
     return HTTP200(cache_report)
 
 
+@routes_v1.route('/v1/cache_metrics', methods=['GET'])
+def cache_metrics():
+    """ Returns JSON containing hit/miss counters, bytes read and written, and latency histograms for each
+    cache service, plus L1 cache (and variant memo) and connection pool occupancy.
+
+    Metrics are those of the worker process answering the request; no database queries are made.
+    """
+    outd = METRICS.snapshot()
+    for query in (LVG, ClinvarHgvs2Pmid, PubtatorHgvs2Pmid, GoogleQuery):
+        cache = query.__self__
+        outd['services'].setdefault(cache.servicename, {})['l1'] = cache.l1_stats()
+    outd['services'].setdefault(VARIANT_MEMO_SERVICENAME, {})['l1'] = VARIANT_MEMO.stats()
+    outd['connection_pools'] = pool_stats()
+    return HTTP200(outd)
+
+
 @routes_v1.route('/v1/experiment/<name>', methods=['GET'])
 def experiment(name):
     """ Returns JSON containing experiment results (in progress or completed) for given experiment name. """
@@ -0,0 +1,68 @@
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+
+log = logging.getLogger('text2gene.singleflight')
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ Coalesces concurrent calls for the same key within a process: the first caller for a key
+    runs the computation, and callers arriving while it is in flight wait for it and share its
+    result (or its exception) instead of running the computation again.
+
+    Nothing is remembered once a call completes; caching results is up to the caller.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout=None):
+        """ Runs fn() unless a call for key is already in flight, in which case waits for that call.
+
+        Waiters that give up after `timeout` seconds run fn() themselves.
+
+        :param key: hashable
+        :param fn: callable taking no arguments
+        :param timeout: (float) seconds to wait for an in-flight call [default: None (wait indefinitely)]
+        :return: (value, shared) -- shared is True if value came from another caller's computation
+        :raises: whatever fn() (or the in-flight call) raised
+        """
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.value, True
+            log.warning('Gave up waiting %s seconds for in-flight computation of %s', timeout, key)
+            return fn(), False
+
+        try:
+            call.value = fn()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self):
+        """ Returns number of keys currently being computed. """
+        with self._lock:
+            return len(self._calls)
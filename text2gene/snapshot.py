@@ -0,0 +1,289 @@
+""" Export and import of SQLCache tables as snapshot files, for seeding the cache of a new environment
+without recomputing every entry against live services.
+
+Snapshot file layout:
+
+    MAGIC                                   b'T2GSNAP1'
+    header length (uint32) + header         JSON: tablename, servicename, filters, created
+    chunks, each:
+        b'CHNK', row count (uint32), payload length (uint32), crc32 of payload (uint32)
+        payload                             zlib-compressed rows (see _pack_rows)
+    b'DONE' + total row count (uint32)      only present once export completed
+
+Rows are exported in cache_key order (keyset pagination), so an interrupted export can resume after
+the last complete chunk; imports record the number of chunks loaded in "<snapshot>.progress" and
+resume from there.  Both directions can be restricted to a range of versions and of date_created.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import zlib
+import struct
+import logging
+from datetime import datetime
+
+import simplejson as json
+
+from aminosearch.sqldata import SQLdatetime, SQLDATE_FMT
+
+from .exceptions import SnapshotError
+
+log = logging.getLogger('text2gene.snapshot')
+
+MAGIC = b'T2GSNAP1'
+CHUNK_MARK = b'CHNK'
+DONE_MARK = b'DONE'
+
+CHUNK_HEADER = struct.Struct('>4sIII')
+UINT32 = struct.Struct('>I')
+
+FILTER_NAMES = ('min_version', 'max_version', 'since', 'until')
+
+
+def _pack_field(data):
+    if data is None:
+        return struct.pack('>i', -1)
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return struct.pack('>i', len(data)) + data
+
+
+def _pack_rows(rows):
+    parts = []
+    for row in rows:
+        date_created = row.get('date_created', None)
+        parts.append(_pack_field(row['cache_key']))
+        parts.append(_pack_field(row.get('cache_value', None)))
+        parts.append(_pack_field(row.get('cache_blob', None)))
+        parts.append(_pack_field(None if date_created is None else SQLdatetime(date_created)))
+        parts.append(struct.pack('>ib', row.get('version', None) or 0, row.get('negative', None) or 0))
+    return zlib.compress(b''.join(parts))
+
+
+def _unpack_rows(payload, count):
+    data = zlib.decompress(payload)
+    offset = 0
+    rows = []
+
+    def field():
+        length = struct.unpack_from('>i', data, offset)[0]
+        start = offset + 4
+        if length < 0:
+            return None, start
+        return data[start:start + length], start + length
+
+    for _ in range(count):
+        cache_key, offset = field()
+        cache_value, offset = field()
+        cache_blob, offset = field()
+        date_created, offset = field()
+        version, negative = struct.unpack_from('>ib', data, offset)
+        offset += 5
+        rows.append({'cache_key': cache_key.decode('utf-8'),
+                     'cache_value': None if cache_value is None else cache_value.decode('utf-8'),
+                     'cache_blob': cache_blob,
+                     'date_created': None if date_created is None else datetime.strptime(
+                                         date_created.decode('utf-8'), SQLDATE_FMT),
+                     'version': version,
+                     'negative': negative,
+                     })
+    return rows
+
+
+def _write_chunk(fh, rows):
+    payload = _pack_rows(rows)
+    fh.write(CHUNK_HEADER.pack(CHUNK_MARK, len(rows), len(payload), zlib.crc32(payload) & 0xffffffff))
+    fh.write(payload)
+
+
+def _filters_header(filters):
+    return dict((name, None if filters.get(name) is None else '%s' % filters[name]) for name in FILTER_NAMES)
+
+
+class SnapshotReader(object):
+    """ Reads a snapshot file chunk by chunk, verifying checksums. """
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = open(path, 'rb')
+        if self.fh.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError('%s is not a text2gene cache snapshot' % path)
+        header_len = self._read_uint32()
+        self.header = json.loads(self.fh.read(header_len).decode('utf-8'))
+
+        self.complete = False
+        self.total_rows = None
+        # offset just past the last chunk read intact (resuming an export truncates the file here).
+        self.valid_offset = self.fh.tell()
+
+    def _read_uint32(self):
+        data = self.fh.read(UINT32.size)
+        if len(data) < UINT32.size:
+            raise SnapshotError('%s is truncated' % self.path)
+        return UINT32.unpack(data)[0]
+
+    def chunks(self, strict=True):
+        """ Yields (chunk index, rows) for each chunk in the file.
+
+        :param strict: if False, stop quietly at a truncated or corrupt chunk instead of raising
+        :raises: SnapshotError
+        """
+        idx = 0
+        while True:
+            mark = self.fh.read(4)
+            if mark == DONE_MARK:
+                self.total_rows = self._read_uint32()
+                self.complete = True
+                return
+            if mark != CHUNK_MARK:
+                if strict:
+                    raise SnapshotError('%s is truncated or corrupt after chunk %i' % (self.path, idx))
+                return
+
+            rest = self.fh.read(CHUNK_HEADER.size - 4)
+            if len(rest) < CHUNK_HEADER.size - 4:
+                if strict:
+                    raise SnapshotError('%s is truncated in chunk %i' % (self.path, idx))
+                return
+            _, count, length, crc = CHUNK_HEADER.unpack(mark + rest)
+            payload = self.fh.read(length)
+            if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+                if strict:
+                    raise SnapshotError('%s: checksum mismatch in chunk %i' % (self.path, idx))
+                return
+
+            self.valid_offset = self.fh.tell()
+            yield idx, _unpack_rows(payload, count)
+            idx += 1
+
+    def close(self):
+        self.fh.close()
+
+
+def export_snapshot(cache, path, chunk_rows=1000, resume=True, **filters):
+    """ Streams the table of `cache` (an SQLCache instance) into a snapshot file at `path`.
+
+    If an incomplete snapshot with the same table and filters is found at path (and resume is True),
+    export continues after its last intact chunk.
+
+    Keywords (filters):
+        min_version, max_version: (int) range of entry versions to export
+        since, until: (datetime or rfc3339 string) range of date_created to export [since, until)
+
+    :param cache: SQLCache instance
+    :param path: (str) snapshot file path
+    :param chunk_rows: (int) rows per chunk [default: 1000]
+    :param resume: (bool) whether to continue an interrupted export [default: True]
+    :return: number of rows in snapshot
+    :raises: SnapshotError if existing file at path is a snapshot of something else
+    """
+    header = {'tablename': cache.tablename, 'servicename': cache.servicename,
+              'filters': _filters_header(filters), 'created': datetime.now().strftime(SQLDATE_FMT)}
+
+    after_key = None
+    total = 0
+    if resume and os.path.exists(path):
+        reader = SnapshotReader(path)
+        if reader.header['tablename'] != cache.tablename or reader.header['filters'] != header['filters']:
+            reader.close()
+            raise SnapshotError('%s is a snapshot of %s with filters %r; not resuming' % (
+                                path, reader.header['tablename'], reader.header['filters']))
+        for _, rows in reader.chunks(strict=False):
+            total += len(rows)
+            after_key = rows[-1]['cache_key'] if rows else after_key
+        reader.close()
+        if reader.complete:
+            log.info('%s is already complete (%i rows)', path, total)
+            return total
+
+        log.info('Resuming export of %s after %i rows (key %s)', cache.tablename, total, after_key)
+        fh = open(path, 'r+b')
+        fh.seek(reader.valid_offset)
+        fh.truncate()
+    else:
+        fh = open(path, 'wb')
+        header_data = json.dumps(header).encode('utf-8')
+        fh.write(MAGIC + UINT32.pack(len(header_data)) + header_data)
+
+    try:
+        while True:
+            rows = cache.backend.export_rows(after_key, chunk_rows, **filters)
+            if not rows:
+                break
+            _write_chunk(fh, rows)
+            fh.flush()
+            total += len(rows)
+            after_key = rows[-1]['cache_key']
+            log.info('Exported %i rows from %s', total, cache.tablename)
+        fh.write(DONE_MARK + UINT32.pack(total))
+    finally:
+        fh.close()
+    return total
+
+
+def _row_matches(row, min_version=None, max_version=None, since=None, until=None):
+    if min_version is not None and row['version'] < min_version:
+        return False
+    if max_version is not None and row['version'] > max_version:
+        return False
+    created = None if row['date_created'] is None else SQLdatetime(row['date_created'])
+    if since is not None and (created is None or created < SQLdatetime(since)):
+        return False
+    if until is not None and (created is None or created >= SQLdatetime(until)):
+        return False
+    return True
+
+
+def import_snapshot(cache, path, overwrite=False, resume=True, **filters):
+    """ Bulk-loads a snapshot file into the table of `cache` (an SQLCache instance), one transaction per
+    chunk, via the backend's fastest load path (see CacheBackend.load_rows).
+
+    Progress is recorded in "<path>.progress", so that an interrupted import resumes with the next
+    chunk (if resume is True).
+
+    Keywords (filters): as for export_snapshot.
+
+    :param cache: SQLCache instance
+    :param path: (str) snapshot file path
+    :param overwrite: (bool) whether to replace entries already in the table [default: False]
+    :param resume: (bool) whether to continue an interrupted import [default: True]
+    :return: number of rows loaded
+    :raises: SnapshotError if snapshot is corrupt or of a different table
+    """
+    reader = SnapshotReader(path)
+    if reader.header['tablename'] != cache.tablename:
+        reader.close()
+        raise SnapshotError('%s is a snapshot of %s, not %s' % (path, reader.header['tablename'], cache.tablename))
+
+    progress_path = path + '.progress'
+    done_chunks = 0
+    if resume and os.path.exists(progress_path):
+        with open(progress_path) as fh:
+            done_chunks = int(fh.read().strip() or 0)
+        log.info('Resuming import of %s at chunk %i', path, done_chunks)
+
+    cache.create_table()
+    loaded = 0
+    try:
+        for idx, rows in reader.chunks():
+            if idx < done_chunks:
+                continue
+            rows = [row for row in rows if _row_matches(row, **filters)]
+            if rows:
+                cache.backend.load_rows(rows, overwrite)
+                loaded += len(rows)
+            with open(progress_path, 'w') as fh:
+                fh.write('%i' % (idx + 1))
+            log.info('Loaded %i rows into %s', loaded, cache.tablename)
+    finally:
+        reader.close()
+
+    if not reader.complete:
+        raise SnapshotError('%s is incomplete (export did not finish); loaded %i rows' % (path, loaded))
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    if cache.l1 is not None:
+        cache.l1.clear()
+    return loaded
@@ -4,23 +4,117 @@ import hashlib
 import pickle
 #import json
 import simplejson as json
+import time
 import logging
-from datetime import datetime
-
-import MySQLdb as mdb
+from datetime import datetime, timedelta
 
 from medgen.config import config as medgen_config
 #from medgen.db.dataset import SQLData, SQLdatetime
 
-from aminosearch.sqldata import SQLData, SQLdatetime
+from aminosearch.sqldata import SQLData
+
+from .config import get_cache_setting
+from .lru import LRUCache
+from .singleflight import SingleFlight
+from .cache_janitor import AccessTracker, JANITOR
+from .metrics import METRICS, timed
+from .cache_migration import MIGRATIONS
+from .writebehind import WRITE_BEHIND
+from .cache_backends import get_backend
+from .cache_codecs import ValueCodec, decode_value
 
 log = logging.getLogger('text2gene.sqlcache')
 
+# values of the "negative" column of cache tables.
+NEGATIVE_NONE = 0
+NEGATIVE_EMPTY = 1
+NEGATIVE_FAILURE = 2
+
+# failures are always stored as plain JSON, whatever the service's codec.
+FAILURE_CODEC = ValueCodec('json')
+
+EVICTION_POLICIES = ('lru', 'lfu')
+
+# statuses returned by SQLCache.lookup().
+HIT = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+
+
+class NegativeResult(object):
+    """ Returned by SQLCache.retrieve() in place of a value when the cache remembers that computing it
+    failed (see SQLCache.store_failure).  Evaluates as False.
+    """
+
+    def __init__(self, error, message):
+        self.error = error
+        self.message = message
+
+    @classmethod
+    def from_exception(cls, error):
+        return cls(error.__class__.__name__, '%s' % error)
+
+    def to_dict(self):
+        return {'error': self.error, 'message': self.message}
+
+    def to_exception(self, error_classes):
+        """ Recreates the original exception, if its class is among error_classes (else a Text2GeneError). """
+        for error_class in error_classes:
+            if error_class.__name__ == self.error:
+                return error_class(self.message)
+        from .exceptions import Text2GeneError
+        return Text2GeneError('%s: %s' % (self.error, self.message))
+
+    def __bool__(self):
+        return False
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<NegativeResult %s: %s>' % (self.error, self.message)
+
 
 class SQLCache(SQLData):
     """ Subclass of SQLData that stores simple key-value pairs on a unique-key-indexed
     table within the text2gene database.  (Needs to already exist with same authorization
     params as medgen.)  The table can be dynamically created when needed.
+
+    Optionally, an in-process L1 cache (see text2gene.lru.LRUCache) sits in front of the table,
+    holding already-deserialized values so that repeat lookups skip both MySQL and load_cache_value().
+    Every L1 hit is a deep copy, so callers may mutate what they get back.
+    It is configured per servicename in the [cache] section of the text2gene config (l1_entries,
+    l1_bytes, l1_ttl); l1_entries = 0 disables it.
+
+    Negative results are cached too, but expire sooner than ordinary values: empty results (see is_empty)
+    after "negative_ttl" seconds, and failures of computations that raised one of CACHEABLE_ERRORS (see
+    store_failure) after "failure_ttl" seconds.  An expired negative entry is treated as a miss.
+
+    Cache hits are counted per entry (hit_count, last_accessed columns) in memory and written in
+    batches by a background thread (see text2gene.cache_janitor) every "access_flush_interval" seconds;
+    "track_access = false" turns this off.  evict() uses these statistics to keep a table within the
+    "max_rows" and "max_bytes" budgets of its service, and deletes entries older than "ttl" seconds.
+
+    Hits, misses, bytes read and written, and latencies of lookups, stores and computations on misses
+    are recorded per servicename in text2gene.metrics.METRICS.
+
+    Reads never write to the table.  Entries stored under an older VERSION count as misses, and are
+    overwritten when the caller stores a fresh value; or, if the "serve_stale" setting is on and the
+    caller supplies a way to recompute the value, they are returned as they are (see lookup) while
+    a background worker recomputes them, hottest first (see text2gene.cache_migration).
+
+    With the "write_behind" setting on, store() and the granular writes return without waiting for the
+    database: writes are queued and committed in batches by a background thread (see
+    text2gene.writebehind).  Other processes may then miss an entry for up to a flush interval.
+
+    Rows are kept by a storage backend (see text2gene.cache_backends), also chosen per servicename
+    via the "backend" setting of the [cache] section: "mysql" (default) or "sqlite".
+
+    Values are stored in the cache_blob column, encoded with the codec named by the "codec" setting
+    of the [cache] section (see text2gene.cache_codecs) [default: DEFAULT_CODEC].
+
+    Cache misses should be filled via compute_and_store(), which makes sure that concurrent misses for
+    the same key (from threads of this process, or from other processes and hosts sharing the cache
+    table) wait for a single computation instead of each running it.  Waits are bounded by the
+    "lock_timeout" setting (seconds) of the [cache] section; "singleflight = false" turns coalescing off.
     """
 
     DBNAME = 'text2gene'
@@ -33,6 +127,22 @@ class SQLCache(SQLData):
 
     VERSION = 0
 
+    DEFAULT_CODEC = 'json+zlib'
+
+    # True if get_cache_value() returns JSON text (rather than a JSON-serializable structure), i.e. if
+    # legacy rows in the JSON cache_value column should be handed to load_cache_value() undecoded.
+    JSON_TEXT_VALUE = False
+
+    # number of cache keys resolved per "IN (...)" statement in get_rows() and retrieve_many().
+    CHUNK_SIZE = 500
+
+    # number of rows written per multi-row insert statement in store_many().
+    STORE_CHUNK_SIZE = 100
+
+    # exceptions that deterministically result from the input (e.g. unparseable HGVS), and so can be
+    # remembered by compute_and_store() instead of being recomputed on every request.
+    CACHEABLE_ERRORS = ()
+
     def __init__(self, servicename, *args, **kwargs):
         self._db_host = self.DBHOST
         self._db_user = self.DBUSER
@@ -43,7 +153,43 @@ class SQLCache(SQLData):
         self.servicename = servicename
         self.tablename = kwargs.get('tablename', self.TABLENAME_FORMAT.format(self.servicename))
 
-        self.conn = None
+        self.backend = get_backend(self)
+        self.codec = ValueCodec(get_cache_setting(servicename, 'codec', self.DEFAULT_CODEC))
+
+        self.singleflight = get_cache_setting(servicename, 'singleflight', True)
+        self.lock_timeout = get_cache_setting(servicename, 'lock_timeout', 30)
+        self._inflight = SingleFlight()
+
+        self.serve_stale = get_cache_setting(servicename, 'serve_stale', False)
+        self.write_behind = get_cache_setting(servicename, 'write_behind', False)
+
+        self.negative_ttl = get_cache_setting(servicename, 'negative_ttl', 7 * 86400)
+        self.failure_ttl = get_cache_setting(servicename, 'failure_ttl', self.negative_ttl)
+
+        # eviction policy (see evict); 0 means unbounded.
+        self.ttl = get_cache_setting(servicename, 'ttl', 0)
+        self.max_rows = get_cache_setting(servicename, 'max_rows', 0)
+        self.max_bytes = get_cache_setting(servicename, 'max_bytes', 0)
+        self.eviction_policy = get_cache_setting(servicename, 'eviction', 'lru').lower()
+        if self.eviction_policy not in EVICTION_POLICIES:
+            raise ValueError('Unknown eviction policy "%s" configured for %s' % (self.eviction_policy, servicename))
+        self.evict_chunk = get_cache_setting(servicename, 'evict_chunk', 500)
+        self.evict_pause = get_cache_setting(servicename, 'evict_pause', 0.1)
+        self.evict_interval = get_cache_setting(servicename, 'evict_interval', 0)
+
+        self.access = None
+        self.access_flush_interval = get_cache_setting(servicename, 'access_flush_interval', 60)
+        if get_cache_setting(servicename, 'track_access', True):
+            self.access = AccessTracker()
+            JANITOR.register(self)
+
+        self.l1 = None
+        l1_entries = get_cache_setting(servicename, 'l1_entries', 0)
+        if l1_entries > 0:
+            self.l1 = LRUCache(max_entries=l1_entries,
+                               max_bytes=get_cache_setting(servicename, 'l1_bytes', 64 * 1024 * 1024),
+                               ttl=get_cache_setting(servicename, 'l1_ttl', 3600),
+                               copy_values=True)
 
     def get_cache_key(self, querydict):
         """ Default method to make a unique cache key from an input dictionary.
@@ -51,10 +197,68 @@ class SQLCache(SQLData):
         return hashlib.md5(pickle.dumps(sorted(querydict.items()))).hexdigest()
 
     def get_cache_value(self, value):
-        """ Default method to turn a serializable data structure into a storable and
-        reconstructable mysql blob value.  (Uses json.dumps and strips out literal "\'")
+        """ Default method to turn a value into something the configured codec can serialize.
+        (Returns value unchanged; override in your subclass for objects that need converting.)
         """
-        return json.dumps(value).replace("\'", '')        # get rid of literal "\'" which mysql will choke on.
+        return value
+
+    def load_cache_value(self, cache_value):
+        """ Default method to reconstruct a value from what get_cache_value() returned.
+        (Returns cache_value unchanged.)
+
+        Override in your subclass if get_cache_value() has been overridden.
+        """
+        return cache_value
+
+    def is_empty(self, value):
+        """ Returns True if value is an empty result (cached for negative_ttl seconds only). """
+        return isinstance(value, (list, tuple, dict)) and not value
+
+    def encode_value(self, value):
+        """ :return: (bytes) value as stored in the cache_blob column """
+        return self.codec.encode(self.get_cache_value(value))
+
+    def make_row(self, querydict, value):
+        """ :return: (cache_key, cache_blob, version, negative) tuple for the storage backend """
+        negative = NEGATIVE_EMPTY if self.is_empty(value) else NEGATIVE_NONE
+        return (self.get_cache_key(querydict), self.encode_value(value), self.VERSION, negative)
+
+    def decode_row(self, row):
+        """ Reconstructs the value stored in a cache table row, whichever codec it was stored with.
+
+        Rows stored before value codecs existed are read from the JSON cache_value column.
+
+        Cached failures are returned as NegativeResult objects.
+        """
+        if row.get('negative', None) == NEGATIVE_FAILURE:
+            result = decode_value(row['cache_blob'])
+            return NegativeResult(result['error'], result['message'])
+        if row.get('cache_blob', None) is not None:
+            return self.load_cache_value(decode_value(row['cache_blob']))
+        if self.JSON_TEXT_VALUE:
+            return self.load_cache_value(row['cache_value'])
+        return self.load_cache_value(json.loads(row['cache_value']))
+
+    @staticmethod
+    def _row_size(row):
+        return len(row['cache_blob'] if row.get('cache_blob', None) is not None else row['cache_value'])
+
+    def _negative_ttl(self, negative):
+        if negative == NEGATIVE_FAILURE:
+            return self.failure_ttl
+        elif negative == NEGATIVE_EMPTY:
+            return self.negative_ttl
+        return None
+
+    def _negative_expired(self, row):
+        """ Returns True if row holds a negative result that is older than its TTL. """
+        ttl = self._negative_ttl(row.get('negative', None))
+        if ttl is None or row.get('date_created', None) is None:
+            return False
+        return row['date_created'] < datetime.now() - timedelta(seconds=ttl)
+
+    def _l1_put_row(self, key, row, value):
+        self._l1_put(key, row['version'], value, self._row_size(row), self._negative_ttl(row.get('negative', None)))
 
     def update(self, fv_dict):
         """
@@ -70,14 +274,14 @@ class SQLCache(SQLData):
         """ Takes a query dictionary containing "defining arguments" for the resultant value to be 
         cached and the value, stores this as cache_key - cache_value in the cache DB.
 
-        The value MUST be serializable to JSON.  
+        The value MUST be serializable by the configured codec (e.g. to JSON for "json+zlib").
 
-        json.dumps(value) will be tried by default; override the get_cache_value() method 
-        in your subclass to construct JSON another way if needed.
+        Override the get_cache_value() and load_cache_value() methods in your subclass to convert
+        values that need it (see VariantLVGCached).
 
         If an entry with previously stored querydict exists, entry will be updated with date_created 
-        set to datetime.now().  This behavior can be changed to ignoring the update by setting 
-        update_if_duplicate to False (default: True).
+        set to now() in the same statement (insert ... on duplicate key update).  This behavior can be
+        changed to ignoring the update by setting update_if_duplicate to False (default: True).
 
         Override self.get_cache_key to implement a different approach to turning `querydict` arg into 
         hashable key.
@@ -85,50 +289,199 @@ class SQLCache(SQLData):
         Keywords:
            update_if_duplicate: (bool) see note above.
 
+        In write-behind mode (see class docstring), the entry is queued rather than written at once
+        (unless update_if_duplicate=False); it only goes into the L1 cache once it has been queued.
+
         :param querydict: serializable
-        :param value: JSON-serializable value
-        :return: True if successful
-        :raises: MySQLdb exceptions and json serialization errors
+        :param value: serializable value
+        :return: True if successful (False if entry existed and update_if_duplicate=False, or if the
+                 write-behind queue was full)
+        :raises: database exceptions and serialization errors
         """
-        fv_dict = {'cache_key': self.get_cache_key(querydict), 
-                   'cache_value': self.get_cache_value(value),
-                   'version': self.VERSION,
-                  }
-        try:
-            self.insert(self.tablename, fv_dict)
-        except mdb.IntegrityError:
-            if kwargs.get('update_if_duplicate', True):
-                # update entry with current time
-                return self.update(fv_dict)
-            else:
+        row = self.make_row(querydict, value)
+        if self.write_behind and kwargs.get('update_if_duplicate', True):
+            # a dropped write must not be served from L1 either, or this process would disagree with the DB.
+            if not WRITE_BEHIND.put_row(self, row):
+                self._l1_invalidate(row[0])
                 return False
+            self._count_stored([row])
+            self._l1_put(row[0], self.VERSION, value, len(row[1]), self._negative_ttl(row[3]))
+            return True
 
-        return True
+        with METRICS.timer(self.servicename, 'store'):
+            affected = self.backend.store_rows([row], kwargs.get('update_if_duplicate', True))
+        self._count_stored([row])
+        if affected > 0:
+            self._l1_put(row[0], self.VERSION, value, len(row[1]), self._negative_ttl(row[3]))
+            return True
+        self._l1_invalidate(row[0])
+        return False
+
+    def store_failure(self, querydict, error):
+        """ Remembers that computing the value for querydict raised `error`; retrieve() will return a
+        NegativeResult for it for the next failure_ttl seconds.
+
+        :param querydict:
+        :param error: exception instance
+        :return: NegativeResult
+        """
+        result = NegativeResult.from_exception(error)
+        row = (self.get_cache_key(querydict), FAILURE_CODEC.encode(result.to_dict()), self.VERSION, NEGATIVE_FAILURE)
+        if self.write_behind:
+            if not WRITE_BEHIND.put_row(self, row):
+                self._l1_invalidate(row[0])
+                return result
+        else:
+            self.backend.store_rows([row])
+        self._count_stored([row])
+        self._l1_put(row[0], self.VERSION, result, len(row[1]), self.failure_ttl)
+        return result
+
+    def raise_if_failure(self, value):
+        """ Raises the exception recorded in value if it is a NegativeResult; otherwise returns value. """
+        if isinstance(value, NegativeResult):
+            raise value.to_exception(self.CACHEABLE_ERRORS)
+        return value
+
+    def store_many(self, items, **kwargs):
+        """ Bulk version of store(): takes a list of (querydict, value) pairs and writes them all
+        in a single transaction, STORE_CHUNK_SIZE rows per multi-row insert statement.
+
+        Keywords:
+           update_if_duplicate: (bool) see store() [default: True]
+
+        :param items: list of (querydict, value) tuples
+        :return: number of entries written
+        :raises: database exceptions and serialization errors (transaction is rolled back)
+        """
+        update_if_duplicate = kwargs.get('update_if_duplicate', True)
+
+        items = list(items)
+        rows = [self.make_row(querydict, value) for querydict, value in items]
+        if not rows:
+            return 0
+
+        with METRICS.timer(self.servicename, 'store_many'):
+            self.backend.store_rows(rows, update_if_duplicate, self.STORE_CHUNK_SIZE)
+        self._count_stored(rows)
+
+        for row, (_, value) in zip(rows, items):
+            if update_if_duplicate:
+                self._l1_put(row[0], self.VERSION, value, len(row[1]), self._negative_ttl(row[3]))
+            else:
+                self._l1_invalidate(row[0])
+
+        log.debug('Stored %i entries in %s.', len(rows), self.tablename)
+        return len(rows)
+
+    def insert_granular(self, tablename, entries):
+        """ Inserts entries (list of field-value dicts) into granular table `tablename` via batch_insert,
+        or queues them for doing so in write-behind mode.
+        """
+        if not entries:
+            return
+        if self.write_behind:
+            WRITE_BEHIND.put_insert(self, tablename, entries)
+        else:
+            self.batch_insert(tablename, entries)
+
+    def replace_granular(self, tablename, key_column, key, entries):
+        """ Replaces the rows of granular table `tablename` whose key_column is key with entries (list of
+        field-value dicts with identical fields) in one transaction, or queues the replacement as one
+        unit in write-behind mode.
+        """
+        if self.write_behind:
+            WRITE_BEHIND.put_replace(self, tablename, key_column, key, entries)
+        else:
+            self.replace_rows(tablename, key_column, {key: entries})
 
     def delete(self, querydict):
-        sql = 'delete from {db.tablename} where cache_key="%s"'.format(db=self)
-        self.execute(sql % self.get_cache_key(querydict))
+        key = self.get_cache_key(querydict)
+        self._l1_invalidate(key)
+        self.backend.delete_keys([key])
+
+    def delete_many(self, querydicts):
+        """ Deletes entries for all supplied querydicts, CHUNK_SIZE keys per statement.
 
-    def retrieve(self, querydict, version=0):
+        :param querydicts: list of querydicts
+        """
+        keys = list(set([self.get_cache_key(querydict) for querydict in querydicts]))
+        for key in keys:
+            self._l1_invalidate(key)
+        for idx in range(0, len(keys), self.CHUNK_SIZE):
+            self.backend.delete_keys(keys[idx:idx + self.CHUNK_SIZE])
+
+    def retrieve(self, querydict, version=0, recompute=None):
         """ If cache contains a value for this querydict, return it. Otherwise, return None.
 
-        If requested version number is GREATER THAN OR EQUAL TO version number of existing data, older 
-        version will be destroyed so that newer version can be created in its place.
+        Entries with a version number lower than the requested version count as absent (the caller's
+        fresh value will replace them), unless stale entries may be served (see lookup).
 
         Thus, supplying version=0 allows returns from cache from *any* version of data that has ever been stored.
 
+        Empty results are returned as such (e.g. []); remembered failures as a NegativeResult (see
+        raise_if_failure).  Negative entries past their TTL count as absent.
+
         :param querydict:
         :param version: (int) only return results from cache with greater than or equal version number [default: 0]
+        :param recompute: callable returning a fresh value for querydict (see lookup) [default: None]
         :return: value at this cache location, or None
         """
+        return self.lookup(querydict, version, recompute)[0]
+
+    @timed('retrieve')
+    def lookup(self, querydict, version=0, recompute=None):
+        """ Like retrieve(), but also reports how the value was found: HIT, MISS, or STALE.
+
+        STALE means the entry was stored under an older version than requested, and is returned as it
+        is because this service has serve_stale on and `recompute` was supplied; recompute() will be
+        run in the background to replace it (see text2gene.cache_migration).
+
+        :param querydict:
+        :param version: (int) minimum version of a fresh entry [default: 0]
+        :param recompute: callable returning a fresh value for querydict [default: None]
+        :return: (value, status) tuple -- value is None if status is MISS
+        """
+        return self._lookup(querydict, version, recompute)
+
+    def _lookup(self, querydict, version=0, recompute=None, record=True):
+        # (record=False for internal re-checks, which should not show up in statistics.)
+        key = self.get_cache_key(querydict)
+        value = self._l1_get(key, version)
+        if value is not None:
+            if record:
+                self._count_hit(key, value, l1=True)
+            return value, HIT
+
         row = self.get_row(querydict)
         if row:
             if row['version'] >= version:
-                return json.loads(row['cache_value'])            #.decode('string_escape'))
-            else:
-                log.debug('Expiring obsolete entry at cache_key location %s.', self.get_cache_key(querydict))
-                self.delete(querydict)
-        return None
+                if self._negative_expired(row):
+                    if record:
+                        self._count_miss('negative_expired')
+                    return None, MISS
+                value = self.decode_row(row)
+                self._l1_put_row(key, row, value)
+                if record:
+                    self._count_hit(key, value, nbytes=self._row_size(row))
+                return value, HIT
+
+            elif self.serve_stale and recompute is not None and not self._negative_expired(row):
+                log.debug('Serving stale entry at cache_key location %s (version %i < %i).', key,
+                          row['version'], version)
+                MIGRATIONS.enqueue(self, querydict, recompute, priority=row.get('hit_count', None) or 0)
+                if record:
+                    METRICS.incr(self.servicename, 'stale_served')
+                    self._record_access(key)
+                return self.decode_row(row), STALE
+
+            if record:
+                self._count_miss('version_expired')
+            return None, MISS
+
+        if record:
+            self._count_miss()
+        return None, MISS
 
     def get_row(self, querydict):
         """ If cache contains a value for this querydict, return entire row (as dict). Otherwise, return None.
@@ -136,63 +489,339 @@ class SQLCache(SQLData):
         :param querydict:
         :return: dictionary representing entire row for this query dictionary
         """
+        return self.backend.fetch_row(self.get_cache_key(querydict))
+
+    def get_rows(self, querydicts):
+        """ Fetch all rows present in the cache for the supplied querydicts, using one
+        "where cache_key in (...)" query per CHUNK_SIZE keys.
+
+        Rows are keyed by lowercased cache_key, since the cache_key column collation is
+        case-insensitive (same matching behavior as get_row).
+
+        :param querydicts: list of querydicts
+        :return: dictionary of lowercased cache_key -> row (as dict)
+        """
+        keys = list(set([self.get_cache_key(querydict) for querydict in querydicts]))
+        rows = {}
+        for idx in range(0, len(keys), self.CHUNK_SIZE):
+            for row in self.backend.fetch_rows(keys[idx:idx + self.CHUNK_SIZE]):
+                rows[row['cache_key'].lower()] = row
+        return rows
+
+    def _current(self, row, version):
+        return row is not None and row['version'] >= version and not self._negative_expired(row)
+
+    def contains(self, querydict, version=0):
+        """ Returns True if the cache holds a current entry (see retrieve) for querydict, without
+        decoding it or counting it as a hit.
+        """
         key = self.get_cache_key(querydict)
-        sql = 'SELECT * from ' + self.tablename + ' where cache_key = %s limit 1'
-        return self.fetchrow(sql, key)
+        if self._l1_get(key, version) is not None:
+            return True
+        return self._current(self.get_row(querydict), version)
 
-    def _create_triggers(self):
-        sql = """create trigger `{db.tablename}_new_entry_date` before INSERT on `{db.tablename}`
-                for each row set new.date_created = now()""".format(db=self)
-        self.execute(sql)
+    def contains_many(self, querydicts, version=0):
+        """ Bulk version of contains(): returns the set of cache_keys (as returned by get_cache_key)
+        among querydicts that hold a current entry.
+        """
+        rows = self.get_rows(querydicts)
+        found = set()
+        for querydict in querydicts:
+            key = self.get_cache_key(querydict)
+            if self._current(rows.get(key.lower(), None), version):
+                found.add(key)
+        return found
+
+    @timed('retrieve_many')
+    def retrieve_many(self, querydicts, version=0):
+        """ Bulk version of retrieve(): resolves all supplied querydicts in as few round trips
+        as possible (see get_rows) and sorts them into hits, misses, and version-expired entries,
+        so that callers need only compute values for what is not returned as a hit.
+
+        As with retrieve(), obsolete entries (version lower than requested) are left for the caller's
+        fresh values to replace.
+
+        Querydicts resolving to the same cache_key are only reported once.
+
+        :param querydicts: list of querydicts
+        :param version: (int) only return results from cache with greater than or equal version number [default: 0]
+        :return: (hits, misses, expired) -- hits is a dictionary of cache_key -> value; misses and expired
+                 are lists of querydicts (in input order).
+        """
+        hits = {}
+        misses = []
+        expired = []
+
+        # resolve what we can from the L1 cache before going to the table.
+        remaining = []
+        seen = set()
+        for querydict in querydicts:
+            key = self.get_cache_key(querydict)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            value = self._l1_get(key, version)
+            if value is not None:
+                hits[key] = value
+                self._count_hit(key, value, l1=True)
+            else:
+                remaining.append(querydict)
+
+        rows = self.get_rows(remaining)
+
+        for querydict in remaining:
+            key = self.get_cache_key(querydict)
+            row = rows.get(key.lower(), None)
+            if row is None:
+                misses.append(querydict)
+                self._count_miss()
+            elif row['version'] >= version and self._negative_expired(row):
+                misses.append(querydict)
+                self._count_miss('negative_expired')
+            elif row['version'] >= version:
+                hits[key] = self.decode_row(row)
+                self._l1_put_row(key, row, hits[key])
+                self._count_hit(key, hits[key], nbytes=self._row_size(row))
+            else:
+                expired.append(querydict)
+                self._count_miss('version_expired')
+
+        return hits, misses, expired
+
+    def _count_hit(self, key, value, l1=False, nbytes=0):
+        METRICS.incr(self.servicename, 'hits')
+        if l1:
+            METRICS.incr(self.servicename, 'l1_hits')
+        if nbytes:
+            METRICS.incr(self.servicename, 'bytes_read', nbytes)
+        if isinstance(value, NegativeResult) or self.is_empty(value):
+            METRICS.incr(self.servicename, 'negative_hits')
+        self._record_access(key)
+
+    def _count_miss(self, reason=None):
+        METRICS.incr(self.servicename, 'misses')
+        if reason:
+            METRICS.incr(self.servicename, reason)
+
+    def _count_stored(self, rows):
+        METRICS.incr(self.servicename, 'stores', len(rows))
+        METRICS.incr(self.servicename, 'bytes_written', sum(len(row[1]) for row in rows))
+
+    def compute_and_store(self, querydict, compute, version=0, recheck=True):
+        """ Fills a cache miss: runs compute() and stores its return value at querydict.  If compute()
+        raises one of CACHEABLE_ERRORS, the failure is stored instead (see store_failure) and re-raised.
+
+        Concurrent callers for the same cache key are coalesced: within this process they wait for
+        the first caller's computation and share its result (or exception); across processes, the
+        computation runs under an advisory lock on the key (see CacheBackend.acquire_lock), and the
+        cache is checked again once the lock is held, so that waiters pick up the value stored by
+        whoever held the lock before them.  Waits longer than lock_timeout give up and compute anyway.
+
+        :param querydict: as for store()
+        :param compute: callable taking no arguments, returning value to be cached
+        :param version: (int) minimum version acceptable when re-checking the cache [default: 0]
+        :param recheck: (bool) whether to re-check the cache after acquiring the lock [default: True]
+        :return: (value, computed) -- computed is False if value came from another caller or the cache
+        :raises: whatever compute() raises (or raised for another caller, if cached as a failure)
+        """
+        if not self.singleflight:
+            return self._compute_and_store(querydict, compute), True
 
-        sql = """create trigger `{db.tablename}_update` before UPDATE on `{db.tablename}`
-                for each row set new.date_created = now()""".format(db=self)
-        self.execute(sql)
+        key = self.get_cache_key(querydict)
 
-    def create_table(self, reset=False):
-        if reset:
-            self.execute("DROP TABLE IF EXISTS {}".format(self.tablename))
+        def locked_compute():
+            locked = self.backend.acquire_lock(key, self.lock_timeout)
+            if not locked:
+                log.warning('Timed out after %i seconds waiting for lock on %s in %s; computing anyway.',
+                            self.lock_timeout, key, self.tablename)
+            try:
+                if recheck:
+                    value, _ = self._lookup(querydict, version=version, record=False)
+                    if value is not None:
+                        return self.raise_if_failure(value), False
+                return self._compute_and_store(querydict, compute), True
+            finally:
+                if locked:
+                    self.backend.release_lock(key)
+
+        (value, computed), shared = self._inflight.do(key.lower(), locked_compute, self.lock_timeout)
+        computed = computed and not shared
+        if not computed:
+            METRICS.incr(self.servicename, 'coalesced')
+        return value, computed
+
+    def _compute_and_store(self, querydict, compute):
+        METRICS.incr(self.servicename, 'computes')
+        try:
+            with METRICS.timer(self.servicename, 'compute'):
+                value = compute()
+        except self.CACHEABLE_ERRORS as error:
+            METRICS.incr(self.servicename, 'compute_errors')
+            self.store_failure(querydict, error)
+            raise
+        except Exception:
+            METRICS.incr(self.servicename, 'compute_errors')
+            raise
+        self.store(querydict, value)
+        return value
+
+    def _record_access(self, key):
+        if self.access is not None:
+            self.access.record(key)
+            JANITOR.ensure_running()
+
+    def flush_access(self):
+        """ Writes hit counts recorded since the last flush to the table (last_accessed, hit_count).
+
+        :return: number of entries updated
+        """
+        if self.access is None:
+            return 0
+        counts = self.access.drain()
+        if counts:
+            self.backend.touch_keys(counts)
+            log.debug('Flushed access statistics for %i entries in %s', len(counts), self.tablename)
+        return len(counts)
+
+    def evict(self, ttl=None, max_rows=None, max_bytes=None, policy=None):
+        """ Deletes entries older than ttl seconds, then evicts entries (least recently used first for
+        policy "lru", least frequently used first for "lfu") until the table holds at most max_rows
+        entries and max_bytes of values.  Parameters default to this service's configured policy;
+        0 means no limit.
+
+        Entries are deleted by primary key, evict_chunk at a time with evict_pause seconds in between,
+        so that readers of the table are never blocked for long.  Only one process evicts from a table
+        at a time (others return immediately).
+
+        :return: number of entries deleted
+        """
+        ttl = self.ttl if ttl is None else ttl
+        max_rows = self.max_rows if max_rows is None else max_rows
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        policy = (policy or self.eviction_policy).lower()
+        if policy not in EVICTION_POLICIES:
+            raise ValueError('Unknown eviction policy "%s"' % policy)
 
-        sql = """CREATE TABLE {} (
-                cache_key VARCHAR(255) primary key not null,
-                cache_value JSON default NULL,
-                date_created DATETIME default NULL,
-                version int(11) default 0
-              ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci""".format(self.tablename)
+        if not self.backend.acquire_lock('__evict__', 0):
+            log.info('Eviction already running for %s; skipping.', self.tablename)
+            return 0
 
         try:
-            self.execute(sql)
-            self._create_triggers()
-            return True
-        except mdb.OperationalError as error:
-            if error.args[0] == 1050:
-                # if table already exists, we're fine.
-                return True
+            # make sure recent hits count towards the choice of entries to evict.
+            self.flush_access()
+
+            deleted = 0
+            if ttl > 0:
+                deleted += self._delete_created_before(datetime.now() - timedelta(seconds=ttl))
+
+            if max_rows > 0:
+                excess = self.backend.count() - max_rows
+                while excess > 0:
+                    victims = self.backend.eviction_candidates(policy, min(excess, self.evict_chunk))
+                    if not victims:
+                        break
+                    deleted += self._delete_keys([key for key, _ in victims])
+                    excess -= len(victims)
+
+            if max_bytes > 0:
+                excess = self.backend.total_bytes() - max_bytes
+                while excess > 0:
+                    victims = self.backend.eviction_candidates(policy, self.evict_chunk)
+                    if not victims:
+                        break
+                    deleted += self._delete_keys([key for key, _ in victims])
+                    excess -= sum(size for _, size in victims)
+        finally:
+            self.backend.release_lock('__evict__')
+
+        log.info('Evicted %i entries from %s (policy: %s)', deleted, self.tablename, policy)
+        return deleted
+
+    def _delete_keys(self, keys):
+        for key in keys:
+            self._l1_invalidate(key)
+        self.backend.delete_keys(keys)
+        if self.evict_pause:
+            time.sleep(self.evict_pause)
+        return len(keys)
+
+    def _delete_created_before(self, before):
+        deleted = 0
+        while True:
+            keys = self.backend.keys_created_before(before, self.evict_chunk)
+            if not keys:
+                return deleted
+            deleted += self._delete_keys(keys)
+
+    def _l1_get(self, key, version=0):
+        """ Returns value held in the L1 cache for key if it satisfies requested version, else None. """
+        if self.l1 is None:
+            return None
+        entry = self.l1.get(key)
+        if entry is not None and entry[0] >= version:
+            return entry[1]
+        return None
 
-            raise mdb.OperationalError(error.args)
+    def _l1_put(self, key, version, value, size, ttl=None):
+        if self.l1 is not None:
+            self.l1.put(key, (version, value), size, ttl)
 
-    def drop_table(self):
-        super(SQLCache, self).drop_table(self.tablename)
+    def _l1_invalidate(self, key):
+        if self.l1 is not None:
+            self.l1.invalidate(key)
 
-    def reset(self, before=None):
-        # UNTESTED!
-        # TODO: test:
+    def l1_stats(self):
+        """ Returns hit/miss counters and occupancy of the L1 cache (or None if L1 is disabled). """
+        if self.l1 is None:
+            return None
+        return self.l1.stats()
 
-        sql = "DELETE FROM {db.tablename} where date_created < ".format(db=self)
+    def upgrade_table(self):
+        """ Brings a cache table created by an older version of text2gene up to the current schema. """
+        self.backend.upgrade_table()
 
-        if before:
-            before = SQLdatetime(before)
-        else:
-            before = SQLdatetime(datetime.now())
+    def create_table(self, reset=False):
+        return self.backend.create_table(reset)
+
+    def migrate_values(self, chunk_size=500):
+        """ Re-encodes rows still stored in the legacy JSON cache_value column with this service's
+        codec, chunk_size rows per transaction.  Versions and dates of entries are kept as they are.
 
-        sql += '"%s"' % before
+        Run upgrade_table() first on tables created by older versions of text2gene.
 
-        self.execute(sql)
+        :return: number of rows migrated
+        """
+        migrated = 0
+        while True:
+            rows = self.backend.fetch_legacy_rows(chunk_size)
+            if not rows:
+                break
+            pairs = [(row['cache_key'], self.encode_value(self.decode_row(row))) for row in rows]
+            self.backend.replace_blobs(pairs)
+            migrated += len(pairs)
+            log.info('Migrated %i legacy entries in %s', migrated, self.tablename)
+        return migrated
+
+    def drop_table(self):
+        if self.l1 is not None:
+            self.l1.clear()
+        self.backend.drop_table()
+
+    def reset(self, before=None):
+        """ Deletes all entries created before `before` (datetime or rfc3339 string) [default: now],
+        evict_chunk at a time.
+
+        :return: number of entries deleted
+        """
+        deleted = self._delete_created_before(before or datetime.now())
+        if self.l1 is not None:
+            self.l1.clear()
+        return deleted
 
     def size(self):
         """ Counts number of rows currently in table.
 
         :return: (long) length of table in number of rows
         """
-        result = self.execute("SELECT count(*) as cnt from {db.tablename}".format(db=self))
-        return result.record[0]['cnt']
+        return self.backend.count()
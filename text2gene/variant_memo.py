@@ -0,0 +1,167 @@
+""" Memoized HGVS parsing and VariantComponents derivation, shared by every module of text2gene.
+
+Serving one request parses the same HGVS strings many times over (LVG, PubTator and Clinvar lookups,
+Google query expansion, page rendering), and so do the batch scripts in sbin/.  The functions
+here return the same objects for the same variant, keyed by its canonical string (see
+text2gene.normalize.hgvs_cache_key):
+
+    Variant(hgvs_text_or_seqvar)        -> SequenceVariant (or None if unparseable), as metavariant.Variant
+    Components(hgvs_text_or_seqvar)     -> VariantComponents; raises RejectedSeqVar, as VariantComponents(seqvar)
+    PoseditSlang(hgvs_text_or_seqvar)   -> (posedit, slang) of the VariantComponents; slang is None
+                                           for edittypes without slang support
+
+Returned objects are shared between callers (and threads), so treat them as read-only.
+
+Transcript-level variants of the same lex often have identical components (e.g. c. variants on
+versions .2, .3 and .4 of a transcript); dedup_components() collapses them so that each distinct
+component is searched for only once.
+
+Each memo is an LRU cache bounded by variant_memo_entries entries (see [cache] config section);
+hit and miss counters are kept in METRICS under service "variant_memo".
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+from collections import OrderedDict
+
+from hgvs.sequencevariant import SequenceVariant
+from metavariant import Variant as parse_variant, VariantComponents
+from metavariant.exceptions import RejectedSeqVar
+
+from .lru import LRUCache
+from .config import get_cache_setting
+from .metrics import METRICS
+from .normalize import hgvs_cache_key
+
+log = logging.getLogger('text2gene.variant_memo')
+
+SERVICENAME = 'variant_memo'
+
+# stands in for None (unparseable input) in the Variant memo.
+_UNPARSEABLE = object()
+
+
+class VariantMemo(object):
+    """ Bounded, thread-safe memos of Variant parsing, VariantComponents construction and posedit/slang
+    derivation.  Rejections (RejectedSeqVar, NotImplementedError for slang) are memoized too.
+    """
+
+    def __init__(self, max_entries=100000, ttl=86400):
+        self.memos = dict((kind, LRUCache(max_entries=max_entries, max_bytes=max_entries, ttl=ttl))
+                          for kind in ('variant', 'components', 'posedits'))
+
+    @staticmethod
+    def key(hgvs_text_or_seqvar):
+        return hgvs_cache_key('%s' % hgvs_text_or_seqvar)
+
+    def _get(self, kind, key):
+        value = self.memos[kind].get(key, None)
+        if value is None:
+            METRICS.incr(SERVICENAME, 'misses')
+            METRICS.incr(SERVICENAME, kind + '_misses')
+        else:
+            METRICS.incr(SERVICENAME, 'hits')
+            METRICS.incr(SERVICENAME, kind + '_hits')
+        return value
+
+    def variant(self, hgvs_text_or_seqvar):
+        """ Memoized metavariant.Variant: SequenceVariant objects are returned as-is; strings are parsed
+        in their canonical form (the memo key), so that all inputs sharing a key share the outcome.
+
+        :return: SequenceVariant object, or None if hgvs_text could not be parsed
+        """
+        if isinstance(hgvs_text_or_seqvar, SequenceVariant):
+            return hgvs_text_or_seqvar
+
+        key = self.key(hgvs_text_or_seqvar)
+        seqvar = self._get('variant', key)
+        if seqvar is None:
+            seqvar = parse_variant(key)
+            self.memos['variant'].put(key, _UNPARSEABLE if seqvar is None else seqvar)
+        return None if seqvar is _UNPARSEABLE else seqvar
+
+    def components(self, hgvs_text_or_seqvar):
+        """ Memoized VariantComponents of a variant.
+
+        :return: VariantComponents object
+        :raises: RejectedSeqVar
+        """
+        key = self.key(hgvs_text_or_seqvar)
+        comp = self._get('components', key)
+        if comp is None:
+            try:
+                comp = VariantComponents(self.variant(hgvs_text_or_seqvar))
+            except RejectedSeqVar as error:
+                comp = error
+            self.memos['components'].put(key, comp)
+        if isinstance(comp, RejectedSeqVar):
+            # a fresh exception each time, so the memoized one doesn't collect tracebacks.
+            raise RejectedSeqVar(*comp.args)
+        return comp
+
+    def posedits(self, hgvs_text_or_seqvar):
+        """ Memoized posedit and posedit_slang of a variant's VariantComponents.
+
+        :return: (posedit, slang) -- slang is a list, or None if the edittype isn't supported
+        :raises: RejectedSeqVar
+        """
+        key = self.key(hgvs_text_or_seqvar)
+        result = self._get('posedits', key)
+        if result is None:
+            comp = self.components(hgvs_text_or_seqvar)
+            try:
+                slang = tuple(comp.posedit_slang)
+            except NotImplementedError as error:
+                log.debug(error)
+                slang = None
+            result = (comp.posedit, slang)
+            self.memos['posedits'].put(key, result)
+        posedit, slang = result
+        return posedit, None if slang is None else list(slang)
+
+    def stats(self):
+        """ Returns dictionary of memo kind -> LRUCache.stats(). """
+        return dict((kind, memo.stats()) for kind, memo in self.memos.items())
+
+    def clear(self):
+        for memo in self.memos.values():
+            memo.clear()
+
+
+VARIANT_MEMO = VariantMemo(max_entries=get_cache_setting('variant', 'memo_entries', 100000),
+                           ttl=get_cache_setting('variant', 'memo_ttl', 86400))
+
+Variant = VARIANT_MEMO.variant
+Components = VARIANT_MEMO.components
+PoseditSlang = VARIANT_MEMO.posedits
+
+
+def component_key(comp):
+    """ Returns the (SeqType, EditType, Ref, Pos, Alt) tuple identifying a VariantComponents object. """
+    return (comp.seqtype, comp.edittype, comp.ref, comp.pos, comp.alt)
+
+
+def dedup_components(components):
+    """ Collapses variants with identical components (see component_key) onto the first of them.
+
+    :param components: dictionary of hgvs_text -> VariantComponents object
+    :return: (unique, shared) -- OrderedDict of hgvs_text -> VariantComponents holding one variant per
+             distinct component, and dictionary of each of those hgvs_texts -> list of all hgvs_texts
+             (itself included) sharing its components
+    """
+    unique = OrderedDict()
+    shared = {}
+    first_by_key = {}
+    for hgvs_text, comp in components.items():
+        first = first_by_key.setdefault(component_key(comp), hgvs_text)
+        if first == hgvs_text:
+            unique[hgvs_text] = comp
+            shared[hgvs_text] = []
+        shared[first].append(hgvs_text)
+    return unique, shared
+
+
+def dedup_ratio(total, unique):
+    """ Returns the fraction of searches saved by searching unique instead of total variants. """
+    return 1.0 - float(unique) / total if total else 0.0
@@ -0,0 +1,349 @@
+""" Cache warming: runs HGVS strings through the text2gene lookup stages in batches, so that later
+requests for them are served from cache (see sbin/warm_cache.py).
+
+Stages, in pipeline order:
+
+    lvg         VariantLVG objects (hgvslvg cache), computed in LVG_many's process pool
+    clinvar     ClinvarHgvs2Pmid
+    pubtator    PubtatorHgvs2Pmid
+    google      GoogleQuery (billed API calls: rate-limit it)
+    pubmed      metapub PubMedArticle of every PMID found by the clinvar/pubtator/google stages
+    findit      metapub FindIt of every PMID found
+
+The lvg stage always runs (the other variant stages need its LVG objects).  Each stage has its
+own concurrency (threads; worker processes for lvg) and optional rate limit (calls per second).
+Entries already cached are skipped unless a later stage needs their results, in which case they
+are read from cache without counting against the stage's concurrency or rate limit.
+
+Progress is checkpointed after every batch, so that an interrupted run resumes after the last
+completed batch.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import simplejson as json
+
+from .lvg_cached import LVG
+from .cached import ClinvarHgvs2Pmid, PubtatorHgvs2Pmid
+from .googlequery import GoogleQuery, GoogleCSEngine, googlecse2pmid, ALL_SEQTYPES
+from .normalize import normalize_hgvs
+from .exceptions import Text2GeneError, InvalidHgvsInput
+
+log = logging.getLogger('text2gene.warmer')
+
+VARIANT_STAGES = ('clinvar', 'pubtator', 'google')
+PMID_STAGES = ('pubmed', 'findit')
+STAGES = ('lvg',) + VARIANT_STAGES + PMID_STAGES
+
+DEFAULT_CONCURRENCY = {'lvg': 4, 'clinvar': 4, 'pubtator': 4, 'google': 1, 'pubmed': 2, 'findit': 2}
+
+
+def format_duration(seconds):
+    """ Returns seconds as "[<days>d ]HH:MM:SS" (e.g. "2d 03:15:00"). """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    hms = '%02i:%02i:%02i' % (hours, minutes, seconds)
+    return '%id %s' % (days, hms) if days else hms
+
+
+class RateLimiter(object):
+    """ Spaces out calls (from any number of threads) to at most `rate` per second; rate 0 means no limit. """
+
+    def __init__(self, rate=0):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StageStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.done = 0
+        self.cached = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def add(self, done=0, cached=0, errors=0, seconds=0.0):
+        with self._lock:
+            self.done += done
+            self.cached += cached
+            self.errors += errors
+            self.seconds += seconds
+
+    def to_dict(self):
+        return {'done': self.done, 'cached': self.cached, 'errors': self.errors, 'seconds': round(self.seconds, 3)}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.add(data.get('done', 0), data.get('cached', 0), data.get('errors', 0), data.get('seconds', 0.0))
+        return stats
+
+
+def _variant_stage_query(stage):
+    """ Returns (query function, cache instance, querydict function, pmids function) for a variant stage. """
+    if stage == 'clinvar':
+        return ClinvarHgvs2Pmid, ClinvarHgvs2Pmid.__self__, lambda lex: lex, list
+    if stage == 'pubtator':
+        return PubtatorHgvs2Pmid, PubtatorHgvs2Pmid.__self__, lambda lex: lex, list
+    if stage == 'google':
+        # (must match the query string GoogleQuery builds with its default arguments.)
+        return (GoogleQuery, GoogleQuery.__self__, lambda lex: GoogleCSEngine(lex).build_query(ALL_SEQTYPES),
+                googlecse2pmid)
+    raise Text2GeneError('Unknown variant stage %s' % stage)
+
+
+def _pmid_stage_function(stage):
+    from metapub import PubMedFetcher, FindIt
+    if stage == 'pubmed':
+        fetch = PubMedFetcher()
+        return fetch.article_by_pmid
+    if stage == 'findit':
+        return lambda pmid: FindIt(pmid, verify=False)
+    raise Text2GeneError('Unknown PMID stage %s' % stage)
+
+
+class CacheWarmer(object):
+    """ Runs inputs through the chosen stages (see module docstring).
+
+    Usage:
+        warmer = CacheWarmer(['lvg', 'clinvar', 'pubtator'], checkpoint_path='brca.checkpoint')
+        warmer.run(hgvs_texts, source='data/samples_BRCAx.tsv', progress=print)
+    """
+
+    def __init__(self, stages=STAGES, concurrency=None, rates=None, batch_size=100, checkpoint_path=None,
+                 skip_cached=True):
+        """
+        :param stages: list of stage names (lvg is implied)
+        :param concurrency: dictionary of stage -> number of threads (worker processes for lvg)
+        :param rates: dictionary of stage -> maximum calls per second (0 or absent: unlimited)
+        :param batch_size: (int) inputs per batch (and per checkpoint) [default: 100]
+        :param checkpoint_path: (str) file to record progress in, or None
+        :param skip_cached: (bool) False recomputes entries even if cached [default: True]
+        """
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise Text2GeneError('Unknown warming stage(s): %s' % ', '.join(sorted(unknown)))
+        self.stages = [stage for stage in STAGES if stage in stages or stage == 'lvg']
+        if set(self.stages) & set(PMID_STAGES) and not set(self.stages) & set(VARIANT_STAGES):
+            raise Text2GeneError('The pubmed and findit stages need one of: %s' % ', '.join(VARIANT_STAGES))
+
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.limiters = dict((stage, RateLimiter((rates or {}).get(stage, 0))) for stage in STAGES)
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.skip_cached = skip_cached
+
+        self.stats = OrderedDict((stage, StageStats()) for stage in self.stages)
+        self.rejected = 0
+        self.position = 0
+        self.total = None
+        self._started = None
+        self._start_position = 0
+        self._pools = {}
+
+    # --- checkpointing ---
+
+    def load_checkpoint(self, source):
+        """ Returns the number of inputs already processed for source according to the checkpoint file
+        (restoring the statistics recorded with it), or 0.
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as fh:
+            checkpoint = json.load(fh)
+        if checkpoint.get('source') != source or checkpoint.get('stages') != self.stages:
+            log.warning('Checkpoint %s is for %s (stages %s); starting over', self.checkpoint_path,
+                        checkpoint.get('source'), ','.join(checkpoint.get('stages', [])))
+            return 0
+        for stage, data in checkpoint.get('stats', {}).items():
+            if stage in self.stats:
+                self.stats[stage] = StageStats.from_dict(data)
+        self.rejected = checkpoint.get('rejected', 0)
+        return checkpoint['position']
+
+    def save_checkpoint(self, source):
+        if not self.checkpoint_path:
+            return
+        checkpoint = {'source': source, 'stages': self.stages, 'position': self.position,
+                      'rejected': self.rejected, 'updated': time.time(),
+                      'stats': dict((stage, stats.to_dict()) for stage, stats in self.stats.items())}
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(checkpoint, fh)
+        os.rename(tmp_path, self.checkpoint_path)
+
+    # --- stages ---
+
+    def _pool(self, stage):
+        if stage not in self._pools:
+            self._pools[stage] = ThreadPool(max(1, self.concurrency[stage]))
+        return self._pools[stage]
+
+    def _warm_lvg(self, hgvs_texts):
+        """ Returns dictionary of hgvs_text -> LVG object for the batch. """
+        cache = LVG.__self__
+        start = time.time()
+        found = cache.contains_many(hgvs_texts, cache.VERSION) if self.skip_cached else set()
+
+        # with a rate limit, the entries to compute go to query_many a few (concurrency) at a time,
+        # each one waiting for the limiter; cached entries are read in one go.
+        limiter = self.limiters['lvg']
+        if limiter.interval:
+            step = max(1, self.concurrency['lvg'])
+            todo = [hgvs_text for hgvs_text in hgvs_texts if cache.get_cache_key(hgvs_text) not in found]
+            chunks = [(False, [hgvs_text for hgvs_text in hgvs_texts if cache.get_cache_key(hgvs_text) in found])]
+            chunks.extend((True, todo[idx:idx + step]) for idx in range(0, len(todo), step))
+        else:
+            chunks = [(False, hgvs_texts)]
+
+        lexes = {}
+        errors = 0
+        for limited, chunk in chunks:
+            if not chunk:
+                continue
+            if limited:
+                for _ in chunk:
+                    limiter.wait()
+            for result in cache.query_many(chunk, workers=self.concurrency['lvg'], skip_cache=not self.skip_cached):
+                if result.error is None:
+                    lexes[result.hgvs_text] = result.lex
+                else:
+                    errors += 1
+                    log.info('[%s] lvg: %r', result.hgvs_text, result.error)
+        self.stats['lvg'].add(done=len(hgvs_texts), cached=len(found), errors=errors, seconds=time.time() - start)
+        return lexes
+
+    def _warm_variant(self, stage, lex, need_pmids):
+        """ Runs lex through a variant stage; returns the PMIDs it found (if need_pmids) or None. """
+        query, cache, querydict, pmids_of = _variant_stage_query(stage)
+        start = time.time()
+        try:
+            cached = self.skip_cached and cache.contains(querydict(lex), cache.VERSION)
+            if cached and not need_pmids:
+                self.stats[stage].add(done=1, cached=1)
+                return None
+            if not cached:
+                self.limiters[stage].wait()
+            result = query(lex, skip_cache=not self.skip_cached)
+            self.stats[stage].add(done=1, cached=int(cached), seconds=time.time() - start)
+            return pmids_of(result) if need_pmids else None
+        except Exception as error:
+            self.stats[stage].add(done=1, errors=1, seconds=time.time() - start)
+            log.info('[%s] %s: %r', lex.hgvs_text, stage, error)
+            return None
+
+    def _warm_pmid(self, stage, func, pmid):
+        start = time.time()
+        try:
+            self.limiters[stage].wait()
+            func(pmid)
+            self.stats[stage].add(done=1, seconds=time.time() - start)
+        except Exception as error:
+            self.stats[stage].add(done=1, errors=1, seconds=time.time() - start)
+            log.info('[PMID %s] %s: %r', pmid, stage, error)
+
+    def warm_batch(self, hgvs_texts):
+        """ Runs one batch of (canonical) hgvs strings through all stages. """
+        lexes = self._warm_lvg(hgvs_texts)
+
+        pmid_stages = [stage for stage in self.stages if stage in PMID_STAGES]
+        pending = []
+        for stage in self.stages:
+            if stage in VARIANT_STAGES:
+                pool = self._pool(stage)
+                pending.extend(pool.apply_async(self._warm_variant, (stage, lex, bool(pmid_stages)))
+                               for lex in lexes.values())
+
+        pmids = set()
+        for result in pending:
+            pmids.update(result.get() or [])
+
+        pending = []
+        for stage in pmid_stages:
+            func = _pmid_stage_function(stage)
+            pool = self._pool(stage)
+            pending.extend(pool.apply_async(self._warm_pmid, (stage, func, pmid)) for pmid in pmids)
+        for result in pending:
+            result.get()
+
+    # --- driver ---
+
+    def run(self, inputs, source=None, progress=None):
+        """ Warms the cache for inputs (iterable of hgvs strings), resuming from the checkpoint if it
+        was recorded for the same source.
+
+        :param inputs: iterable of hgvs strings (any form accepted by normalize_hgvs)
+        :param source: (str) description of the input (e.g. file path or SQL), recorded in the checkpoint
+        :param progress: function called with a report string after every batch [default: log.info]
+        :return: dictionary of statistics (see summary)
+        """
+        progress = progress or log.info
+        inputs = list(inputs)
+        self.total = len(inputs)
+        self.position = self._start_position = self.load_checkpoint(source)
+        if self.position:
+            progress('Resuming after %i of %i inputs (checkpoint %s)' % (self.position, self.total,
+                                                                          self.checkpoint_path))
+        self._started = time.time()
+
+        try:
+            while self.position < self.total:
+                batch = inputs[self.position:self.position + self.batch_size]
+                canonical = []
+                for hgvs_text in batch:
+                    try:
+                        canonical.append(normalize_hgvs(hgvs_text))
+                    except InvalidHgvsInput:
+                        self.rejected += 1
+                if canonical:
+                    self.warm_batch(canonical)
+                self.position += len(batch)
+                self.save_checkpoint(source)
+                progress(self.report())
+        finally:
+            for pool in self._pools.values():
+                pool.terminate()
+            self._pools = {}
+
+        return self.summary()
+
+    def summary(self):
+        elapsed = time.time() - self._started if self._started else 0.0
+        return {'position': self.position, 'total': self.total, 'rejected': self.rejected,
+                'elapsed': round(elapsed, 1),
+                'stages': dict((stage, stats.to_dict()) for stage, stats in self.stats.items())}
+
+    def report(self):
+        """ Returns one-line progress report: inputs done, throughput, ETA, and per-stage counts. """
+        elapsed = max(time.time() - self._started, 0.001)
+        rate = (self.position - self._start_position) / elapsed
+        remaining = (self.total - self.position) / rate if rate else None
+        eta = '--:--:--' if remaining is None else format_duration(remaining)
+
+        parts = ['%i/%i inputs (%.1f%%), %.1f/s, ETA %s' % (self.position, self.total,
+                 100.0 * self.position / self.total if self.total else 100.0, rate, eta)]
+        if self.rejected:
+            parts.append('%i rejected' % self.rejected)
+        for stage, stats in self.stats.items():
+            parts.append('%s %i (%i cached, %i errors)' % (stage, stats.done, stats.cached, stats.errors))
+        return ' | '.join(parts)
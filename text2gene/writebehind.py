@@ -0,0 +1,197 @@
+""" Write-behind queue for cache stores and granular-table inserts.
+
+For cache services with the "write_behind" setting on, SQLCache.store(), insert_granular() and
+replace_granular() put their writes on a bounded in-process queue instead of committing them inside
+the request; a background thread writes them out in batched transactions every flush_interval seconds
+(or as soon as batch_size writes are waiting).
+
+When the queue is full, writers block for up to block_timeout seconds (back-pressure); writes that
+still don't fit are dropped and counted.  Pending writes are flushed when the process exits
+(atexit, which covers gunicorn worker exits), or on demand via flush().
+
+Counters (service "write_behind" in text2gene.metrics.METRICS): queued, written, dropped, failed, blocked.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque, OrderedDict
+
+from .config import get_cache_setting
+from .metrics import METRICS
+
+log = logging.getLogger('text2gene.writebehind')
+
+METRICS_SERVICE = 'write_behind'
+
+
+class WriteBehindQueue(object):
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, block_timeout=5.0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+
+        self._cond = threading.Condition()
+        self._items = deque()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def put_row(self, cache, row):
+        """ Queues a cache row (as made by SQLCache.make_row) to be stored in cache's table.
+
+        :return: True if queued, False if dropped
+        """
+        return self._put(('row', cache, row))
+
+    def put_insert(self, db, tablename, entries):
+        """ Queues entries (list of field-value dicts) to be inserted into tablename via db.batch_insert.
+
+        :return: True if queued, False if dropped
+        """
+        return self._put(('insert', db, (tablename, entries)))
+
+    def put_replace(self, db, tablename, key_column, key, entries):
+        """ Queues the replacement of the rows of tablename whose key_column is key by entries (list of
+        field-value dicts), to be done as one unit via db.replace_rows.  Of several replacements of the
+        same key waiting in the queue, only the last one is written.
+
+        :return: True if queued, False if dropped
+        """
+        return self._put(('replace', db, (tablename, key_column, key, entries)))
+
+    def _put(self, item):
+        self.ensure_running()
+        with self._cond:
+            if len(self._items) >= self.max_size:
+                METRICS.incr(METRICS_SERVICE, 'blocked')
+                deadline = time.time() + self.block_timeout
+                while len(self._items) >= self.max_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        METRICS.incr(METRICS_SERVICE, 'dropped')
+                        log.warning('Write-behind queue full (%i); dropping write to %s', self.max_size,
+                                    item[1].tablename if item[0] == 'row' else item[2][0])
+                        return False
+                    self._cond.wait(remaining)
+
+            self._items.append(item)
+            METRICS.incr(METRICS_SERVICE, 'queued')
+            if len(self._items) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _drain(self, limit):
+        with self._cond:
+            batch = []
+            while self._items and len(batch) < limit:
+                batch.append(self._items.popleft())
+            # wake up writers waiting for room.
+            self._cond.notify_all()
+        return batch
+
+    def _write(self, batch):
+        """ Writes a batch: one transaction per cache table, one batch_insert per granular table (and set of
+        fields), one replace_rows transaction per granular table for replacements.
+        """
+        rows = OrderedDict()        # id(cache) -> (cache, rows)
+        inserts = OrderedDict()     # (id(db), tablename, fields) -> (db, tablename, entries)
+        replaces = OrderedDict()    # (id(db), tablename, key_column) -> (db, tablename, key_column, {key: entries})
+        for kind, target, payload in batch:
+            if kind == 'row':
+                rows.setdefault(id(target), (target, []))[1].append(payload)
+            elif kind == 'insert':
+                tablename, entries = payload
+                fields = tuple(sorted(entries[0].keys()))
+                inserts.setdefault((id(target), tablename, fields), (target, tablename, []))[2].extend(entries)
+            else:
+                tablename, key_column, key, entries = payload
+                by_key = replaces.setdefault((id(target), tablename, key_column),
+                                             (target, tablename, key_column, OrderedDict()))[3]
+                # the latest replacement of a key supersedes the ones queued before it.
+                by_key.pop(key, None)
+                by_key[key] = entries
+
+        for cache, cache_rows in rows.values():
+            try:
+                cache.backend.store_rows(cache_rows, True, cache.STORE_CHUNK_SIZE)
+                METRICS.incr(METRICS_SERVICE, 'written', len(cache_rows))
+            except Exception as error:
+                METRICS.incr(METRICS_SERVICE, 'failed', len(cache_rows))
+                log.error('Write-behind store of %i entries in %s failed: %r', len(cache_rows), cache.tablename, error)
+
+        for db, tablename, entries in inserts.values():
+            try:
+                db.batch_insert(tablename, entries)
+                METRICS.incr(METRICS_SERVICE, 'written', len(entries))
+            except Exception as error:
+                METRICS.incr(METRICS_SERVICE, 'failed', len(entries))
+                log.error('Write-behind insert of %i rows into %s failed: %r', len(entries), tablename, error)
+
+        for db, tablename, key_column, by_key in replaces.values():
+            count = sum(len(entries) for entries in by_key.values())
+            try:
+                db.replace_rows(tablename, key_column, by_key)
+                METRICS.incr(METRICS_SERVICE, 'written', count)
+            except Exception as error:
+                METRICS.incr(METRICS_SERVICE, 'failed', count)
+                log.error('Write-behind replacement of %i rows (%i keys) in %s failed: %r', count, len(by_key),
+                          tablename, error)
+
+    def flush(self):
+        """ Writes out everything queued so far (from the calling thread). """
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return
+                self._write(batch)
+
+    def ensure_running(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # writes queued by the parent process are the parent's to flush.
+                self._items = deque()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='text2gene-write-behind')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._items) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as error:
+                log.error('Write-behind flush failed: %r', error)
+
+    def __len__(self):
+        return len(self._items)
+
+
+WRITE_BEHIND = WriteBehindQueue(max_size=get_cache_setting('write_behind', 'queue_size', 10000),
+                                batch_size=get_cache_setting('write_behind', 'batch_size', 500),
+                                flush_interval=get_cache_setting('write_behind', 'flush_interval', 1.0),
+                                block_timeout=get_cache_setting('write_behind', 'block_timeout', 5.0))
+
+
+def flush_write_behind():
+    """ Flushes pending write-behind writes; registered with atexit, and usable from e.g. a gunicorn
+    worker_exit hook.
+    """
+    if os.getpid() == WRITE_BEHIND._pid:
+        WRITE_BEHIND.flush()
+
+atexit.register(flush_write_behind)